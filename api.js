@@ -132,6 +132,17 @@ class ApiService {
         });
     }
 
+    async createVideoBatch(videos) {
+        return await this.makeRequest('/api/video/batch', {
+            method: 'POST',
+            body: JSON.stringify({ videos })
+        });
+    }
+
+    async getVideoBatch(batchId) {
+        return await this.makeRequest(`/api/video/batch/${batchId}`);
+    }
+
     async getVideos() {
         return await this.makeRequest('/api/video/list');
     }
@@ -153,6 +164,12 @@ class ApiService {
         });
     }
 
+    async cancelVideo(videoId) {
+        return await this.makeRequest(`/api/video/${videoId}/cancel`, {
+            method: 'POST'
+        });
+    }
+
     async downloadVideo(videoId) {
         return await this.makeRequest(`/api/video/${videoId}/download`);
     }
@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings
-from typing import Optional, List
+from typing import Optional, List, Dict
 import os
 import secrets
 
@@ -39,6 +39,104 @@ class Settings(BaseSettings):
     SUPPORTED_VIDEO_FORMATS: List[str] = ["mp4", "avi", "mov", "mkv"]
     SUPPORTED_AUDIO_FORMATS: List[str] = ["mp3", "wav", "m4a"]
     
+    # ffmpeg
+    FFMPEG_PATH: Optional[str] = None  # probed on PATH and common install dirs when unset
+    FFPROBE_PATH: Optional[str] = None  # defaults to the ffprobe next to ffmpeg
+    FFMPEG_TIMEOUT_SECONDS: int = 120
+    
+    # Rendering and streaming
+    RENDER_STREAMING: bool = True  # write hls segments to /generated/{id}/ while rendering
+    HLS_SEGMENT_SECONDS: int = 2
+    RENDER_PROGRESS_INTERVAL_SECONDS: float = 0.5  # at most one progress write per job per interval
+    
+    # Output renditions
+    RENDITION_LADDER: List[str] = ["360p", "720p", "1080p"]  # rendered in one ffmpeg run, capped per user
+    TIER_RESOLUTION_LIMITS: Dict[str, str] = {"free": "360p", "pro": "1080p", "enterprise": "4K"}  # without a subscription limit
+    
+    # Pre-encoded background loops
+    BACKGROUND_LIBRARY: bool = True  # stream-copy pre-encoded background loops instead of encoding video
+    BACKGROUND_LIBRARY_DIR: Optional[str] = None  # defaults to <render cache>/backgrounds
+    BACKGROUND_FPS: int = 25
+    BACKGROUND_LOOP_SECONDS: int = 10  # rounded up to whole hls segments
+    
+    # Preview images
+    RENDER_PREVIEWS: bool = True  # poster frame and scrub sprite from the same encode
+    SPRITE_INTERVAL_SECONDS: float = 2.0  # one sprite tile per interval, widened for long videos
+    SPRITE_TILE_WIDTH: int = 160
+    SPRITE_COLUMNS: int = 10
+    SPRITE_MAX_TILES: int = 100
+    
+    # Avatar animation
+    AVATAR_ANIMATION: bool = True  # animate Avatar.image_path from the speech (needs numpy and pillow)
+    AVATAR_FPS: int = 25
+    AVATAR_MOUTH_LEVELS: int = 16  # mouth poses warped up front; every frame uses the nearest one
+    AVATAR_BATCH_FRAMES: int = 8  # frames assembled per write to ffmpeg's stdin
+    AVATAR_CACHE_DIR: Optional[str] = None  # pre-scaled, face-cropped frames; defaults to <render cache>/avatars
+    AVATAR_IDLE_LOOP_TIERS: List[str] = ["free"]  # tiers whose avatars play their pre-encoded idle clip (Avatar.video_path)
+    AVATAR_IDLE_LOOP_SECONDS: int = 4  # idle loop length, played forward then back; rounded up to whole hls segments
+    
+    # Render worker pool
+    RENDER_WORKERS: int = max(1, (os.cpu_count() or 2) // 2)  # concurrent render slots per node
+    RENDER_PREWARM: bool = True  # import gtts in each worker at startup
+    
+    # Render job queue (stored in the main database)
+    RENDER_QUEUE_LEASE_SECONDS: int = 60  # lease length, renewed by worker heartbeats
+    RENDER_QUEUE_MAX_ATTEMPTS: int = 3
+    RENDER_QUEUE_BACKOFF_SECONDS: int = 10  # doubled after every failed attempt
+    RENDER_QUEUE_POLL_SECONDS: float = 1.0
+    RENDER_QUEUE_EMBEDDED_WORKER: bool = True  # run a render worker inside the api process
+    
+    # Content-addressed render cache
+    RENDER_CACHE_DIR: Optional[str] = None  # defaults to <VIDEO_OUTPUT_DIR>_cache
+    RENDER_CACHE_MAX_BYTES: int = 2 * 1024 * 1024 * 1024  # 2GB, least recently used evicted first
+    
+    # Storage lifecycle (background sweeper)
+    STORAGE_SWEEP_INTERVAL_SECONDS: int = 300
+    STORAGE_INTERMEDIATE_TTL_HOURS: int = 1  # tts audio and scratch renders older than this are removed
+    STORAGE_NODE_BUDGET_BYTES: int = 20 * 1024 * 1024 * 1024  # output + cache dirs; cold cache entries evicted above it
+    TIER_STORAGE_LIMITS_MB: Dict[str, int] = {"free": 1024, "pro": 51200, "enterprise": -1}  # without a subscription limit, -1 for unlimited
+    
+    # Text-to-speech chunking and backends
+    TTS_CHUNK_TARGET_CHARS: int = 300  # scripts are split at sentence boundaries up to this size
+    TTS_MAX_CONCURRENCY_GTTS: int = 4  # concurrent requests per backend, per process
+    TTS_MAX_CONCURRENCY_ELEVENLABS: int = 2
+    TTS_MAX_CONCURRENCY_OPENAI: int = 4
+    TTS_MAX_CONCURRENCY_SYNTHETIC: int = 8
+    TTS_RENDER_BACKEND: str = "gtts"  # speech of rendered videos without a configured provider; "synthetic" needs no network
+    SYNTHETIC_TTS_SYLLABLES_PER_SECOND: float = 4.0  # the synthetic engine's speaking rate, about 150 words a minute
+    
+    # Text-to-speech provider http
+    ELEVENLABS_API_URL: str = "https://api.elevenlabs.io"
+    OPENAI_API_URL: str = "https://api.openai.com"
+    TTS_HTTP_CONNECT_TIMEOUT_SECONDS: float = 5.0
+    TTS_HTTP_TIMEOUT_SECONDS: float = 60.0  # read, write and waiting for a pooled connection
+    TTS_HTTP_KEEPALIVE_SECONDS: float = 30.0  # idle provider connections are kept open this long
+    TTS_STREAM_BLOCK_BYTES: int = 64 * 1024  # provider audio is streamed to disk in blocks this size
+    
+    # Text-to-speech failover
+    TTS_PROVIDER_ORDER: List[str] = ["elevenlabs", "openai"]  # failover order of tts backends; those without an api key are skipped
+    TTS_PROVIDER_TIMEOUT_SECONDS: float = 90.0  # a whole chunk request, after which the next provider is tried
+    TTS_BREAKER_ERROR_RATE: float = 0.5  # over the recent requests, opens the provider's circuit breaker
+    TTS_BREAKER_MIN_REQUESTS: int = 10  # before the error rate counts
+    TTS_BREAKER_TIMEOUTS: int = 3  # timeouts in a row that open the breaker
+    TTS_BREAKER_COOLDOWN_SECONDS: float = 30.0  # an open breaker lets a probe request through after this
+    TTS_HEDGE_REQUESTS: bool = False  # ask the next provider too once a request outlasts the provider's p95
+    TTS_HEDGE_MIN_SAMPLES: int = 20  # latencies recorded before a provider's p95 is trusted
+    OPENAI_DEFAULT_VOICE: str = "alloy"  # used when failing over with a voice openai doesn't have
+    
+    # Text-to-speech segment cache
+    TTS_SEGMENT_DIR: Optional[str] = None  # synthesized chunks, defaults to <RENDER_CACHE_DIR>/tts_segments
+    TTS_SEGMENT_TTL_HOURS: int = 168  # chunks not reused within this long are removed by the storage sweeper
+    TTS_CACHE_MAX_BYTES: int = 2 * 1024 * 1024 * 1024  # least recently used chunks are evicted past this
+    
+    # Voice catalog
+    VOICE_CATALOG_TTL_SECONDS: int = 3600  # older catalogs are served while a background refresh runs
+    VOICE_CATALOG_RETRY_SECONDS: int = 60  # wait after a failed refresh
+    VOICE_CATALOG_SNAPSHOT: Optional[str] = None  # defaults to <render cache>/voice_catalog.json
+    
+    # Batch creation
+    BATCH_MAX_VIDEOS: int = 50
+    
     # Rate limiting
     RATE_LIMIT_PER_MINUTE: int = 10
     RATE_LIMIT_PER_HOUR: int = 100
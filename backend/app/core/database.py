@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from app.core.config import settings
@@ -28,6 +28,9 @@ else:
         echo=False
     )
 
+# databases with partial (filtered) indexes; the others skip them
+PARTIAL_INDEX_DIALECTS = ("sqlite", "postgresql")
+
 # create session factory
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
@@ -40,4 +43,43 @@ def get_db():
     try:
         yield db
     finally:
-        db.close() 
\ No newline at end of file
+        db.close() 
+
+def sync_schema():
+    """add columns and indexes introduced after a table was first created
+    
+    create_all only creates missing tables, so existing databases would otherwise
+    miss new nullable columns and the non-unique (or partial unique) indexes declared on them;
+    anything more involved belongs in an alembic migration
+    """
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing or not column.nullable:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+                print(f"added column {table.name}.{column.name}")
+            existing_indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name in existing_indexes or (index.unique and not _partial(index)):
+                    continue
+                if _partial(index) and engine.dialect.name not in PARTIAL_INDEX_DIALECTS:
+                    continue
+                try:
+                    # checkfirst issues the create only if the index is still missing;
+                    # the savepoint keeps a failed create from aborting the other changes
+                    with connection.begin_nested():
+                        index.create(connection, checkfirst=True)
+                    print(f"added index {index.name}")
+                except Exception as e:
+                    # e.g. a partial unique index over rows that already break it
+                    print(f"could not add index {index.name}: {str(e)}")
+
+def _partial(index) -> bool:
+    """whether an index only covers the rows matching its where clause"""
+    return any(index.dialect_options[dialect]["where"] is not None for dialect in PARTIAL_INDEX_DIALECTS)
@@ -2,6 +2,7 @@ from .user import User
 from .video import Video
 from .avatar import Avatar
 from .subscription import Subscription
+from .render_job import RenderJob
 from app.core.database import Base
 
-__all__ = ["Base", "User", "Video", "Avatar", "Subscription"] 
\ No newline at end of file
+__all__ = ["Base", "User", "Video", "Avatar", "Subscription", "RenderJob"] 
\ No newline at end of file
@@ -0,0 +1,47 @@
+from sqlalchemy import Column, Integer, String, DateTime, Text, Float, ForeignKey, Index, text
+from sqlalchemy.sql import func
+from sqlalchemy.orm import relationship
+from app.core.database import Base, PARTIAL_INDEX_DIALECTS
+
+class RenderJob(Base):
+    __tablename__ = "render_jobs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    video_id = Column(Integer, ForeignKey("videos.id"), nullable=False, index=True)
+    
+    # Queue state
+    status = Column(String(20), default="queued", index=True)  # queued, leased, completed, failed, cancelled
+    attempts = Column(Integer, default=0)
+    max_attempts = Column(Integer, default=3)
+    next_run_at = Column(DateTime, index=True)  # earliest time the job may be leased (utc)
+    last_error = Column(Text)
+    
+    # Lease held by a worker
+    lease_owner = Column(String(200))  # worker id, e.g. "host:pid:suffix"
+    lease_expires_at = Column(DateTime, index=True)
+    heartbeat_at = Column(DateTime)
+    
+    # Encode performance, compared across workers (lease_owner) and encoder profiles
+    encode_speed = Column(Float)  # media seconds encoded per wall-clock second, as ffmpeg reports it
+    encoder_profile = Column(String(200))
+    
+    # Timestamps
+    created_at = Column(DateTime, default=func.now())
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+    completed_at = Column(DateTime)
+    
+    # Relationships
+    video = relationship("Video")
+    
+    # At most one queued or leased job per video. Partial indexes exist on sqlite and
+    # postgresql only; on mysql the queue locks the video row instead
+    __table_args__ = (
+        Index(
+            "uq_render_jobs_active_video", "video_id", unique=True,
+            sqlite_where=text("status IN ('queued', 'leased')"),
+            postgresql_where=text("status IN ('queued', 'leased')")
+        ).ddl_if(dialect=PARTIAL_INDEX_DIALECTS),
+    )
+    
+    def __repr__(self):
+        return f"<RenderJob(id={self.id}, video_id={self.video_id}, status='{self.status}')>"
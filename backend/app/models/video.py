@@ -16,22 +16,30 @@ class Video(Base):
     avatar_id = Column(Integer, ForeignKey("avatars.id"), nullable=True)  # allow null for simple videos
     voice_id = Column(String(100))
     language = Column(String(10), default="en")
+    batch_id = Column(String(32), index=True)  # set when created through the batch endpoint
     
     # File paths
     input_audio_path = Column(String(500))
     output_video_path = Column(String(500))
     thumbnail_path = Column(String(500))
+    thumbnail_url = Column(String(500))  # poster frame under /generated
+    sprite_url = Column(String(500))  # webvtt index into the seek-preview sprite sheet
+    stream_url = Column(String(500))  # hls playlist, playable while the render is running
     
     # Video metadata
     duration = Column(Float)  # in seconds
     resolution = Column(String(20))  # e.g., "1920x1080"
     file_size = Column(Integer)  # in bytes
+    storage_bytes = Column(Integer)  # everything published for the video, counted against the owner's quota
     format = Column(String(10), default="mp4")
+    renditions = Column(Text)  # json: [{name, resolution, url}], largest first
+    timing_manifest = Column(Text)  # json: per-chunk tts timing (text, start, end)
     
     # Processing status
-    status = Column(String(50), default="pending")  # pending, processing, completed, failed
+    status = Column(String(50), default="pending")  # pending, processing, completed, failed, cancelled
     progress = Column(Float, default=0.0)  # 0.0 to 1.0
     error_message = Column(Text)
+    time_to_first_frame = Column(Float)  # seconds from render start until something was playable
     
     # Timestamps
     created_at = Column(DateTime, default=func.now())
@@ -6,6 +6,7 @@ from app.core.database import get_db
 from app.core.auth import get_current_active_user
 from app.models.user import User
 from app.schemas.user import UserResponse, UserUpdate
+from app.services.storage_manager import storage_manager
 
 router = APIRouter()
 
@@ -61,5 +62,6 @@ async def get_user_stats(
         "total_videos": total_videos,
         "completed_videos": completed_videos,
         "processing_videos": processing_videos,
-        "subscription": subscription_info
+        "subscription": subscription_info,
+        "storage": storage_manager.quota(db, current_user)
     } 
\ No newline at end of file
@@ -1,7 +1,12 @@
-from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks, Request
+from fastapi import APIRouter, Depends, HTTPException, status, Request
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from typing import Dict, FrozenSet, List, Optional
 import os
+import json
+import time
+import uuid
+import shutil
+from collections import OrderedDict
 from sqlalchemy import func
 
 from app.core.database import get_db
@@ -10,16 +15,39 @@ from app.core.security import SecurityUtils, RateLimiter
 from app.models.user import User
 from app.models.video import Video
 from app.models.avatar import Avatar
-from app.schemas.video import VideoCreate, VideoUpdate, VideoResponse, VideoStatus
+from app.models.render_job import RenderJob
+from app.schemas.video import (
+    VideoCreate, VideoUpdate, VideoResponse, VideoStatus, VideoBatchCreate, VideoBatchResponse
+)
 from app.services.video_generator import video_generator
+from app.services.render_pool import render_pool
+from app.services.render_cancellation import RenderCancelled, render_cancellation
+from app.services.job_queue import job_queue
+from app.services.ffmpeg_capabilities import ffmpeg_capabilities
+from app.services.tts_segments import read_timing_manifest, timing_manifest_path, shared_sentences
+from app.services.render_metrics import render_metrics
+from app.services.render_cache import render_cache
+from app.services.file_publisher import publish_file
+from app.services.media_probe import probe_media
+from app.services.storage_manager import storage_manager
+from app.services import render_previews
+from app.services import renditions as rendition_ladder
 from app.services.voice_service import VoiceService
+from app.services.voice_catalog import voice_catalog
 
 router = APIRouter()
 
+# sentences shared by the scripts of recent batches, so each job of a batch
+# doesn't re-read every script in it
+_batch_sentences: "OrderedDict[str, FrozenSet[str]]" = OrderedDict()
+BATCH_SENTENCE_CACHE_SIZE = 64
+
+# fields the rendered video depends on; changing one restarts a pending render
+RENDER_FIELDS = ("script", "language", "voice_id", "avatar_id")
+
 @router.post("/create", response_model=VideoResponse)
 async def create_video(
     video_data: VideoCreate,
-    background_tasks: BackgroundTasks,
     request: Request,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -32,6 +60,8 @@ async def create_video(
             detail="too many video creation requests. please wait."
         )
     
+    _check_storage_quota(db, current_user)
+    
     # verify avatar exists and is active (if avatar_id is provided)
     avatar_id = None
     if video_data.avatar_id:
@@ -42,6 +72,12 @@ async def create_video(
             # avatar not found, but we can still create video without avatar
             print(f"avatar {video_data.avatar_id} not found, creating video without avatar")
     
+    # a dictionary lookup in the cached voice catalog
+    voice_id = video_data.voice_id
+    if voice_id and await voice_catalog.get(voice_id) is None:
+        print(f"voice {voice_id} not found, creating video with the default voice")
+        voice_id = None
+    
     # create video record
     db_video = Video(
         user_id=current_user.id,
@@ -49,7 +85,7 @@ async def create_video(
         description=video_data.description,
         script=video_data.script,
         avatar_id=avatar_id,  # use None if avatar not found
-        voice_id=video_data.voice_id,
+        voice_id=voice_id,  # use None if voice not found
         language=video_data.language,
         status="pending"  # use string value
     )
@@ -58,15 +94,100 @@ async def create_video(
     db.commit()
     db.refresh(db_video)
     
-    # start video generation in background
-    background_tasks.add_task(
-        generate_video_background,
-        video_id=db_video.id,
-        user_id=current_user.id
-    )
+    # queue video generation; the render worker picks it up from the database
+    job_queue.enqueue(db, db_video.id)
     
     return db_video
 
+@router.post("/batch", response_model=VideoBatchResponse)
+async def create_video_batch(
+    batch_data: VideoBatchCreate,
+    request: Request,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """create several videos in one request
+    
+    the rows and their render jobs are written in one transaction; text the scripts
+    have in common is synthesized once and shared by the whole batch
+    """
+    # one batch counts as one creation request
+    if not RateLimiter.check_rate_limit(request, limit=5):
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="too many video creation requests. please wait."
+        )
+    
+    _check_storage_quota(db, current_user)
+    
+    # look up every requested avatar at once; missing ones are dropped as in /create
+    requested_avatars = {item.avatar_id for item in batch_data.videos if item.avatar_id}
+    active_avatars = set()
+    if requested_avatars:
+        active_avatars = {
+            avatar_id for (avatar_id,) in db.query(Avatar.id).filter(
+                Avatar.id.in_(requested_avatars), Avatar.is_active == True
+            ).all()
+        }
+        for avatar_id in requested_avatars - active_avatars:
+            print(f"avatar {avatar_id} not found, creating batch videos without it")
+    
+    # voices are checked against the cached catalog, one dictionary lookup each
+    voices = (await voice_catalog.index()).by_id
+    for voice_id in {item.voice_id for item in batch_data.videos if item.voice_id} - voices.keys():
+        print(f"voice {voice_id} not found, creating batch videos with the default voice")
+    
+    batch_id = uuid.uuid4().hex
+    videos = [
+        Video(
+            user_id=current_user.id,
+            title=item.title,
+            description=item.description,
+            script=item.script,
+            avatar_id=item.avatar_id if item.avatar_id in active_avatars else None,
+            voice_id=item.voice_id if item.voice_id in voices else None,
+            language=item.language,
+            batch_id=batch_id,
+            status="pending"
+        )
+        for item in batch_data.videos
+    ]
+    
+    try:
+        db.add_all(videos)
+        db.flush()  # assigns ids without committing
+        job_queue.enqueue_many(db, [video.id for video in videos])
+    except Exception:
+        db.rollback()
+        raise
+    
+    for video in videos:
+        db.refresh(video)
+    return {"batch_id": batch_id, "videos": videos, "status_counts": {"pending": len(videos)}}
+
+@router.get("/batch/{batch_id}", response_model=VideoBatchResponse)
+async def get_video_batch(
+    batch_id: str,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """get the videos of a batch and how many are in each status"""
+    videos = db.query(Video).filter(
+        Video.batch_id == batch_id,
+        Video.user_id == current_user.id
+    ).order_by(Video.id).all()
+    
+    if not videos:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="batch not found"
+        )
+    
+    status_counts: Dict[str, int] = {}
+    for video in videos:
+        status_counts[video.status] = status_counts.get(video.status, 0) + 1
+    return {"batch_id": batch_id, "videos": videos, "status_counts": status_counts}
+
 @router.get("/list", response_model=List[VideoResponse])
 async def list_videos(
     skip: int = 0,
@@ -91,6 +212,18 @@ async def list_videos(
     videos = query.offset(skip).limit(limit).all()
     return videos
 
+@router.get("/render/capabilities")
+async def get_render_capabilities(
+    refresh: bool = False,
+    current_user: User = Depends(get_current_active_user)
+):
+    """ffmpeg binaries, encoders, muxers and filters detected on this node"""
+    if refresh:
+        profile = await render_pool.run(ffmpeg_capabilities.profile, True)
+    else:
+        profile = ffmpeg_capabilities.profile()
+    return profile.to_dict()
+
 @router.get("/{video_id}", response_model=VideoResponse)
 async def get_video(
     video_id: int,
@@ -126,7 +259,11 @@ async def update_video(
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
-    """update a video (only if not processing)"""
+    """update a video
+    
+    changing what the video renders from while it is queued or rendering cancels that
+    render and queues a new one
+    """
     # validate video_id
     if video_id <= 0:
         raise HTTPException(
@@ -145,18 +282,26 @@ async def update_video(
             detail="video not found"
         )
     
-    if video.status == "processing":
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="cannot update video while processing"
-        )
-    
     # update fields
     update_data = video_update.dict(exclude_unset=True)
+    if update_data.get("voice_id") and await voice_catalog.get(update_data["voice_id"]) is None:
+        print(f"voice {update_data['voice_id']} not found, updating video with the default voice")
+        update_data["voice_id"] = None
+    rerender = video.status in ("pending", "processing") and any(
+        field in RENDER_FIELDS and getattr(video, field) != value for field, value in update_data.items()
+    )
+    if rerender:
+        _cancel_render(db, video.id)
     for field, value in update_data.items():
         setattr(video, field, value)
+    if rerender:
+        video.status = "pending"
+        video.progress = 0.0
+        video.stream_url = None
     
     db.commit()
+    if rerender:
+        job_queue.enqueue(db, video.id)
     db.refresh(video)
     
     return video
@@ -186,6 +331,9 @@ async def delete_video(
             detail="video not found"
         )
     
+    # stop a running render first, so it doesn't write files for a deleted video
+    _cancel_render(db, video.id)
+    
     # delete associated files securely
     if video.output_video_path and os.path.exists(video.output_video_path):
         try:
@@ -199,11 +347,56 @@ async def delete_video(
         except OSError:
             pass  # file might already be deleted
     
+    # hls segments and preview images live in the per-video directory
+    from app.core.config import settings
+    shutil.rmtree(os.path.join(settings.VIDEO_OUTPUT_DIR, str(video.id)), ignore_errors=True)
+    
+    db.query(RenderJob).filter(RenderJob.video_id == video.id).delete(synchronize_session=False)
     db.delete(video)
     db.commit()
     
     return {"message": "video deleted successfully"}
 
+@router.post("/{video_id}/cancel", response_model=VideoResponse)
+async def cancel_video(
+    video_id: int,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """cancel a queued or running render"""
+    # validate video_id
+    if video_id <= 0:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="invalid video id"
+        )
+    
+    video = db.query(Video).filter(
+        Video.id == video_id,
+        Video.user_id == current_user.id
+    ).first()
+    
+    if not video:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="video not found"
+        )
+    
+    if video.status not in ("pending", "processing"):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="video is not being rendered"
+        )
+    
+    _cancel_render(db, video.id)
+    video.status = "cancelled"
+    video.progress = 0.0
+    video.stream_url = None
+    db.commit()
+    db.refresh(video)
+    
+    return video
+
 @router.get("/{video_id}/download")
 async def download_video(
     video_id: int,
@@ -253,88 +446,295 @@ async def download_video(
     
     return {"download_url": f"/generated/{video.id}.mp4"}
 
-async def generate_video_background(video_id: int, user_id: int):
-    """background task for video generation using free services"""
+async def generate_video_background(video_id: int):
+    """render job handler for video generation using free services
+    
+    raises on failure so the render queue can retry the job; the queue marks
+    the video failed once its attempts are exhausted
+    """
     from app.core.database import SessionLocal
     
     db = SessionLocal()
+    cancel = render_cancellation.open(video_id)
     try:
         # get video record
         video = db.query(Video).filter(Video.id == video_id).first()
-        if not video:
+        if not video or video.status == "cancelled":
             return
         
         # update status to processing
         video.status = "processing"  # use string value
         video.progress = 0.1
+        video.error_message = None
         db.commit()
         
         # generate video using free service
         try:
+            from app.core.config import settings
+            render_started = time.monotonic()
+            first_frame = {}
+            
+            stream_dir = None
+            if settings.RENDER_STREAMING:
+                stream_dir = os.path.join(settings.VIDEO_OUTPUT_DIR, str(video.id))
+            
+            encode = {}
+            
+            def on_progress(fraction, speed):
+                # runs on the render thread and is already coalesced by the progress parser
+                if cancel.cancelled:
+                    return
+                if speed:
+                    encode["speed"] = speed
+                _record_progress(video_id, 0.1 + 0.85 * fraction)
+            
+            def on_first_segment():
+                # runs on the render thread, so it uses its own session
+                if cancel.cancelled:
+                    return
+                first_frame["seconds"] = time.monotonic() - render_started
+                _record_first_frame(video_id, first_frame["seconds"], f"/generated/{video_id}/index.m3u8")
+            
+            # every size the user's plan allows comes out of one ffmpeg run
+            ladder = rendition_ladder.ladder_for(rendition_ladder.resolution_limit_for(db, video.user))
+            
+            # template text of a batch is chunked apart from the per-video text so
+            # its audio is synthesized once for the whole batch
+            batch_sentences = _batch_shared_sentences(db, video.batch_id, video.language) if video.batch_id else None
+            
+            # tiers on the idle-loop plan get the avatar's pre-encoded idle clip, which
+            # only costs an audio encode, instead of the per-frame animation
+            idle_video = None
+            if video.avatar and (video.user.subscription_tier or "free") in settings.AVATAR_IDLE_LOOP_TIERS:
+                idle_video = video.avatar.video_path
+            
             # use simple video generation (text overlay + audio)
-            video_path = video_generator.create_simple_video(
+            # tts and ffmpeg block, so run them on the render pool instead of the event loop
+            video_path = await render_pool.run(
+                video_generator.create_simple_video,
                 script=video.script,
-                language=video.language or "en"
+                language=video.language or "en",
+                voice_id=video.voice_id,
+                avatar_id=video.avatar_id,
+                stream_dir=stream_dir,
+                on_first_segment=on_first_segment,
+                renditions=[rendition.name for rendition in ladder],
+                shared_sentences=batch_sentences,
+                on_progress=on_progress,
+                cancel=cancel,
+                avatar_image=video.avatar.image_path if video.avatar else None,
+                avatar_updated_at=video.avatar.updated_at if video.avatar else None,
+                avatar_video=idle_video,
+                on_encoder_profile=lambda profile: encode.update(profile=profile)
             )
+            # cancelled after ffmpeg finished: the render stays cached, nothing is published
+            cancel.raise_if_cancelled()
+            db.refresh(video)  # picks up what the render thread recorded
             
             # check if video was actually created
             if not os.path.exists(video_path):
-                video.status = "failed"
-                video.error_message = "video file was not created"
-                db.commit()
-                return
+                raise Exception("video file was not created")
+            
+            # every field of the finished video is written at once, and only while the
+            # row is still this render's (see the conditional update below)
+            result = {}
+            
+            # keep the tts timing with the video for later stages
+            manifest = read_timing_manifest(video_path)
+            if manifest:
+                result[Video.timing_manifest] = json.dumps(manifest)
+            if render_cache.is_scratch(video_path):
+                timing_manifest_path(video_path).unlink(missing_ok=True)
             
-            # move/copy to generated directory outside backend
+            # publish to the generated directory outside backend
             # use the same directory that's mounted as /generated
-            from app.core.config import settings
             base_dir = settings.VIDEO_OUTPUT_DIR  # Use settings instead of hardcoded
-            os.makedirs(base_dir, exist_ok=True)
             target_path = os.path.join(base_dir, f"{video.id}.mp4")
-            print(f"Copying video from {video_path} to {target_path}")
+            
+            # poster and scrub sprite go next to the stream, so list views never
+            # have to open the video itself
+            cancel.raise_if_cancelled()
             try:
-                import shutil
-                shutil.copyfile(video_path, target_path)
+                previews = render_previews.publish_previews(
+                    video_path, os.path.join(base_dir, str(video.id)), move=render_cache.is_scratch(video_path)
+                )
+            except Exception as e:
+                print(f"error publishing preview images: {str(e)}")
+                previews = {}
+            if "poster" in previews:
+                result[Video.thumbnail_path] = previews["poster"]
+                result[Video.thumbnail_url] = f"/generated/{video.id}/{render_previews.PUBLISHED_NAMES['poster']}"
+            if "sprite_vtt" in previews:
+                result[Video.sprite_url] = f"/generated/{video.id}/{render_previews.PUBLISHED_NAMES['sprite_vtt']}"
+            
+            # smaller renditions sit next to the previews; the largest is the main video
+            rendition_urls = {ladder[-1].name: f"/generated/{video.id}.mp4"}
+            for rendition in ladder[:-1]:
+                rendition_file = rendition_ladder.rendition_path(video_path, rendition.name)
+                if not rendition_file.exists():
+                    continue
+                cancel.raise_if_cancelled()
+                try:
+                    publish_file(
+                        str(rendition_file),
+                        os.path.join(base_dir, str(video.id), f"{rendition.name}.mp4"),
+                        move=render_cache.is_scratch(video_path)
+                    )
+                    rendition_urls[rendition.name] = f"/generated/{video.id}/{rendition.name}.mp4"
+                except Exception as e:
+                    print(f"error publishing {rendition.name} rendition: {str(e)}")
+            cancel.raise_if_cancelled()
+            try:
+                # cached renders stay in the cache and are linked in; scratch output is
+                # renamed. either way /generated never sees a partially written file
+                method = publish_file(video_path, target_path, move=render_cache.is_scratch(video_path))
+                render_metrics.increment(f"publish_{method}")
                 final_path = target_path
-                print(f"Successfully copied video to {final_path}")
+                print(f"published video {video.id} to {final_path} ({method})")
                 print(f"Video should be accessible at: http://127.0.0.1:8000/generated/{video.id}.mp4")
             except Exception as e:
-                print(f"error copying video to generated dir: {str(e)}")
+                print(f"error publishing video to generated dir: {str(e)}")
                 final_path = video_path
             
             # update video record
-            video.output_video_path = final_path
-            video.status = "completed"  # use string value instead of enum
-            video.progress = 1.0
-            video.completed_at = func.now()
+            if "seconds" not in first_frame:
+                # cache hits and non-streaming renders are first playable when complete
+                result[Video.time_to_first_frame] = time.monotonic() - render_started
+                render_metrics.observe("time_to_first_frame", result[Video.time_to_first_frame])
+            result[Video.output_video_path] = final_path
+            result[Video.status] = "completed"  # use string value instead of enum
+            result[Video.progress] = 1.0
+            result[Video.completed_at] = func.now()
             
-            # get video duration and file size
+            # read duration, resolution and container from the file headers
             try:
-                from moviepy.editor import VideoFileClip
-                clip = VideoFileClip(final_path)
-                video.duration = clip.duration
-                video.file_size = os.path.getsize(final_path)
-                clip.close()
+                info = await render_pool.run(probe_media, final_path)
+                result[Video.duration] = info["duration"]
+                result[Video.resolution] = info["resolution"]
+                result[Video.format] = info["format"]
+                result[Video.file_size] = info["file_size"]
+                if info["resolution"]:
+                    # audio-only fallbacks have no renditions to offer
+                    result[Video.renditions] = json.dumps(rendition_ladder.describe(ladder, rendition_urls))
             except Exception as e:
+                # leave the fields empty rather than recording a made-up duration
                 print(f"error getting video metadata: {str(e)}")
-                video.duration = 10.0
-                video.file_size = os.path.getsize(final_path) if os.path.exists(final_path) else 0
+                result[Video.file_size] = os.path.getsize(final_path) if os.path.exists(final_path) else 0
+            result[Video.storage_bytes] = storage_manager.video_bytes(video.id)
+            
+            if "speed" in encode:
+                # cache hits never run ffmpeg and have nothing to report
+                render_metrics.observe("encode_speed", encode["speed"])
+                db.query(RenderJob).filter(
+                    RenderJob.video_id == video.id,
+                    RenderJob.status == "leased"
+                ).update({
+                    RenderJob.encode_speed: encode["speed"],
+                    RenderJob.encoder_profile: encode.get("profile", video_generator.encoder_profile)
+                }, synchronize_session=False)
             
+            # a cancel, delete or edit that landed while publishing has moved the row
+            # out of processing (or removed it); it is theirs then, not ours to complete
+            cancel.raise_if_cancelled()
+            completed = db.query(Video).filter(
+                Video.id == video_id,
+                Video.status == "processing"
+            ).update(result, synchronize_session=False)
+            if not completed:
+                raise RenderCancelled()
             db.commit()
             print(f"video {video_id} generated successfully: {final_path}")
             
+        except RenderCancelled:
+            # the row belongs to whoever cancelled the render (or is gone); only the
+            # files this render streamed or published are ours to clean up
+            db.rollback()
+            render_metrics.increment("renders_cancelled")
+            current = db.query(Video.status).filter(Video.id == video_id).first()
+            if current is None or current.status == "cancelled":
+                from app.core.config import settings
+                shutil.rmtree(os.path.join(settings.VIDEO_OUTPUT_DIR, str(video_id)), ignore_errors=True)
+                try:
+                    os.remove(os.path.join(settings.VIDEO_OUTPUT_DIR, f"{video_id}.mp4"))
+                except OSError:
+                    pass
+            print(f"render of video {video_id} cancelled")
+            raise
         except Exception as e:
             print(f"video generation failed for video {video_id}: {str(e)}")
-            video.status = "failed"
-            video.error_message = str(e)
+            # back to pending until the queue decides between retry and failure
+            db.rollback()
+            db.query(Video).filter(
+                Video.id == video_id,
+                Video.status == "processing"
+            ).update({
+                Video.status: "pending",
+                Video.progress: 0.0,
+                Video.error_message: str(e)
+            }, synchronize_session=False)
             db.commit()
-            
-    except Exception as e:
-        print(f"background task error for video {video_id}: {str(e)}")
-        # update status to failed
+            raise
+    finally:
+        render_cancellation.close(video_id, cancel)
+        db.close()
+
+def _check_storage_quota(db: Session, user: User):
+    """refuse new videos once the user's published videos fill their storage limit"""
+    if storage_manager.quota(db, user)["over_quota"]:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="storage limit reached. delete videos to free space."
+        )
+
+def _cancel_render(db: Session, video_id: int):
+    """cancel the render jobs of a video and stop its render if it runs in this process
+    
+    workers in other processes stop theirs once they see the job was cancelled
+    """
+    job_queue.cancel(db, video_id)
+    render_cancellation.cancel(video_id)
+
+def _batch_shared_sentences(db: Session, batch_id: str, language: Optional[str]) -> FrozenSet[str]:
+    """sentences that occur in more than one script of a batch, per language"""
+    cache_key = f"{batch_id}:{language}"
+    if cache_key in _batch_sentences:
+        _batch_sentences.move_to_end(cache_key)
+        return _batch_sentences[cache_key]
+    
+    scripts = [script for (script,) in db.query(Video.script).filter(
+        Video.batch_id == batch_id,
+        Video.language == language
+    ).all()]
+    sentences = shared_sentences(scripts)
+    _batch_sentences[cache_key] = sentences
+    while len(_batch_sentences) > BATCH_SENTENCE_CACHE_SIZE:
+        _batch_sentences.popitem(last=False)
+    return sentences
+
+def _record_progress(video_id: int, progress: float):
+    """write the render progress of a video with a single update statement"""
+    from app.core.database import SessionLocal
+    
+    db = SessionLocal()
+    try:
+        db.query(Video).filter(Video.id == video_id, Video.status == "processing").update(
+            {Video.progress: round(progress, 3)}, synchronize_session=False
+        )
+        db.commit()
+    finally:
+        db.close()
+
+def _record_first_frame(video_id: int, seconds: float, stream_url: str):
+    """store time-to-first-frame and the live playlist once the first segment exists"""
+    from app.core.database import SessionLocal
+    
+    render_metrics.observe("time_to_first_frame", seconds)
+    db = SessionLocal()
+    try:
         video = db.query(Video).filter(Video.id == video_id).first()
         if video:
-            video.status = "failed"
-            video.error_message = str(e)
+            video.time_to_first_frame = seconds
+            video.stream_url = stream_url
             db.commit()
     finally:
-        db.close() 
\ No newline at end of file
+        db.close()
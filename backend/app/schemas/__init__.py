@@ -1,5 +1,5 @@
 from .user import UserCreate, UserUpdate, UserResponse, UserLogin
-from .video import VideoCreate, VideoUpdate, VideoResponse, VideoStatus
+from .video import VideoCreate, VideoUpdate, VideoResponse, VideoStatus, VideoBatchCreate, VideoBatchResponse
 from .avatar import AvatarCreate, AvatarResponse
 from .auth import Token, TokenData
 
@@ -1,8 +1,10 @@
 from pydantic import BaseModel, validator
-from typing import Optional
+from typing import Optional, List, Dict
+import json
 from datetime import datetime
 from enum import Enum
 
+from app.core.config import settings
 from app.core.security import SecurityUtils
 
 class VideoStatus(str, Enum):
@@ -10,6 +12,7 @@ class VideoStatus(str, Enum):
     PROCESSING = "processing"
     COMPLETED = "completed"
     FAILED = "failed"
+    CANCELLED = "cancelled"
 
 class VideoBase(BaseModel):
     title: str
@@ -67,6 +70,17 @@ class VideoBase(BaseModel):
 class VideoCreate(VideoBase):
     pass
 
+class VideoBatchCreate(BaseModel):
+    videos: List[VideoCreate]
+    
+    @validator('videos')
+    def validate_videos(cls, v):
+        if not v:
+            raise ValueError('batch must contain at least one video')
+        if len(v) > settings.BATCH_MAX_VIDEOS:
+            raise ValueError(f'batch must contain at most {settings.BATCH_MAX_VIDEOS} videos')
+        return v
+
 class VideoUpdate(BaseModel):
     title: Optional[str] = None
     description: Optional[str] = None
@@ -114,10 +128,28 @@ class VideoResponse(VideoBase):
     format: str = "mp4"
     output_video_path: Optional[str] = None
     thumbnail_path: Optional[str] = None
+    thumbnail_url: Optional[str] = None
+    sprite_url: Optional[str] = None
+    renditions: Optional[List[Dict]] = None
+    batch_id: Optional[str] = None
+    stream_url: Optional[str] = None
+    time_to_first_frame: Optional[float] = None
     error_message: Optional[str] = None
     created_at: datetime
     updated_at: datetime
     completed_at: Optional[datetime] = None
     
+    @validator('renditions', pre=True)
+    def parse_renditions(cls, v):
+        # stored as json text on the video row
+        if isinstance(v, str):
+            return json.loads(v)
+        return v
+    
     class Config:
-        from_attributes = True 
\ No newline at end of file
+        from_attributes = True
+
+class VideoBatchResponse(BaseModel):
+    batch_id: str
+    videos: List[VideoResponse]
+    status_counts: Dict[str, int]
\ No newline at end of file
@@ -0,0 +1,161 @@
+import subprocess
+import time
+from typing import BinaryIO, List, Optional
+
+from app.core.config import settings
+from app.services.avatar_assets import AvatarAsset
+from app.services.ffmpeg_capabilities import ffmpeg_capabilities
+from app.services.render_metrics import render_metrics
+
+MOUTH_MAX_STRETCH = 0.6  # vertical stretch of the mouth region when fully open
+MOUTH_MAX_SHADE = 0.75  # darkening at the centre of a fully open mouth
+ENVELOPE_SAMPLE_RATE = 16000
+ANIMATION_VERSION = "mouth1"  # part of the render cache key; bump when the frames change
+
+
+def available() -> bool:
+    """animation is enabled and numpy and pillow can be imported"""
+    if not settings.AVATAR_ANIMATION:
+        return False
+    try:
+        import numpy  # noqa: F401
+        from PIL import Image  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def mouth_envelope(audio_path: str, fps: int):
+    """per-frame mouth openness in [0, 1], from the loudness of the audio
+
+    the audio is decoded once to mono float pcm and the rms of every frame's window
+    is taken from a running sum of squares, so the cost doesn't grow with the fps
+    """
+    import numpy as np
+
+    profile = ffmpeg_capabilities.profile()
+    result = subprocess.run(
+        [profile.ffmpeg_path, '-v', 'error', '-i', str(audio_path),
+         '-ac', '1', '-ar', str(ENVELOPE_SAMPLE_RATE), '-f', 'f32le', 'pipe:1'],
+        capture_output=True,
+        timeout=settings.FFMPEG_TIMEOUT_SECONDS
+    )
+    if result.returncode != 0:
+        raise Exception(f"audio decode failed: {result.stderr.decode('utf-8', 'replace')[-500:]}")
+    samples = np.frombuffer(result.stdout, dtype=np.float32)
+    if samples.size == 0:
+        return np.zeros(0, dtype=np.float32)
+
+    frame_count = int(np.ceil(samples.size * fps / ENVELOPE_SAMPLE_RATE))
+    window = ENVELOPE_SAMPLE_RATE / fps
+    starts = (np.arange(frame_count) * window).astype(np.int64)
+    ends = np.minimum(starts + int(np.ceil(window)), samples.size)
+    energy = np.concatenate(([0.0], np.cumsum(samples.astype(np.float64) ** 2)))
+    rms = np.sqrt((energy[ends] - energy[starts]) / np.maximum(ends - starts, 1))
+
+    # gate out the noise floor and let the loud end of speech open the mouth fully
+    floor, peak = np.percentile(rms, 10), np.percentile(rms, 95)
+    level = np.clip((rms - floor) / max(peak - floor, 1e-6), 0.0, 1.0)
+    # a short smoothing kernel keeps the mouth from flickering between frames
+    level = np.convolve(level, np.array([0.25, 0.5, 0.25]), mode="same")
+    return level.astype(np.float32)
+
+
+class AvatarAnimation:
+    """frames of one avatar asset animated by one audio track, streamed to ffmpeg as raw rgb24
+
+    the asset (see avatar_assets) is the still already cropped and scaled, with its
+    mouth located, and shared read-only with every other render. the mouth region is
+    warped once per openness level up front (all levels in one vectorized pass); a
+    frame is the still with the patch of its level pasted in, so each batch only
+    rewrites the mouth rows of a reused buffer. nothing touches disk
+    """
+
+    def __init__(self, asset: AvatarAsset, audio_path: str, fps: Optional[int] = None):
+        import numpy as np
+
+        self.canvas = asset.frame
+        self.mouth = asset.mouth_box
+        self.height, self.width = self.canvas.shape[:2]
+        self.fps = fps or settings.AVATAR_FPS
+        self.batch_frames = max(1, settings.AVATAR_BATCH_FRAMES)
+        mouth_levels = max(2, settings.AVATAR_MOUTH_LEVELS)
+
+        envelope = mouth_envelope(audio_path, self.fps)
+        self.levels = np.rint(envelope * (mouth_levels - 1)).astype(np.intp)
+        self.patches = self._mouth_patches(mouth_levels)
+        self.frames_written = 0
+        self.fps_per_core: Optional[float] = None
+
+    @property
+    def frame_count(self) -> int:
+        return int(self.levels.size)
+
+    def ffmpeg_input_args(self) -> List[str]:
+        """input arguments that read the frames from ffmpeg's stdin"""
+        return [
+            '-f', 'rawvideo', '-pix_fmt', 'rgb24',
+            '-s', f'{self.width}x{self.height}', '-r', str(self.fps),
+            '-i', 'pipe:0'
+        ]
+
+    def write_frames(self, stdin: BinaryIO):
+        """write every frame to stdin in batches, then close it
+
+        stops quietly when ffmpeg goes away (cancelled, failed or done with -shortest).
+        fps_per_core is frames per cpu second of the calling thread, i.e. the cost of
+        synthesis alone; waiting on a full pipe doesn't count
+        """
+        import numpy as np
+
+        x0, y0, x1, y1 = self.mouth
+        batch = np.broadcast_to(self.canvas, (self.batch_frames,) + self.canvas.shape).copy()
+        written = 0
+        cpu_started = time.thread_time()
+        try:
+            for start in range(0, self.frame_count, self.batch_frames):
+                levels = self.levels[start:start + self.batch_frames]
+                batch[:levels.size, y0:y1, x0:x1] = self.patches[levels]
+                stdin.write(batch[:levels.size].data)
+                written += levels.size
+        except (BrokenPipeError, OSError, ValueError):
+            pass
+        finally:
+            try:
+                stdin.close()
+            except OSError:
+                pass
+            cpu_seconds = time.thread_time() - cpu_started
+            self.frames_written = written
+            if written and cpu_seconds > 0:
+                self.fps_per_core = written / cpu_seconds
+                render_metrics.observe("avatar_fps_per_core", self.fps_per_core)
+
+    def _mouth_patches(self, levels: int):
+        """the mouth region at every openness level, shape (levels, rows, columns, 3)
+
+        opening stretches the rows away from the centre line and shades an ellipse
+        that grows with the opening
+        """
+        import numpy as np
+
+        x0, y0, x1, y1 = self.mouth
+        region = self.canvas[y0:y1, x0:x1].astype(np.float32)
+        rows, columns = region.shape[:2]
+        if rows == 0 or columns == 0:
+            return np.broadcast_to(region.astype(np.uint8), (levels,) + region.shape).copy()
+
+        openness = np.linspace(0.0, 1.0, levels, dtype=np.float32)
+        centre_row, centre_column = (rows - 1) / 2, (columns - 1) / 2
+        row_index = np.arange(rows, dtype=np.float32)
+        scale = 1.0 + MOUTH_MAX_STRETCH * openness
+        source_rows = centre_row + (row_index[None, :] - centre_row) / scale[:, None]
+        source_rows = np.clip(np.rint(source_rows), 0, rows - 1).astype(np.intp)
+        patches = region[source_rows]  # (levels, rows, columns, 3)
+
+        # ellipse half-axes: the width is fixed, the height opens with the mouth
+        dy = (row_index - centre_row)[None, :, None] / np.maximum(openness * rows * 0.3, 1e-3)[:, None, None]
+        dx = (np.arange(columns, dtype=np.float32) - centre_column)[None, None, :] / (columns * 0.35)
+        inside = np.clip(1.0 - (dx ** 2 + dy ** 2), 0.0, 1.0) * openness[:, None, None]
+        patches *= (1.0 - MOUTH_MAX_SHADE * inside)[..., None]
+        return np.clip(patches, 0, 255).astype(np.uint8)
@@ -0,0 +1,342 @@
+import json
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.avatar import Avatar
+from app.services.render_cache import render_cache, stable_digest
+from app.services.renditions import RENDITION_SIZES
+
+# avatar images are referenced relative to the site root (e.g. assets/brad.jpg)
+PROJECT_ROOT = Path(__file__).resolve().parents[3]
+# mouth of a centred portrait when no face is found, as fractions of the fitted image:
+# centre x, centre y, width, height
+DEFAULT_MOUTH_BOX = (0.5, 0.7, 0.24, 0.12)
+# mouth relative to a detected face box, same layout
+FACE_MOUTH_BOX = (0.5, 0.8, 0.42, 0.16)
+# head-and-shoulders framing around a detected face, in face widths / heights
+FACE_CROP_SCALE = (2.4, 2.6)
+ASSET_FORMAT = "asset1"  # bump when the stored frames or boxes change
+
+Box = Tuple[int, int, int, int]  # x0, y0, x1, y1
+
+
+def resolve_file(asset_path: Optional[str]) -> Optional[Path]:
+    """local file behind Avatar.image_path or video_path, stored as a path, a site-relative path or a /static url"""
+    if not asset_path or "://" in asset_path:
+        return None
+    relative = asset_path.lstrip("/")
+    for candidate in (Path(asset_path), Path(relative), PROJECT_ROOT / relative):
+        if candidate.is_file():
+            return candidate
+    return None
+
+
+class AvatarAsset:
+    """an avatar still fitted into one frame size, with its face and mouth located
+
+    frame is a read-only (height, width, 3) uint8 array, memory-mapped from the cache,
+    so every render of the avatar in every process shares the same pages
+    """
+
+    def __init__(self, frame, face_box: Optional[Box], mouth_box: Box, version: str):
+        self.frame = frame
+        self.face_box = face_box
+        self.mouth_box = mouth_box
+        self.version = version
+
+    @property
+    def resolution(self) -> str:
+        return f"{self.frame.shape[1]}x{self.frame.shape[0]}"
+
+
+class AvatarAssetCache:
+    """decoded, face-cropped and pre-scaled avatar frames per rendition size
+
+    an entry is <avatar id>_<version>/<resolution>.npy plus <resolution>.json with the
+    face and mouth boxes. the version covers the image file and Avatar.updated_at, so
+    changing an avatar yields a new entry and the old one is dropped. entries are built
+    when an avatar is saved (see the session hooks below) or on first use
+    """
+
+    def __init__(self, root: Optional[str] = None, memo_size: int = 32):
+        self.root = Path(root or settings.AVATAR_CACHE_DIR or render_cache.root / "avatars")
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.memo_size = memo_size
+        self._lock = threading.Lock()
+        self._build_locks: Dict[str, threading.Lock] = {}
+        self._memo: "OrderedDict[str, AvatarAsset]" = OrderedDict()
+        self.builds = 0
+        self.hits = 0
+
+    @staticmethod
+    def version(image: Path, updated_at: Optional[datetime]) -> str:
+        stat = image.stat()
+        return stable_digest({
+            "image": str(image.resolve()),
+            "size": stat.st_size,
+            "mtime": stat.st_mtime_ns,
+            "updated_at": updated_at.isoformat() if updated_at else None,
+            "format": ASSET_FORMAT
+        })[:16]
+
+    def entry_dir(self, avatar_id: int, version: str) -> Path:
+        return self.root / f"{avatar_id}_{version}"
+
+    def get(self, avatar_id: int, image: Path, updated_at: Optional[datetime], resolution: str) -> AvatarAsset:
+        """the avatar at a frame size, built first if this version isn't cached yet"""
+        version = self.version(image, updated_at)
+        memo_key = f"{avatar_id}_{version}/{resolution}"
+        with self._lock:
+            if memo_key in self._memo:
+                self._memo.move_to_end(memo_key)
+                self.hits += 1
+                return self._memo[memo_key]
+            build_lock = self._build_locks.setdefault(memo_key, threading.Lock())
+
+        with build_lock:
+            asset = self._load(avatar_id, version, resolution)
+            if asset is None:
+                self._build(avatar_id, image, version, [resolution])
+                asset = self._load(avatar_id, version, resolution)
+                if asset is None:
+                    raise Exception(f"avatar {avatar_id} asset for {resolution} could not be built")
+            else:
+                with self._lock:
+                    self.hits += 1
+        with self._lock:
+            self._build_locks.pop(memo_key, None)
+            self._memo[memo_key] = asset
+            while len(self._memo) > self.memo_size:
+                self._memo.popitem(last=False)
+        return asset
+
+    def prebuild(self, avatar_id: int, image_path: Optional[str], updated_at: Optional[datetime]):
+        """build every configured rendition size of an avatar and drop its older versions"""
+        image = resolve_file(image_path)
+        if image is None:
+            print(f"avatar {avatar_id} image {image_path} not found locally, nothing to prebuild")
+            return
+        version = self.version(image, updated_at)
+        missing = [
+            name for name in settings.RENDITION_LADDER
+            if name in RENDITION_SIZES and not self._frame_path(avatar_id, version, self._resolution(name)).exists()
+        ]
+        if missing:
+            self._build(avatar_id, image, version, [self._resolution(name) for name in missing])
+        self.discard(avatar_id, keep_version=version)
+
+    def discard(self, avatar_id: int, keep_version: Optional[str] = None):
+        """remove the cached versions of an avatar, except keep_version"""
+        for entry in self.root.glob(f"{avatar_id}_*"):
+            if entry.name == f"{avatar_id}_{keep_version}" or not entry.is_dir():
+                continue
+            for path in entry.iterdir():
+                path.unlink(missing_ok=True)
+            try:
+                entry.rmdir()
+            except OSError:
+                pass  # rebuilt concurrently
+        with self._lock:
+            for memo_key in [key for key in self._memo if key.split("/")[0].startswith(f"{avatar_id}_")]:
+                if not memo_key.startswith(f"{avatar_id}_{keep_version}/"):
+                    del self._memo[memo_key]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"builds": self.builds, "hits": self.hits, "loaded": len(self._memo)}
+
+    @staticmethod
+    def _resolution(name: str) -> str:
+        width, height = RENDITION_SIZES[name]
+        return f"{width}x{height}"
+
+    def _frame_path(self, avatar_id: int, version: str, resolution: str) -> Path:
+        return self.entry_dir(avatar_id, version) / f"{resolution}.npy"
+
+    def _load(self, avatar_id: int, version: str, resolution: str) -> Optional[AvatarAsset]:
+        import numpy as np
+
+        frame_path = self._frame_path(avatar_id, version, resolution)
+        try:
+            boxes = json.loads(frame_path.with_suffix(".json").read_text(encoding="utf-8"))
+            frame = np.load(frame_path, mmap_mode="r")
+        except (OSError, ValueError):
+            return None
+        face_box = tuple(boxes["face_box"]) if boxes.get("face_box") else None
+        return AvatarAsset(frame, face_box, tuple(boxes["mouth_box"]), version)
+
+    def _build(self, avatar_id: int, image: Path, version: str, resolutions: List[str]):
+        """decode the image once, locate the face, then fit and store every size"""
+        import numpy as np
+        from PIL import Image
+
+        with Image.open(image) as source:
+            still = source.convert("RGB")
+        face = detect_face(still)
+        entry = self.entry_dir(avatar_id, version)
+        entry.mkdir(parents=True, exist_ok=True)
+        for resolution in resolutions:
+            width, height = (int(value) for value in resolution.split("x"))
+            frame, face_box, mouth_box = fit_frame(still, face, width, height)
+            frame_path = entry / f"{resolution}.npy"
+            # written under temp names and renamed, so readers in other processes
+            # never map a partial file; the boxes land before the frame they describe
+            self._write_atomic(frame_path.with_suffix(".json"), lambda f: f.write(json.dumps({
+                "face_box": face_box, "mouth_box": mouth_box
+            }).encode("utf-8")))
+            self._write_atomic(frame_path, lambda f: np.save(f, np.asarray(frame, dtype=np.uint8)))
+        with self._lock:
+            self.builds += 1
+
+    @staticmethod
+    def _write_atomic(path: Path, write):
+        tmp_path = path.with_name(f".tmp_{uuid.uuid4().hex}{path.suffix}")
+        try:
+            with open(tmp_path, "wb") as f:
+                write(f)
+            os.replace(tmp_path, path)
+        finally:
+            tmp_path.unlink(missing_ok=True)
+
+
+def detect_face(still) -> Optional[Box]:
+    """largest frontal face in the image, via opencv's bundled haar cascade; None without opencv"""
+    try:
+        import cv2
+        import numpy as np
+    except ImportError:
+        return None
+    cascade = cv2.CascadeClassifier(os.path.join(cv2.data.haarcascades, "haarcascade_frontalface_default.xml"))
+    gray = cv2.cvtColor(np.asarray(still), cv2.COLOR_RGB2GRAY)
+    min_side = max(24, min(gray.shape) // 10)
+    faces = cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=(min_side, min_side))
+    if len(faces) == 0:
+        return None
+    x, y, w, h = max(faces, key=lambda face: face[2] * face[3])
+    return int(x), int(y), int(x + w), int(y + h)
+
+
+def fit_frame(still, face: Optional[Box], width: int, height: int):
+    """the still cropped around the face and fitted into width x height on black
+
+    returns the frame as an array plus the face and mouth boxes in frame pixels
+    """
+    import numpy as np
+    from PIL import Image, ImageOps
+
+    if face is not None:
+        still, face = _crop_around_face(still, face, width / height)
+    fitted = ImageOps.contain(still, (width, height))
+    canvas = Image.new("RGB", (width, height))
+    left, top = (width - fitted.width) // 2, (height - fitted.height) // 2
+    canvas.paste(fitted, (left, top))
+    scale = fitted.width / still.width
+
+    def to_frame(x: float, y: float) -> Tuple[int, int]:
+        return int(left + x * scale), int(top + y * scale)
+
+    if face is not None:
+        face_box = to_frame(face[0], face[1]) + to_frame(face[2], face[3])
+        region = face
+        centre_x, centre_y, box_width, box_height = FACE_MOUTH_BOX
+    else:
+        face_box = None
+        region = (0, 0, still.width, still.height)
+        centre_x, centre_y, box_width, box_height = DEFAULT_MOUTH_BOX
+    region_width, region_height = region[2] - region[0], region[3] - region[1]
+    x0, y0 = to_frame(region[0] + region_width * (centre_x - box_width / 2),
+                      region[1] + region_height * (centre_y - box_height / 2))
+    x1, y1 = to_frame(region[0] + region_width * (centre_x + box_width / 2),
+                      region[1] + region_height * (centre_y + box_height / 2))
+    mouth_box = (max(x0, 0), max(y0, 0), min(x1, width), min(y1, height))
+    return np.asarray(canvas, dtype=np.uint8), face_box, mouth_box
+
+
+def _crop_around_face(still, face: Box, aspect: float):
+    """head-and-shoulders crop with the frame's aspect ratio, clipped to the image"""
+    face_width, face_height = face[2] - face[0], face[3] - face[1]
+    crop_width = max(face_height * FACE_CROP_SCALE[1] * aspect, face_width * FACE_CROP_SCALE[0])
+    # shrink to fit the image, keeping the aspect ratio
+    crop_width = min(crop_width, still.width, still.height * aspect)
+    crop_height = crop_width / aspect
+    # the face sits a little above the middle, leaving room for the shoulders
+    centre_x = (face[0] + face[2]) / 2
+    centre_y = face[1] + face_height * 0.6
+    left = min(max(centre_x - crop_width / 2, 0), still.width - crop_width)
+    top = min(max(centre_y - crop_height * 0.45, 0), still.height - crop_height)
+    box = tuple(int(round(value)) for value in (left, top, left + crop_width, top + crop_height))
+    cropped = still.crop(box)
+    return cropped, (face[0] - box[0], face[1] - box[1], face[2] - box[0], face[3] - box[1])
+
+
+# build entries as soon as an avatar row is added or changed, after the commit,
+# on the render pool so the request that saved the avatar isn't held up
+@event.listens_for(Avatar, "after_insert")
+@event.listens_for(Avatar, "after_update")
+def _mark_avatar_changed(mapper, connection, target):
+    session = Session.object_session(target)
+    if session is not None:
+        session.info.setdefault("changed_avatars", set()).add(target.id)
+
+
+@event.listens_for(Session, "after_commit")
+def _prebuild_changed_avatars(session):
+    changed = session.info.pop("changed_avatars", None)
+    if not changed or not (settings.AVATAR_ANIMATION or settings.AVATAR_IDLE_LOOP_TIERS):
+        return
+    from app.services.render_pool import render_pool
+
+    for avatar_id in changed:
+        render_pool.submit(_prebuild_avatar, avatar_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_changed_avatars(session):
+    session.info.pop("changed_avatars", None)
+
+
+def _prebuild_avatar(avatar_id: int):
+    from app.core.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        avatar = db.query(Avatar).filter(Avatar.id == avatar_id).first()
+        if avatar is None:
+            avatar_assets.discard(avatar_id)
+            return
+        image_path, video_path, updated_at = avatar.image_path, avatar.video_path, avatar.updated_at
+    finally:
+        db.close()
+    if settings.AVATAR_ANIMATION:
+        try:
+            avatar_assets.prebuild(avatar_id, image_path, updated_at)
+        except Exception as e:
+            print(f"avatar {avatar_id} asset prebuild failed: {str(e)}")
+    if settings.AVATAR_IDLE_LOOP_TIERS:
+        _prebuild_idle_loops(avatar_id, video_path)
+
+
+def _prebuild_idle_loops(avatar_id: int, video_path: Optional[str]):
+    """encode the avatar's idle clip as a loop at every configured rendition size"""
+    from app.services.background_library import background_library
+    from app.services.ffmpeg_capabilities import ffmpeg_capabilities
+
+    video = resolve_file(video_path)
+    profile = ffmpeg_capabilities.profile()
+    if video is None or not background_library.enabled(profile):
+        return
+    for name in settings.RENDITION_LADDER:
+        if name in RENDITION_SIZES:
+            background_library.get(profile, AvatarAssetCache._resolution(name), video=str(video))
+
+# create global instance
+avatar_assets = AvatarAssetCache()
@@ -0,0 +1,218 @@
+import os
+import hashlib
+import subprocess
+import threading
+import uuid
+from pathlib import Path
+from typing import Dict, Optional
+
+from app.core.config import settings
+from app.services import render_previews
+from app.services.render_cache import render_cache, stable_digest
+
+
+class BackgroundLoop:
+    """a pre-encoded video track that renders loop and stream-copy under their audio"""
+
+    def __init__(self, key: str, path: Path, resolution: str, fps: int):
+        self.key = key
+        self.path = path
+        self.resolution = resolution
+        self.fps = fps
+
+    @property
+    def poster_path(self) -> Path:
+        return self.path.with_name(f"{self.key}.poster.jpg")
+
+    @property
+    def tile_path(self) -> Path:
+        return self.path.with_name(f"{self.key}.tile.jpg")
+
+    def has_previews(self) -> bool:
+        return self.poster_path.exists() and self.tile_path.exists()
+
+
+class BackgroundLibrary:
+    """pre-encoded background loops per (resolution, fps, color, image or video, encoder)
+
+    the picture under a simple video never changes, so it is encoded once here and
+    every render only encodes its audio: the loop is repeated with -stream_loop and
+    copied into the output without touching the video encoder.
+
+    a video source (an avatar's idle clip, Avatar.video_path) becomes a seamless loop:
+    its opening seconds play forward and then backward, so the last frame leads back
+    into the first and repeating the loop never jumps
+    """
+
+    def __init__(self, root: Optional[str] = None):
+        self.root = Path(root or settings.BACKGROUND_LIBRARY_DIR or render_cache.root / "backgrounds")
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._build_locks: Dict[str, threading.Lock] = {}
+        self._file_digests: Dict[tuple, str] = {}
+        self.builds = 0
+        self.hits = 0
+
+    @staticmethod
+    def enabled(profile) -> bool:
+        return settings.BACKGROUND_LIBRARY and profile.render_strategy != "audio_only"
+
+    def key_for(
+        self,
+        profile,
+        resolution: str,
+        fps: int,
+        color: Optional[str] = None,
+        image: Optional[str] = None,
+        video: Optional[str] = None
+    ) -> str:
+        """everything that changes the encoded loop; images and videos are keyed by their content"""
+        return stable_digest({
+            "resolution": resolution,
+            "fps": fps,
+            "color": color,
+            "image": self._file_digest(image) if image else None,
+            "video": self._file_digest(video) if video else None,
+            "encoder": profile.video_encoder,
+            "loop_seconds": self._loop_seconds(video),
+            "keyframe_seconds": settings.HLS_SEGMENT_SECONDS,
+            "previews": render_previews.signature(profile)
+        })
+
+    def get(
+        self,
+        profile,
+        resolution: str,
+        color: Optional[str] = None,
+        image: Optional[str] = None,
+        video: Optional[str] = None
+    ) -> Optional[BackgroundLoop]:
+        """the loop for a background, encoding it on first use; None if it cannot be built"""
+        fps = settings.BACKGROUND_FPS
+        try:
+            key = self.key_for(profile, resolution, fps, color, image, video)
+        except OSError as e:
+            print(f"background source unavailable: {str(e)}")
+            return None
+        loop = BackgroundLoop(key, self.root / f"{key}.mp4", resolution, fps)
+        if loop.path.exists():
+            self.hits += 1
+            return loop
+
+        with self._lock:
+            build_lock = self._build_locks.setdefault(key, threading.Lock())
+        # one build per key in this process; a concurrent build in another process
+        # just produces the same file and the last rename wins
+        with build_lock:
+            if loop.path.exists():
+                self.hits += 1
+                return loop
+            try:
+                self._build(profile, loop, color, image, video)
+            except Exception as e:
+                print(f"could not build background loop {key[:12]}: {str(e)}")
+                return None
+            self.builds += 1
+            return loop
+
+    def _build(self, profile, loop: BackgroundLoop, color: Optional[str], image: Optional[str], video: Optional[str]):
+        width, height = loop.resolution.split("x")
+        loop_seconds = self._loop_seconds(video)
+        if video:
+            source = ['-i', video]
+            half = loop_seconds / 2
+            # fill the frame (the clip is cropped, not letterboxed), pad clips shorter
+            # than half a loop with their last frame, then play forward and back
+            picture = (
+                f'[0:v]tpad=stop_mode=clone:stop_duration={half},trim=duration={half},setpts=PTS-STARTPTS,'
+                f'fps={loop.fps},scale={width}:{height}:force_original_aspect_ratio=increase,'
+                f'crop={width}:{height},setsar=1,split[forward][backward_in];'
+                f'[backward_in]reverse[backward];[forward][backward]concat=n=2:v=1:a=0'
+            )
+        elif image:
+            source = ['-loop', '1', '-framerate', str(loop.fps), '-i', image]
+            # fit the image inside the frame; h264 needs even dimensions
+            picture = '[0:v]' + ','.join([
+                f'scale={width}:{height}:force_original_aspect_ratio=decrease',
+                f'pad={width}:{height}:(ow-iw)/2:(oh-ih)/2',
+                'setsar=1'
+            ])
+        else:
+            source = ['-f', 'lavfi', '-i', f'color=c={color or "black"}:size={loop.resolution}:rate={loop.fps}']
+            picture = '[0:v]null'
+
+        tmp_id = uuid.uuid4().hex
+        tmp_video = self.root / f".tmp_{tmp_id}.mp4"
+        tmp_poster = self.root / f".tmp_{tmp_id}.poster.jpg"
+        tmp_tile = self.root / f".tmp_{tmp_id}.tile.jpg"
+        gop = loop.fps * settings.HLS_SEGMENT_SECONDS  # keyframes where hls segments are cut
+
+        cmd = [profile.ffmpeg_path, '-y', '-hide_banner', '-loglevel', 'error', *source]
+        outputs = []
+        if render_previews.supported(profile):
+            tile_width, tile_height = render_previews.tile_size(loop.resolution)
+            graph = f'{picture},split=3[main][poster][tile_in];[tile_in]scale={tile_width}:{tile_height}[tile]'
+            outputs = [
+                '-map', '[poster]', '-frames:v', '1', '-q:v', '3', str(tmp_poster),
+                '-map', '[tile]', '-frames:v', '1', '-q:v', '5', str(tmp_tile)
+            ]
+        else:
+            graph = f'{picture}[main]'
+        cmd += ['-filter_complex', graph, '-map', '[main]']
+        cmd += ['-t', str(loop_seconds), '-c:v', profile.video_encoder, '-pix_fmt', 'yuv420p']
+        if profile.video_encoder == "libx264":
+            # built once and reused by every render, so spend a little on the encode
+            cmd += ['-preset', 'medium', '-sc_threshold', '0']
+            if not video:
+                cmd += ['-tune', 'stillimage']
+        cmd += [
+            '-g', str(gop), '-keyint_min', str(gop),
+            '-movflags', '+faststart',
+            str(tmp_video),
+            *outputs
+        ]
+        try:
+            result = subprocess.run(cmd, capture_output=True, text=True, timeout=settings.FFMPEG_TIMEOUT_SECONDS)
+            if result.returncode != 0:
+                raise Exception(result.stderr[-500:])
+            # the loop goes last, so an existing loop always has its previews next to it
+            if tmp_poster.exists() and tmp_tile.exists():
+                os.replace(tmp_poster, loop.poster_path)
+                os.replace(tmp_tile, loop.tile_path)
+            os.replace(tmp_video, loop.path)
+            print(f"built background loop {loop.key[:12]} ({loop.resolution} @ {loop.fps}fps)")
+        finally:
+            for path in (tmp_video, tmp_poster, tmp_tile):
+                path.unlink(missing_ok=True)
+
+    def _file_digest(self, source: str) -> str:
+        if source.startswith("data:"):
+            return hashlib.sha256(source.encode("utf-8")).hexdigest()
+        # hash each version of a file once
+        stat = os.stat(source)
+        version = (source, stat.st_mtime_ns, stat.st_size)
+        if version not in self._file_digests:
+            digest = hashlib.sha256()
+            with open(source, "rb") as f:
+                for block in iter(lambda: f.read(1024 * 1024), b""):
+                    digest.update(block)
+            self._file_digests[version] = digest.hexdigest()
+        return self._file_digests[version]
+
+    @staticmethod
+    def _loop_seconds(video: Optional[str] = None) -> int:
+        # whole hls segments, so every loop boundary falls on a keyframe
+        segment = settings.HLS_SEGMENT_SECONDS
+        seconds = settings.AVATAR_IDLE_LOOP_SECONDS if video else settings.BACKGROUND_LOOP_SECONDS
+        return max(segment, -(-seconds // segment) * segment)
+
+    def stats(self) -> Dict:
+        return {
+            "loops": len(list(self.root.glob("*.mp4"))),
+            "builds": self.builds,
+            "hits": self.hits
+        }
+
+
+# create global instance
+background_library = BackgroundLibrary()
@@ -0,0 +1,192 @@
+import os
+import json
+import shutil
+import subprocess
+import threading
+from typing import Dict, Iterable, List, Optional
+
+from app.core.config import settings
+
+# places ffmpeg is commonly installed when it is not on PATH
+FFMPEG_CANDIDATES = ["ffmpeg", "C:/Program Files/ffmpeg/bin/ffmpeg.exe", "C:/ffmpeg/bin/ffmpeg.exe"]
+
+# preferred encoders, best first
+VIDEO_ENCODERS = ["libx264", "libopenh264", "h264_nvenc", "h264_qsv", "mpeg4"]
+AUDIO_ENCODERS = ["aac", "libfdk_aac", "libmp3lame"]
+
+
+class EncoderProfile:
+    """what a detected ffmpeg build can do, and the render strategy that follows from it"""
+
+    def __init__(
+        self,
+        ffmpeg_path: Optional[str] = None,
+        ffprobe_path: Optional[str] = None,
+        version: Optional[str] = None,
+        encoders: Iterable[str] = (),
+        muxers: Iterable[str] = (),
+        demuxers: Iterable[str] = (),
+        filters: Iterable[str] = ()
+    ):
+        self.ffmpeg_path = ffmpeg_path
+        self.ffprobe_path = ffprobe_path
+        self.version = version
+        self.encoders = frozenset(encoders)
+        self.muxers = frozenset(muxers)
+        self.demuxers = frozenset(demuxers)
+        self.filters = frozenset(filters)
+
+    @property
+    def available(self) -> bool:
+        return self.ffmpeg_path is not None
+
+    @property
+    def video_encoder(self) -> Optional[str]:
+        return next((name for name in VIDEO_ENCODERS if name in self.encoders), None)
+
+    @property
+    def audio_encoder(self) -> Optional[str]:
+        return next((name for name in AUDIO_ENCODERS if name in self.encoders), None)
+
+    @property
+    def render_strategy(self) -> str:
+        """how create_simple_video should build a video on this node
+
+        lavfi_background: generated color background, encoded with the audio
+        still_image: a looped still frame encoded with the audio
+        audio_only: no usable ffmpeg, the audio is stored in the mp4 slot as-is
+        """
+        if not self.available or not self.video_encoder or not self.audio_encoder:
+            return "audio_only"
+        if "mp4" not in self.muxers:
+            return "audio_only"
+        if "lavfi" in self.demuxers and "color" in self.filters:
+            return "lavfi_background"
+        return "still_image"
+
+    @property
+    def name(self) -> str:
+        """short identifier of the encode settings, used in render cache keys"""
+        if self.render_strategy == "audio_only":
+            return "audio_only"
+        return f"{self.render_strategy}:{self.video_encoder}+{self.audio_encoder}"
+
+    def to_dict(self) -> Dict:
+        return {
+            "ffmpeg_path": self.ffmpeg_path,
+            "ffprobe_path": self.ffprobe_path,
+            "version": self.version,
+            "render_strategy": self.render_strategy,
+            "video_encoder": self.video_encoder,
+            "audio_encoder": self.audio_encoder,
+            "encoders": sorted(self.encoders),
+            "muxers": sorted(self.muxers),
+            "demuxers": sorted(self.demuxers),
+            "filters": sorted(self.filters)
+        }
+
+
+class FFmpegCapabilities:
+    """discovers ffmpeg/ffprobe once per process and caches the encoder profile"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._profile: Optional[EncoderProfile] = None
+
+    def profile(self, refresh: bool = False) -> EncoderProfile:
+        """return the cached profile, probing the binaries on first use"""
+        with self._lock:
+            if self._profile is None or refresh:
+                self._profile = self._discover()
+            return self._profile
+
+    def _discover(self) -> EncoderProfile:
+        ffmpeg_path = self._find_ffmpeg()
+        if not ffmpeg_path:
+            print("ffmpeg not found in any standard location, videos will be audio only")
+            return EncoderProfile()
+
+        version_output = self._run(ffmpeg_path, "-version")
+        version = version_output.splitlines()[0] if version_output else None
+        muxers, demuxers = self._parse_formats(self._run(ffmpeg_path, "-hide_banner", "-formats"))
+        profile = EncoderProfile(
+            ffmpeg_path=ffmpeg_path,
+            ffprobe_path=self._find_ffprobe(ffmpeg_path),
+            version=version,
+            encoders=self._parse_encoders(self._run(ffmpeg_path, "-hide_banner", "-encoders")),
+            muxers=muxers,
+            demuxers=demuxers,
+            filters=self._parse_filters(self._run(ffmpeg_path, "-hide_banner", "-filters"))
+        )
+        print(f"ffmpeg found at: {ffmpeg_path} (strategy: {profile.render_strategy})")
+        return profile
+
+    def _find_ffmpeg(self) -> Optional[str]:
+        candidates = [settings.FFMPEG_PATH] if settings.FFMPEG_PATH else []
+        candidates += FFMPEG_CANDIDATES
+        for candidate in candidates:
+            # resolve without spawning anything; the -version call below validates it
+            resolved = shutil.which(candidate) or (candidate if os.path.isfile(candidate) else None)
+            if resolved and self._run(resolved, "-version"):
+                return resolved
+        return None
+
+    def _find_ffprobe(self, ffmpeg_path: str) -> Optional[str]:
+        if settings.FFPROBE_PATH:
+            return shutil.which(settings.FFPROBE_PATH) or settings.FFPROBE_PATH
+        directory, filename = os.path.split(ffmpeg_path)
+        sibling = os.path.join(directory, filename.replace("ffmpeg", "ffprobe"))
+        if sibling != ffmpeg_path and os.path.isfile(sibling):
+            return sibling
+        return shutil.which("ffprobe")
+
+    def _run(self, binary: str, *args: str) -> str:
+        try:
+            result = subprocess.run([binary, *args], capture_output=True, text=True, timeout=10)
+        except (subprocess.TimeoutExpired, OSError):
+            return ""
+        return result.stdout if result.returncode == 0 else ""
+
+    @staticmethod
+    def _parse_encoders(output: str) -> List[str]:
+        # " V....D libx264   libx264 H.264 / AVC ..."
+        names = []
+        for line in output.split("------", 1)[-1].splitlines():
+            parts = line.split()
+            if len(parts) >= 2 and len(parts[0]) == 6 and parts[0][0] in "VAS":
+                names.append(parts[1])
+        return names
+
+    @staticmethod
+    def _parse_formats(output: str):
+        # " DE  hls   Apple HTTP Live Streaming" / " D d lavfi   Libavfilter virtual input device"
+        muxers, demuxers = [], []
+        for line in output.split("---", 1)[-1].splitlines():
+            if len(line) < 5:
+                continue
+            flags, rest = line[1:4], line[4:].split()
+            if not rest or set(flags) - set("DEd ."):
+                continue
+            names = rest[0].split(",")
+            if "E" in flags:
+                muxers.extend(names)
+            if "D" in flags:
+                demuxers.extend(names)
+        return muxers, demuxers
+
+    @staticmethod
+    def _parse_filters(output: str) -> List[str]:
+        # " TSC scale   V->V   Scale the input video size ..."
+        names = []
+        for line in output.splitlines():
+            parts = line.split()
+            if len(parts) >= 3 and "->" in parts[2]:
+                names.append(parts[1])
+        return names
+
+# create global instance
+ffmpeg_capabilities = FFmpegCapabilities()
+
+if __name__ == "__main__":
+    # dump what this node detected: python -m app.services.ffmpeg_capabilities
+    print(json.dumps(ffmpeg_capabilities.profile().to_dict(), indent=2))
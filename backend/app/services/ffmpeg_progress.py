@@ -0,0 +1,137 @@
+import re
+import subprocess
+import threading
+import time
+from typing import BinaryIO, Callable, List, Optional
+
+from app.core.config import settings
+from app.services.render_cancellation import CancelToken, kill_process_group, process_group_kwargs
+
+SPEED_PATTERN = re.compile(r"([\d.]+)x")
+
+
+class FFmpegProgress:
+    """parses ffmpeg's -progress key=value stream into a completed fraction and speed
+
+    ffmpeg writes a block of lines roughly twice a second, each ending with
+    progress=continue (or progress=end for the last one). callbacks are coalesced
+    to at most one per interval; the final block is always reported
+    """
+
+    def __init__(
+        self,
+        duration: Optional[float],
+        callback: Optional[Callable[[float, Optional[float]], None]] = None,
+        interval: Optional[float] = None
+    ):
+        self.duration = duration
+        self.callback = callback
+        self.interval = settings.RENDER_PROGRESS_INTERVAL_SECONDS if interval is None else interval
+        self.out_seconds = 0.0
+        self.speed: Optional[float] = None
+        self.finished = False
+        self._last_report = 0.0
+
+    @property
+    def fraction(self) -> float:
+        if self.finished:
+            return 1.0
+        if not self.duration:
+            return 0.0
+        return max(0.0, min(1.0, self.out_seconds / self.duration))
+
+    def feed(self, line: str):
+        key, _, value = line.strip().partition("=")
+        if key in ("out_time_us", "out_time_ms"):
+            # out_time_ms is microseconds too, despite its name
+            if value.lstrip("-").isdigit():
+                self.out_seconds = max(self.out_seconds, int(value) / 1000000.0)
+        elif key == "speed":
+            match = SPEED_PATTERN.match(value.strip())
+            if match:
+                self.speed = float(match.group(1))
+        elif key == "progress":
+            self.finished = value == "end"
+            self._report(force=self.finished)
+
+    def _report(self, force: bool = False):
+        now = time.monotonic()
+        if self.callback is None or (not force and now - self._last_report < self.interval):
+            return
+        self._last_report = now
+        try:
+            self.callback(self.fraction, self.speed)
+        except Exception as e:
+            # a failed progress write must never stop the encode
+            print(f"progress callback failed: {str(e)}")
+
+
+def run_ffmpeg(
+    cmd: List[str],
+    progress: Optional[FFmpegProgress] = None,
+    timeout: Optional[float] = None,
+    on_poll: Optional[Callable[[], None]] = None,
+    cancel: Optional[CancelToken] = None,
+    stdin_writer: Optional[Callable[[BinaryIO], None]] = None
+) -> subprocess.CompletedProcess:
+    """run an ffmpeg command, feeding its progress pipe to progress while it runs
+
+    stdin_writer, if given, runs on its own thread with ffmpeg's stdin (for commands
+    reading an input from pipe:0) and must close it when done; otherwise stdin is
+    empty. on_poll is called every 50ms until ffmpeg exits. raises subprocess.TimeoutExpired
+    (after killing ffmpeg) like subprocess.run does, and RenderCancelled when cancel
+    fires; ffmpeg runs in its own process group so either way nothing is left behind
+    """
+    if cancel is not None:
+        cancel.raise_if_cancelled()
+    timeout = timeout or settings.FFMPEG_TIMEOUT_SECONDS
+    # -progress goes first so it applies to the whole run, -nostats keeps stderr to errors
+    cmd = [cmd[0], '-progress', 'pipe:1', '-nostats', *cmd[1:]]
+    process = subprocess.Popen(
+        cmd,
+        stdin=subprocess.PIPE if stdin_writer else subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        **process_group_kwargs()
+    )
+    if cancel is not None:
+        cancel.attach(process)
+
+    stderr_lines: List[str] = []
+    pipe_threads = [
+        threading.Thread(target=_read_lines, args=(process.stdout, progress.feed if progress else None), daemon=True),
+        threading.Thread(target=_read_lines, args=(process.stderr, stderr_lines.append), daemon=True)
+    ]
+    if stdin_writer is not None:
+        pipe_threads.append(threading.Thread(target=stdin_writer, args=(process.stdin,), daemon=True))
+    for pipe_thread in pipe_threads:
+        pipe_thread.start()
+
+    deadline = time.monotonic() + timeout
+    try:
+        while process.poll() is None:
+            if on_poll is not None:
+                on_poll()
+            if time.monotonic() > deadline:
+                kill_process_group(process)
+                process.wait()
+                raise subprocess.TimeoutExpired(cmd, timeout)
+            time.sleep(0.05)
+    finally:
+        if cancel is not None:
+            cancel.detach(process)
+        for pipe_thread in pipe_threads:
+            pipe_thread.join(timeout=5)
+    if cancel is not None:
+        # cancel() kills ffmpeg from another thread, which ends the loop above
+        cancel.raise_if_cancelled()
+    return subprocess.CompletedProcess(cmd, process.returncode, "", "".join(stderr_lines))
+
+
+def _read_lines(stream, consume: Optional[Callable[[str], None]]):
+    # both pipes are drained even when nobody wants the lines, so ffmpeg never blocks on a full pipe.
+    # they are binary because stdin may carry raw frames
+    for line in stream:
+        if consume is not None:
+            consume(line.decode("utf-8", "replace"))
+    stream.close()
@@ -0,0 +1,68 @@
+import os
+import errno
+import shutil
+import uuid
+from pathlib import Path
+
+# linux FICLONE ioctl: share the source's extents (btrfs, xfs, overlayfs on those)
+_FICLONE = 0x40049409
+
+
+def publish_file(source: str, target: str, move: bool = False) -> str:
+    """make source visible at target atomically, copying bytes only as a last resort
+
+    move=True renames the source away (scratch files); otherwise the source stays
+    in place (cache entries) and is hardlinked or reflinked where the filesystem
+    allows. the target name only ever points at a complete file, because every
+    method first materialises a temp name in the target directory and then renames.
+    returns the method used: rename, hardlink, reflink or copy
+    """
+    source_path, target_path = Path(source), Path(target)
+    target_path.parent.mkdir(parents=True, exist_ok=True)
+
+    if move:
+        try:
+            os.replace(source_path, target_path)
+            return "rename"
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+
+    tmp_path = target_path.with_name(f".{target_path.name}.{uuid.uuid4().hex}.part")
+    try:
+        method = _link_or_clone(source_path, tmp_path)
+        os.replace(tmp_path, target_path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+    if move:
+        source_path.unlink(missing_ok=True)
+    return method
+
+
+def _link_or_clone(source: Path, tmp_path: Path) -> str:
+    try:
+        os.link(source, tmp_path)
+        return "hardlink"
+    except OSError:
+        pass  # other filesystem, or links unsupported (fat, some network shares)
+
+    if _reflink(source, tmp_path):
+        return "reflink"
+
+    shutil.copyfile(source, tmp_path)
+    return "copy"
+
+
+def _reflink(source: Path, tmp_path: Path) -> bool:
+    try:
+        import fcntl
+    except ImportError:
+        return False  # windows
+    try:
+        with open(source, "rb") as src, open(tmp_path, "wb") as dst:
+            fcntl.ioctl(dst.fileno(), _FICLONE, src.fileno())
+        return True
+    except OSError:
+        tmp_path.unlink(missing_ok=True)
+        return False
@@ -0,0 +1,273 @@
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set
+
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.render_job import RenderJob
+from app.models.video import Video
+
+ACTIVE_STATUSES = ("queued", "leased")
+
+
+def utcnow() -> datetime:
+    """naive utc timestamp, matching what the database stores"""
+    return datetime.utcnow()
+
+
+class JobQueue:
+    """database-backed render queue with worker leases and bounded retries"""
+
+    def __init__(
+        self,
+        lease_seconds: Optional[int] = None,
+        max_attempts: Optional[int] = None,
+        backoff_seconds: Optional[int] = None
+    ):
+        self.lease_seconds = lease_seconds or settings.RENDER_QUEUE_LEASE_SECONDS
+        self.max_attempts = max_attempts or settings.RENDER_QUEUE_MAX_ATTEMPTS
+        self.backoff_seconds = backoff_seconds or settings.RENDER_QUEUE_BACKOFF_SECONDS
+
+    def backoff(self, attempts: int) -> timedelta:
+        """exponential retry delay, capped at ten minutes"""
+        delay = self.backoff_seconds * (2 ** max(0, attempts - 1))
+        return timedelta(seconds=min(delay, 600))
+
+    def enqueue(self, db: Session, video_id: int, max_attempts: Optional[int] = None) -> RenderJob:
+        """add a render job for a video and commit it
+
+        a video has at most one active job: if one is queued or leased already, that
+        job is returned instead of adding another. mysql serializes concurrent
+        enqueues on the video row; sqlite and postgresql reject the second insert
+        through a partial unique index
+        """
+        self._lock_videos(db, [video_id])
+        job = self._active_job(db, video_id)
+        if job is None:
+            job = self._new_job(video_id, max_attempts, utcnow())
+            db.add(job)
+            try:
+                db.commit()
+            except IntegrityError:
+                # another process queued the video between the check and the insert
+                db.rollback()
+                return self._active_job(db, video_id)
+        else:
+            db.commit()
+        db.refresh(job)
+        return job
+
+    def enqueue_many(self, db: Session, video_ids: List[int], max_attempts: Optional[int] = None) -> List[RenderJob]:
+        """add render jobs for a group of videos in a single commit
+
+        ids are allocated in order, so the group is leased in the order it was given.
+        videos that already have an active job are skipped
+        """
+        self._lock_videos(db, video_ids)
+        active = self._active_video_ids(db, video_ids)
+        now = utcnow()
+        jobs = [self._new_job(video_id, max_attempts, now) for video_id in video_ids if video_id not in active]
+        db.add_all(jobs)
+        db.commit()
+        return jobs
+
+    def lease(self, db: Session, worker_id: str) -> Optional[RenderJob]:
+        """claim the next runnable job for a worker, or None if nothing is due"""
+        now = utcnow()
+        candidates = db.query(RenderJob.id).filter(
+            RenderJob.status == "queued",
+            RenderJob.next_run_at <= now
+        ).order_by(RenderJob.next_run_at, RenderJob.id).limit(10).all()
+
+        for (job_id,) in candidates:
+            # compare-and-set on status so concurrent workers never claim the same job
+            claimed = db.query(RenderJob).filter(
+                RenderJob.id == job_id,
+                RenderJob.status == "queued"
+            ).update({
+                RenderJob.status: "leased",
+                RenderJob.lease_owner: worker_id,
+                RenderJob.lease_expires_at: now + timedelta(seconds=self.lease_seconds),
+                RenderJob.heartbeat_at: now,
+                RenderJob.attempts: RenderJob.attempts + 1
+            }, synchronize_session=False)
+            db.commit()
+            if claimed:
+                return db.query(RenderJob).filter(RenderJob.id == job_id).first()
+        return None
+
+    def heartbeat(self, db: Session, job_id: int, worker_id: str) -> bool:
+        """extend a lease; returns False if the worker no longer owns the job"""
+        now = utcnow()
+        extended = db.query(RenderJob).filter(
+            RenderJob.id == job_id,
+            RenderJob.lease_owner == worker_id,
+            RenderJob.status == "leased"
+        ).update({
+            RenderJob.lease_expires_at: now + timedelta(seconds=self.lease_seconds),
+            RenderJob.heartbeat_at: now
+        }, synchronize_session=False)
+        db.commit()
+        return bool(extended)
+
+    def complete(self, db: Session, job_id: int, worker_id: str) -> bool:
+        """mark a leased job as done"""
+        done = db.query(RenderJob).filter(
+            RenderJob.id == job_id,
+            RenderJob.lease_owner == worker_id,
+            RenderJob.status == "leased"
+        ).update({
+            RenderJob.status: "completed",
+            RenderJob.lease_expires_at: None,
+            RenderJob.completed_at: utcnow()
+        }, synchronize_session=False)
+        db.commit()
+        return bool(done)
+
+    def fail(self, db: Session, job_id: int, worker_id: str, error: str) -> bool:
+        """record a failed attempt; returns True if the job will be retried"""
+        job = db.query(RenderJob).filter(
+            RenderJob.id == job_id,
+            RenderJob.lease_owner == worker_id,
+            RenderJob.status == "leased"
+        ).first()
+        if not job:
+            return False
+        return self._retry_or_fail(db, job, error)
+
+    def cancel(self, db: Session, video_id: int) -> int:
+        """cancel the queued and running jobs of a video
+
+        running jobs are stopped by the worker holding them, which notices on its next poll
+        """
+        cancelled = db.query(RenderJob).filter(
+            RenderJob.video_id == video_id,
+            RenderJob.status.in_(ACTIVE_STATUSES)
+        ).update({
+            RenderJob.status: "cancelled",
+            RenderJob.lease_expires_at: None,
+            RenderJob.completed_at: utcnow()
+        }, synchronize_session=False)
+        db.commit()
+        return cancelled
+
+    def revoked(self, db: Session, job_ids: List[int], worker_id: str) -> List[int]:
+        """the jobs among job_ids a worker no longer holds: cancelled, deleted or re-leased"""
+        if not job_ids:
+            return []
+        held = {
+            job_id for (job_id,) in db.query(RenderJob.id).filter(
+                RenderJob.id.in_(job_ids),
+                RenderJob.lease_owner == worker_id,
+                RenderJob.status == "leased"
+            ).all()
+        }
+        return [job_id for job_id in job_ids if job_id not in held]
+
+    def requeue_expired(self, db: Session) -> int:
+        """put jobs whose worker stopped heartbeating back on the queue"""
+        expired = db.query(RenderJob).filter(
+            RenderJob.status == "leased",
+            RenderJob.lease_expires_at < utcnow()
+        ).all()
+        for job in expired:
+            print(f"render job {job.id} lease held by {job.lease_owner} expired")
+            self._retry_or_fail(db, job, "worker lease expired")
+        return len(expired)
+
+    def sweep_on_startup(self, db: Session) -> int:
+        """recover jobs and videos left behind by a crashed or restarted process"""
+        recovered = self.requeue_expired(db)
+
+        # videos stuck in pending/processing with no live job were dropped by an old
+        # in-process task queue (or their job row was lost) - give them a fresh job.
+        # the api and every worker process sweep at startup, so each video is checked
+        # again under its row lock (and the active-job index where locks don't exist)
+        live_jobs = db.query(RenderJob.video_id).filter(RenderJob.status.in_(ACTIVE_STATUSES))
+        orphaned = db.query(Video.id).filter(
+            Video.status.in_(("pending", "processing")),
+            ~Video.id.in_(live_jobs)
+        ).all()
+        now = utcnow()
+        for (video_id,) in orphaned:
+            self._lock_videos(db, [video_id])
+            reset = db.query(Video).filter(
+                Video.id == video_id,
+                Video.status.in_(("pending", "processing"))
+            ).update({Video.status: "pending", Video.progress: 0.0}, synchronize_session=False)
+            if not reset or self._active_job(db, video_id) is not None:
+                # cancelled since, or another sweeper got there first
+                db.rollback()
+                continue
+            db.add(self._new_job(video_id, None, now))
+            try:
+                db.commit()
+                recovered += 1
+            except IntegrityError:
+                db.rollback()
+
+        if recovered:
+            print(f"render queue sweeper recovered {recovered} jobs")
+        return recovered
+
+    def stats(self, db: Session) -> Dict:
+        """job counts by status"""
+        rows = db.query(RenderJob.status, func.count(RenderJob.id)).group_by(RenderJob.status).all()
+        counts = {status: 0 for status in ("queued", "leased", "completed", "failed", "cancelled")}
+        counts.update({status: count for status, count in rows})
+        return counts
+
+    def _new_job(self, video_id: int, max_attempts: Optional[int], now: datetime) -> RenderJob:
+        return RenderJob(
+            video_id=video_id,
+            status="queued",
+            attempts=0,
+            max_attempts=max_attempts or self.max_attempts,
+            next_run_at=now
+        )
+
+    def _active_job(self, db: Session, video_id: int) -> Optional[RenderJob]:
+        return db.query(RenderJob).filter(
+            RenderJob.video_id == video_id,
+            RenderJob.status.in_(ACTIVE_STATUSES)
+        ).first()
+
+    def _lock_videos(self, db: Session, video_ids: List[int]):
+        """lock the video rows until the commit, so concurrent enqueues of a video take turns"""
+        if video_ids:
+            db.query(Video.id).filter(Video.id.in_(video_ids)).with_for_update().all()
+
+    def _active_video_ids(self, db: Session, video_ids: List[int]) -> Set[int]:
+        if not video_ids:
+            return set()
+        return {
+            video_id for (video_id,) in db.query(RenderJob.video_id).filter(
+                RenderJob.video_id.in_(video_ids),
+                RenderJob.status.in_(ACTIVE_STATUSES)
+            ).all()
+        }
+
+    def _retry_or_fail(self, db: Session, job: RenderJob, error: str) -> bool:
+        job.last_error = error
+        job.lease_owner = None
+        job.lease_expires_at = None
+
+        if (job.attempts or 0) < (job.max_attempts or self.max_attempts):
+            job.status = "queued"
+            job.next_run_at = utcnow() + self.backoff(job.attempts or 1)
+            db.commit()
+            return True
+
+        job.status = "failed"
+        job.completed_at = utcnow()
+        video = db.query(Video).filter(Video.id == job.video_id).first()
+        if video:
+            video.status = "failed"
+            video.error_message = error
+        db.commit()
+        return False
+
+# create global instance
+job_queue = JobQueue()
@@ -0,0 +1,194 @@
+import os
+import json
+import struct
+import subprocess
+from typing import BinaryIO, Dict, Iterator, Optional, Tuple
+
+# sample entry fourcc -> codec name, matching what ffprobe reports
+CODEC_NAMES = {
+    "avc1": "h264", "avc3": "h264",
+    "hev1": "hevc", "hvc1": "hevc",
+    "av01": "av1", "vp09": "vp9", "mp4v": "mpeg4",
+    "mp4a": "aac", ".mp3": "mp3", "Opus": "opus", "ac-3": "ac3", "ec-3": "eac3"
+}
+
+
+class MediaProbeError(Exception):
+    pass
+
+
+def probe_media(path: str) -> Dict:
+    """duration, resolution, codecs, bitrate and container of a media file
+
+    mp4 box headers are read directly (a few small reads, no subprocess); anything
+    else goes through a single ffprobe call, and raw mp3 through its frame headers
+    """
+    try:
+        return probe_mp4(path)
+    except MediaProbeError:
+        pass
+
+    info = probe_ffprobe(path)
+    if info:
+        return info
+
+    from app.services.tts_segments import mp3_duration
+    with open(path, "rb") as f:
+        duration = mp3_duration(f)
+    if duration <= 0:
+        raise MediaProbeError(f"could not read media metadata from {path}")
+    return _info(path, "mp3", duration, None, None, None, "mp3")
+
+
+def probe_mp4(path: str) -> Dict:
+    """read mvhd/tkhd/hdlr/stsd from the moov box without touching the media data"""
+    with open(path, "rb") as f:
+        brand, moov = _read_top_level(f)
+    if moov is None:
+        raise MediaProbeError("no moov box")
+
+    timescale, duration_units = 0, 0
+    width = height = None
+    video_codec = audio_codec = None
+
+    for box_type, payload in _boxes(moov):
+        if box_type == "mvhd":
+            timescale, duration_units = _parse_mvhd(payload)
+        elif box_type == "trak":
+            handler, codec, size = _parse_trak(payload)
+            if handler == "vide" and video_codec is None:
+                video_codec = codec
+                width, height = size
+            elif handler == "soun" and audio_codec is None:
+                audio_codec = codec
+
+    if not timescale or not duration_units:
+        # fragmented files keep their durations in the fragments
+        raise MediaProbeError("moov has no duration")
+
+    container = "mov" if brand == "qt  " else "mp4"
+    return _info(path, container, duration_units / float(timescale), width, height, video_codec, audio_codec)
+
+
+def probe_ffprobe(path: str) -> Optional[Dict]:
+    """one ffprobe call for formats the box reader does not handle"""
+    from app.services.ffmpeg_capabilities import ffmpeg_capabilities
+
+    ffprobe = ffmpeg_capabilities.profile().ffprobe_path
+    if not ffprobe:
+        return None
+    try:
+        result = subprocess.run(
+            [ffprobe, "-v", "error", "-print_format", "json", "-show_format", "-show_streams", str(path)],
+            capture_output=True, text=True, timeout=15
+        )
+        data = json.loads(result.stdout) if result.returncode == 0 else None
+    except (subprocess.TimeoutExpired, OSError, ValueError):
+        return None
+    if not data or "format" not in data:
+        return None
+
+    streams = data.get("streams", [])
+    video = next((s for s in streams if s.get("codec_type") == "video"), {})
+    audio = next((s for s in streams if s.get("codec_type") == "audio"), {})
+    duration = float(data["format"].get("duration") or 0.0)
+    container = data["format"].get("format_name", "").split(",")[0] or None
+    if container == "mov" and os.path.splitext(path)[1].lower() == ".mp4":
+        container = "mp4"  # ffprobe reports the whole mov/mp4 family as "mov,mp4,..."
+    return _info(path, container, duration, video.get("width"), video.get("height"),
+                 video.get("codec_name"), audio.get("codec_name"))
+
+
+def _info(path, container, duration, width, height, video_codec, audio_codec) -> Dict:
+    size = os.path.getsize(path)
+    # never empty and within Video.format (String(10)): the extension stands in for an unknown container
+    container = (container or os.path.splitext(path)[1].lstrip(".").lower() or "mp4")[:10]
+    return {
+        "duration": round(duration, 3),
+        "width": width,
+        "height": height,
+        "resolution": f"{width}x{height}" if width and height else None,
+        "video_codec": video_codec,
+        "audio_codec": audio_codec,
+        "bitrate": int(size * 8 / duration) if duration else None,
+        "format": container,
+        "file_size": size
+    }
+
+
+def _read_top_level(f: BinaryIO) -> Tuple[Optional[str], Optional[bytes]]:
+    """walk the top-level boxes by seeking past them; only ftyp and moov are read"""
+    brand = None
+    file_size = os.fstat(f.fileno()).st_size
+    offset = 0
+    while offset + 8 <= file_size:
+        f.seek(offset)
+        header = f.read(8)
+        size, box_type = struct.unpack(">I4s", header)
+        header_size = 8
+        if size == 1:
+            size = struct.unpack(">Q", f.read(8))[0]
+            header_size = 16
+        elif size == 0:
+            size = file_size - offset
+        if size < header_size:
+            break
+        box_type = box_type.decode("latin-1")
+        if offset == 0 and box_type != "ftyp":
+            raise MediaProbeError("not an mp4 file")
+        if box_type == "ftyp":
+            brand = f.read(4).decode("latin-1")
+        elif box_type == "moov":
+            return brand, f.read(size - header_size)
+        offset += size
+    return brand, None
+
+
+def _boxes(data: bytes) -> Iterator[Tuple[str, bytes]]:
+    offset = 0
+    while offset + 8 <= len(data):
+        size, box_type = struct.unpack_from(">I4s", data, offset)
+        header_size = 8
+        if size == 1:
+            size = struct.unpack_from(">Q", data, offset + 8)[0]
+            header_size = 16
+        elif size == 0:
+            size = len(data) - offset
+        if size < header_size:
+            return
+        yield box_type.decode("latin-1"), data[offset + header_size:offset + size]
+        offset += size
+
+
+def _find(data: bytes, *path: str) -> Optional[bytes]:
+    for box_type, payload in _boxes(data):
+        if box_type == path[0]:
+            return payload if len(path) == 1 else _find(payload, *path[1:])
+    return None
+
+
+def _parse_mvhd(payload: bytes) -> Tuple[int, int]:
+    if payload[0] == 1:
+        return struct.unpack_from(">IQ", payload, 20)
+    return struct.unpack_from(">II", payload, 12)
+
+
+def _parse_trak(trak: bytes):
+    handler = codec = None
+    width = height = None
+
+    tkhd = _find(trak, "tkhd")
+    if tkhd:
+        # width/height are 16.16 fixed point at the end of the box
+        width, height = (value >> 16 for value in struct.unpack_from(">II", tkhd, len(tkhd) - 8))
+
+    hdlr = _find(trak, "mdia", "hdlr")
+    if hdlr and len(hdlr) >= 12:
+        handler = hdlr[8:12].decode("latin-1")
+
+    stsd = _find(trak, "mdia", "minf", "stbl", "stsd")
+    if stsd and len(stsd) >= 16:
+        fourcc = stsd[12:16].decode("latin-1")
+        codec = CODEC_NAMES.get(fourcc, fourcc)
+
+    return handler, codec, (width, height)
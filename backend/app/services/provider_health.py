@@ -0,0 +1,127 @@
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional
+
+from app.core.config import settings
+from app.services.render_metrics import render_metrics
+
+
+class ProviderHealth:
+    """latency and outcome history of one tts provider, with a circuit breaker
+
+    the breaker opens when the error rate over the recent window reaches
+    TTS_BREAKER_ERROR_RATE (after TTS_BREAKER_MIN_REQUESTS) or after
+    TTS_BREAKER_TIMEOUTS timeouts in a row. an open breaker turns requests away for
+    TTS_BREAKER_COOLDOWN_SECONDS, then lets a single probe through (half open): its
+    success closes the breaker, its failure opens it again
+    """
+
+    def __init__(self, provider: str, window: int = 100):
+        self.provider = provider
+        self._lock = threading.Lock()
+        self._latencies: deque = deque(maxlen=window)
+        self._outcomes: deque = deque(maxlen=window)  # true for a success
+        self._consecutive_timeouts = 0
+        self.state = "closed"
+        self._opened_at = 0.0
+        self._probing = False
+        self.trips = 0
+
+    def allow(self) -> bool:
+        """whether a request may go to the provider now; a half-open breaker admits one probe"""
+        with self._lock:
+            if self.state == "open" and time.monotonic() - self._opened_at >= settings.TTS_BREAKER_COOLDOWN_SECONDS:
+                self.state = "half_open"
+                self._probing = False
+            if self.state == "closed":
+                return True
+            if self.state == "half_open" and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self, latency: float):
+        with self._lock:
+            self._latencies.append(latency)
+            self._outcomes.append(True)
+            self._consecutive_timeouts = 0
+            if self.state == "half_open":
+                self.state = "closed"
+                self._probing = False
+                self._outcomes.clear()
+        render_metrics.observe(f"tts_latency_{self.provider}", latency)
+
+    def record_failure(self, timed_out: bool = False):
+        with self._lock:
+            self._outcomes.append(False)
+            self._consecutive_timeouts = self._consecutive_timeouts + 1 if timed_out else 0
+            failures = self._outcomes.count(False)
+            tripped = self.state == "half_open" or (
+                self.state == "closed" and (
+                    self._consecutive_timeouts >= settings.TTS_BREAKER_TIMEOUTS
+                    or (len(self._outcomes) >= settings.TTS_BREAKER_MIN_REQUESTS
+                        and failures / len(self._outcomes) >= settings.TTS_BREAKER_ERROR_RATE)
+                )
+            )
+            if tripped:
+                self.state = "open"
+                self._opened_at = time.monotonic()
+                self._probing = False
+                self.trips += 1
+        render_metrics.increment(f"tts_errors_{self.provider}")
+        if tripped:
+            render_metrics.increment("tts_breaker_trips")
+            print(f"tts provider {self.provider} circuit breaker opened")
+
+    def abandoned(self):
+        """a request that was let through ended without an outcome (e.g. a hedge that lost)"""
+        with self._lock:
+            self._probing = False
+
+    def hedge_delay(self) -> Optional[float]:
+        """the p95 latency once there are enough samples to trust it; None before that"""
+        with self._lock:
+            if len(self._latencies) < settings.TTS_HEDGE_MIN_SAMPLES:
+                return None
+            ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            ordered = sorted(self._latencies)
+            outcomes = len(self._outcomes)
+            return {
+                "state": self.state,
+                "trips": self.trips,
+                "error_rate": round(self._outcomes.count(False) / outcomes, 4) if outcomes else 0.0,
+                "p50": round(ordered[len(ordered) // 2], 4) if ordered else None,
+                "p95": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 4) if ordered else None
+            }
+
+
+class ProviderHealthRegistry:
+    """one ProviderHealth per provider, shared by every VoiceService in the process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._providers: Dict[str, ProviderHealth] = {}
+
+    def get(self, provider: str) -> ProviderHealth:
+        with self._lock:
+            if provider not in self._providers:
+                self._providers[provider] = ProviderHealth(provider)
+            return self._providers[provider]
+
+    def reset(self):
+        """forget every provider's history, closing all breakers"""
+        with self._lock:
+            self._providers.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            providers = dict(self._providers)
+        return {name: health.stats() for name, health in providers.items()}
+
+# create global instance
+provider_health = ProviderHealthRegistry()
@@ -0,0 +1,74 @@
+import asyncio
+import importlib.util
+import weakref
+from typing import Dict
+
+import httpx
+
+from app.core.config import settings
+
+
+def http2_available() -> bool:
+    """httpx negotiates http/2 only with the h2 package installed (httpx[http2])"""
+    return importlib.util.find_spec("h2") is not None
+
+
+class ProviderClients:
+    """one pooled async http client per tts provider
+
+    connections stay open between requests (multiplexed over http/2 where the
+    provider and the h2 package allow it), each provider gets at most as many
+    connections as its concurrency cap, and every phase of a request has a timeout.
+    a client belongs to the event loop that created it; another loop gets its own
+    """
+
+    def __init__(self):
+        self._clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, httpx.AsyncClient]]" = (
+            weakref.WeakKeyDictionary()
+        )
+
+    @staticmethod
+    def base_url(provider: str) -> str:
+        return {
+            "elevenlabs": settings.ELEVENLABS_API_URL,
+            "openai": settings.OPENAI_API_URL
+        }[provider]
+
+    @staticmethod
+    def connection_limit(provider: str) -> int:
+        return {
+            "elevenlabs": settings.TTS_MAX_CONCURRENCY_ELEVENLABS,
+            "openai": settings.TTS_MAX_CONCURRENCY_OPENAI
+        }.get(provider, 4)
+
+    def get(self, provider: str) -> httpx.AsyncClient:
+        """the provider's client on the running event loop, created on first use"""
+        clients = self._clients.setdefault(asyncio.get_running_loop(), {})
+        client = clients.get(provider)
+        if client is None or client.is_closed:
+            limit = max(1, self.connection_limit(provider))
+            client = httpx.AsyncClient(
+                base_url=self.base_url(provider),
+                http2=http2_available(),
+                limits=httpx.Limits(
+                    max_connections=limit,
+                    max_keepalive_connections=limit,
+                    keepalive_expiry=settings.TTS_HTTP_KEEPALIVE_SECONDS
+                ),
+                timeout=httpx.Timeout(
+                    settings.TTS_HTTP_TIMEOUT_SECONDS,
+                    connect=settings.TTS_HTTP_CONNECT_TIMEOUT_SECONDS,
+                    pool=settings.TTS_HTTP_TIMEOUT_SECONDS
+                )
+            )
+            clients[provider] = client
+        return client
+
+    async def aclose(self):
+        """close the running loop's clients and their connections"""
+        clients = self._clients.pop(asyncio.get_running_loop(), {})
+        for client in clients.values():
+            await client.aclose()
+
+# create global instance
+provider_clients = ProviderClients()
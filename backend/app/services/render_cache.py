@@ -0,0 +1,218 @@
+import os
+import json
+import hashlib
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.services.file_publisher import publish_file
+
+
+def stable_digest(*parts) -> str:
+    """sha256 over the json form of the parts; identical across processes and restarts"""
+    payload = json.dumps(parts, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class RenderCache:
+    """content-addressed, size-bounded lru store for rendered videos
+
+    an entry is <key>.mp4 plus any sidecar files sharing the key, e.g. <key>.timing.json
+    """
+
+    def __init__(self, root: Optional[str] = None, max_bytes: Optional[int] = None):
+        # default next to the output directory: same filesystem, so publishing a
+        # cached render is a hardlink, but outside the public /generated mount
+        output_dir = Path(settings.VIDEO_OUTPUT_DIR)
+        self.root = Path(root or settings.RENDER_CACHE_DIR or output_dir.parent / f"{output_dir.name}_cache")
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes or settings.RENDER_CACHE_MAX_BYTES
+        self._lock = threading.Lock()
+        self._index: "OrderedDict[str, int]" = OrderedDict()  # key -> size, least recent first
+        self._total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._load_index()
+
+    @staticmethod
+    def make_key(
+        script: str,
+        language: str,
+        voice_id: Optional[str],
+        avatar_id: Optional[int],
+        resolution: str,
+        encoder_profile: str
+    ) -> str:
+        """cache key for everything that changes the rendered output"""
+        return stable_digest({
+            "script": script,
+            "language": language,
+            "voice_id": voice_id,
+            "avatar_id": avatar_id,
+            "resolution": resolution,
+            "encoder_profile": encoder_profile
+        })
+
+    def path_for(self, key: str) -> Path:
+        return self.root / f"{key}.mp4"
+
+    def scratch_path(self, suffix: str = ".mp4") -> Path:
+        """unique temp path on the cache filesystem, so put() can rename it into place"""
+        return self.root / f".tmp_{uuid.uuid4().hex}{suffix}"
+
+    def is_scratch(self, path: str) -> bool:
+        """true for render output that never made it into the cache"""
+        return Path(path).name.startswith(".tmp_")
+
+    def get(self, key: str) -> Optional[str]:
+        """return the cached artifact for a key, or None"""
+        path = self.path_for(key)
+        with self._lock:
+            if key in self._index:
+                if path.exists():
+                    self._index.move_to_end(key)
+                    self.hits += 1
+                    self._touch(path)
+                    return str(path)
+                # removed behind our back
+                self._total_bytes -= self._index.pop(key)
+            elif path.exists():
+                # rendered by another worker sharing the cache directory
+                self._add(key, self._bundle_size(key))
+                self.hits += 1
+                return str(path)
+            self.misses += 1
+            return None
+
+    def put(self, key: str, source_path: str) -> str:
+        """move a finished render (and its sidecar files) into the cache; returns the cached path"""
+        path = self.path_for(key)
+        source = Path(source_path)
+        # sidecars share the render's stem, e.g. <stem>.timing.json; the video goes
+        # last so a visible cache entry always has its sidecars in place
+        sidecars = [
+            sidecar for sidecar in source.parent.glob(f"{source.stem}.*")
+            if sidecar != source and not sidecar.name.endswith(".part")
+        ]
+        for sidecar in sidecars + [source]:
+            self._move_in(sidecar, self.root / f"{key}{sidecar.name[len(source.stem):]}")
+
+        with self._lock:
+            if key in self._index:
+                self._total_bytes -= self._index.pop(key)
+            self._add(key, self._bundle_size(key))
+            self._evict()
+        return str(path)
+
+    def _move_in(self, source: Path, target: Path):
+        # same filesystem: a rename; otherwise copied next to the target first
+        publish_file(str(source), str(target), move=True)
+
+    def _bundle_files(self, key: str):
+        return [path for path in self.root.glob(f"{key}.*")]
+
+    def _bundle_size(self, key: str) -> int:
+        total = 0
+        for path in self._bundle_files(key):
+            try:
+                total += path.stat().st_size
+            except OSError:
+                pass
+        return total
+
+    def unshared_bytes(self, key: str) -> int:
+        """bytes evicting an entry would free: files still hardlinked to a published video stay on disk"""
+        total = 0
+        for path in self._bundle_files(key):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            if stat.st_nlink <= 1:
+                total += stat.st_size
+        return total
+
+    def lru_entries(self) -> List[Tuple[str, int]]:
+        """(key, bytes) of every entry, least recently used first"""
+        with self._lock:
+            return list(self._index.items())
+
+    def remove(self, key: str) -> int:
+        """evict one entry and its sidecars; returns the bytes freed"""
+        with self._lock:
+            size = self._index.pop(key, None)
+            if size is None:
+                return 0
+            self._total_bytes -= size
+            self.evictions += 1
+            self._unlink_bundle(key)
+        return size
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._index),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions
+            }
+
+    def _add(self, key: str, size: int):
+        self._index[key] = size
+        self._total_bytes += size
+
+    def _evict(self):
+        # always keep the newest entry, even if it alone exceeds the budget
+        while self._total_bytes > self.max_bytes and len(self._index) > 1:
+            key, size = self._index.popitem(last=False)
+            self._total_bytes -= size
+            self.evictions += 1
+            self._unlink_bundle(key)
+
+    def _unlink_bundle(self, key: str):
+        for bundle_file in self._bundle_files(key):
+            try:
+                bundle_file.unlink()
+            except OSError:
+                pass
+
+    def _touch(self, path: Path):
+        # mtime carries the lru order across restarts
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+
+    def _load_index(self):
+        entries = []
+        for path in self.root.glob("*"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            if path.name.startswith(".tmp_"):
+                # scratch output of a render that died mid-way
+                if time.time() - stat.st_mtime > 3600:
+                    try:
+                        path.unlink()
+                    except OSError:
+                        pass
+                continue
+            if path.suffix == ".mp4" and "." not in path.stem:
+                # <key>.mp4; sidecar videos such as <key>.720p.mp4 belong to its bundle
+                entries.append((stat.st_mtime, path.stem))
+        for _, key in sorted(entries):
+            self._add(key, self._bundle_size(key))
+        self._evict()
+
+# create global instance
+render_cache = RenderCache()
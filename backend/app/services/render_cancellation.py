@@ -0,0 +1,103 @@
+import os
+import signal
+import subprocess
+import threading
+from typing import Dict, Set
+
+
+class RenderCancelled(Exception):
+    """raised on the render thread once its render has been cancelled"""
+
+
+def process_group_kwargs() -> Dict:
+    """popen arguments that start a subprocess in its own process group"""
+    if os.name == "nt":
+        return {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP}
+    return {"start_new_session": True}
+
+
+def kill_process_group(process: subprocess.Popen):
+    """kill a subprocess started with process_group_kwargs and everything it spawned"""
+    if process.poll() is not None:
+        return
+    try:
+        if os.name == "nt":
+            process.kill()
+        else:
+            os.killpg(process.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass  # exited in the meantime
+
+
+class CancelToken:
+    """cancellation flag of one render and the subprocesses it is waiting on
+
+    cancel() may be called from any thread; it kills the attached process groups
+    right away, so the render thread wakes up as soon as ffmpeg is gone
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._processes: Set[subprocess.Popen] = set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self):
+        with self._lock:
+            self._event.set()
+            processes = list(self._processes)
+        for process in processes:
+            kill_process_group(process)
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise RenderCancelled("render was cancelled")
+
+    def attach(self, process: subprocess.Popen):
+        """kill process along with the render; killed at once if already cancelled"""
+        with self._lock:
+            if not self._event.is_set():
+                self._processes.add(process)
+                return
+        kill_process_group(process)
+
+    def detach(self, process: subprocess.Popen):
+        with self._lock:
+            self._processes.discard(process)
+
+
+class RenderCancellation:
+    """cancel tokens of the renders running in this process, by video id"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tokens: Dict[int, CancelToken] = {}
+
+    def open(self, video_id: int) -> CancelToken:
+        """token for a render that is starting; replaces the token of an older render"""
+        token = CancelToken()
+        with self._lock:
+            self._tokens[video_id] = token
+        return token
+
+    def close(self, video_id: int, token: CancelToken):
+        """forget a finished render, unless a newer render of the video took its place"""
+        with self._lock:
+            if self._tokens.get(video_id) is token:
+                del self._tokens[video_id]
+
+    def cancel(self, video_id: int) -> bool:
+        """cancel the render of a video; False if it isn't running in this process"""
+        with self._lock:
+            token = self._tokens.get(video_id)
+        if token is None:
+            return False
+        token.cancel()
+        return True
+
+
+# create global instance
+render_cancellation = RenderCancellation()
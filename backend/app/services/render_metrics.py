@@ -0,0 +1,41 @@
+import threading
+from collections import defaultdict, deque
+from typing import Dict
+
+
+class RenderMetrics:
+    """in-process counters and timing summaries for the render pipeline"""
+
+    def __init__(self, window: int = 1000):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = defaultdict(float)
+        self._timings: Dict[str, deque] = defaultdict(lambda: deque(maxlen=window))
+        self._timing_counts: Dict[str, int] = defaultdict(int)
+
+    def increment(self, name: str, value: float = 1):
+        with self._lock:
+            self._counters[name] += value
+
+    def observe(self, name: str, value: float):
+        """record one sample of a timing, e.g. seconds to first frame"""
+        with self._lock:
+            self._timings[name].append(value)
+            self._timing_counts[name] += 1
+
+    def snapshot(self) -> Dict:
+        """counters plus count/avg/p50/p95 over the recent window of each timing"""
+        with self._lock:
+            timings = {}
+            for name, samples in self._timings.items():
+                ordered = sorted(samples)
+                timings[name] = {
+                    "count": self._timing_counts[name],
+                    "last": round(samples[-1], 4),
+                    "avg": round(sum(ordered) / len(ordered), 4),
+                    "p50": round(ordered[len(ordered) // 2], 4),
+                    "p95": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 4)
+                }
+            return {"counters": dict(self._counters), "timings": timings}
+
+# create global instance
+render_metrics = RenderMetrics()
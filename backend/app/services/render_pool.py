@@ -0,0 +1,116 @@
+import asyncio
+import functools
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Optional, Set
+
+from app.core.config import settings
+from app.services.render_cancellation import RenderCancelled
+
+
+def _prewarm_worker():
+    """import the heavy media libraries before the first render
+
+    imports are shared by the whole process, so only the first worker to start
+    pays for them; the others find the modules loaded already
+    """
+    for module_name in ("gtts",):
+        try:
+            __import__(module_name)
+        except Exception as e:
+            print(f"render worker could not preload {module_name}: {str(e)}")
+
+
+def _hold(barrier: threading.Barrier):
+    """park a worker until every slot has been spawned"""
+    try:
+        barrier.wait(timeout=30)
+    except threading.BrokenBarrierError:
+        pass
+
+
+class RenderPool:
+    """bounded worker pool that keeps blocking render work off the event loop"""
+
+    def __init__(self, max_workers: Optional[int] = None):
+        self.max_workers = max(1, max_workers or settings.RENDER_WORKERS)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._pending: Set[Future] = set()
+        self._completed = 0
+        self._failed = 0
+        self._cancelled = 0
+
+    def start(self):
+        """create the executor and spin up every worker ahead of the first job"""
+        with self._lock:
+            if self._executor is not None:
+                return
+            executor = self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers,
+                thread_name_prefix="render",
+                initializer=_prewarm_worker if settings.RENDER_PREWARM else None
+            )
+        # the executor only spawns threads on submit and reuses idle ones, so
+        # hold each warmup task until all slots exist
+        barrier = threading.Barrier(self.max_workers)
+        warmups = [executor.submit(_hold, barrier) for _ in range(self.max_workers)]
+        for future in warmups:
+            future.result()
+        print(f"render pool started with {self.max_workers} slots")
+
+    def shutdown(self, wait: bool = False):
+        """stop accepting work and release the worker threads"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=True)
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        """queue a blocking callable on the pool"""
+        if self._executor is None:
+            self.start()
+        with self._lock:
+            # read under the lock: shutdown may clear it at any time
+            executor = self._executor
+            if executor is None:
+                raise RuntimeError("render pool not started")
+            future = executor.submit(fn, *args, **kwargs)
+            self._pending.add(future)
+        future.add_done_callback(self._on_done)
+        return future
+
+    async def run(self, fn: Callable, *args, **kwargs):
+        """await a blocking callable without stalling the event loop"""
+        future = self.submit(functools.partial(fn, *args, **kwargs))
+        return await asyncio.wrap_future(future)
+
+    def _on_done(self, future: Future):
+        with self._lock:
+            self._pending.discard(future)
+            if future.cancelled() or isinstance(future.exception(), RenderCancelled):
+                self._cancelled += 1
+            elif future.exception() is not None:
+                self._failed += 1
+            else:
+                self._completed += 1
+
+    def stats(self) -> Dict:
+        """queue depth and slot usage for sizing the pool per node"""
+        with self._lock:
+            active = sum(1 for future in self._pending if future.running())
+            queued = len(self._pending) - active
+            return {
+                "slots": self.max_workers,
+                "active": active,
+                "idle": self.max_workers - active,
+                "queued": queued,
+                "completed": self._completed,
+                "failed": self._failed,
+                "cancelled": self._cancelled,
+                "started": self._executor is not None
+            }
+
+
+# create global instance
+render_pool = RenderPool()
@@ -0,0 +1,151 @@
+import math
+from pathlib import Path
+from typing import Dict, List
+
+from app.core.config import settings
+from app.services.file_publisher import publish_file
+
+# preview sidecars of a render, named <video stem>.<suffix>
+PREVIEW_SUFFIXES = {
+    "poster": ".poster.jpg",
+    "sprite": ".sprite.jpg",
+    "sprite_vtt": ".sprite.vtt"
+}
+# names inside the per-video directory under /generated; the vtt refers to the
+# sprite by its relative name, so one cached vtt works for every video id
+PUBLISHED_NAMES = {"poster": "poster.jpg", "sprite": "sprite.jpg", "sprite_vtt": "sprite.vtt"}
+
+POSTER_SECONDS = 1.0  # poster frame offset, clamped to the middle of short videos
+REQUIRED_FILTERS = {"split", "trim", "setpts", "fps", "scale", "tile"}
+
+
+class PreviewLayout:
+    """where the poster frame is taken and how the scrub sprite is tiled"""
+
+    def __init__(self, duration: float, resolution: str, static: bool = False):
+        self.duration = duration
+        self.tile_width, self.tile_height = tile_size(resolution)
+        # a static picture needs only one tile, every cue points at it
+        self.static = static
+        # long videos get a wider interval so the sheet stays a single image
+        self.interval = max(settings.SPRITE_INTERVAL_SECONDS, duration / settings.SPRITE_MAX_TILES)
+        self.tiles = max(1, int(math.ceil(duration / self.interval)))
+        self.columns = min(settings.SPRITE_COLUMNS, self.tiles)
+        self.rows = int(math.ceil(self.tiles / float(self.columns)))
+        self.poster_seconds = min(POSTER_SECONDS, duration / 2.0)
+
+
+def tile_size(resolution: str):
+    """sprite tile size for a video resolution, at the configured tile width"""
+    width, height = (int(value) for value in resolution.split("x"))
+    tile_width = settings.SPRITE_TILE_WIDTH
+    # even height keeps the scaler and jpeg encoder happy
+    return tile_width, max(2, int(round(tile_width * height / width / 2.0)) * 2)
+
+
+def supported(profile) -> bool:
+    """true when this ffmpeg build can write previews alongside the video"""
+    return (
+        settings.RENDER_PREVIEWS
+        and profile.available
+        and "mjpeg" in profile.encoders
+        and "image2" in profile.muxers
+        and REQUIRED_FILTERS <= profile.filters
+    )
+
+
+def signature(profile) -> str:
+    """preview settings as a cache key component; renders made with other settings differ"""
+    if not supported(profile):
+        return "no-previews"
+    return f"previews:{settings.SPRITE_INTERVAL_SECONDS}:{settings.SPRITE_TILE_WIDTH}:{settings.SPRITE_COLUMNS}"
+
+
+def preview_paths(media_path: str) -> Dict[str, Path]:
+    media = Path(media_path)
+    return {name: media.with_name(f"{media.stem}{suffix}") for name, suffix in PREVIEW_SUFFIXES.items()}
+
+
+# split outputs the preview chains read from
+BRANCHES = ["poster_in", "sprite_in"]
+
+
+def filter_chains(layout: PreviewLayout) -> List[str]:
+    """filter chains turning two branches of the split picture into the poster and the sprite"""
+    poster = f"[poster_in]trim=start={layout.poster_seconds:.3f},setpts=PTS-STARTPTS[poster]"
+    sprite = (
+        f"[sprite_in]trim=duration={layout.duration:.3f},fps=1/{layout.interval:.3f},"
+        f"scale={layout.tile_width}:{layout.tile_height},tile={layout.columns}x{layout.rows}[sprite]"
+    )
+    return [poster, sprite]
+
+
+def output_args(layout: PreviewLayout, media_path: str) -> List[str]:
+    """extra ffmpeg outputs for the preview images, appended after the video output"""
+    paths = preview_paths(media_path)
+    return [
+        '-map', '[poster]', '-frames:v', '1', '-q:v', '3', str(paths["poster"]),
+        '-map', '[sprite]', '-frames:v', '1', '-q:v', '5', str(paths["sprite"])
+    ]
+
+
+def write_sprite_vtt(layout: PreviewLayout, media_path: str):
+    """webvtt index mapping each time range to its tile in the sprite sheet"""
+    lines = ["WEBVTT", ""]
+    for index in range(layout.tiles):
+        start = index * layout.interval
+        end = min((index + 1) * layout.interval, layout.duration)
+        if layout.static:
+            x = y = 0
+        else:
+            x = (index % layout.columns) * layout.tile_width
+            y = (index // layout.columns) * layout.tile_height
+        lines += [
+            f"{_timestamp(start)} --> {_timestamp(end)}",
+            f"{PUBLISHED_NAMES['sprite']}#xywh={x},{y},{layout.tile_width},{layout.tile_height}",
+            ""
+        ]
+    preview_paths(media_path)["sprite_vtt"].write_text("\n".join(lines), encoding="utf-8")
+
+
+def link_static_previews(poster: str, tile: str, duration: float, resolution: str, media_path: str):
+    """previews of a render whose picture never changes, without decoding anything
+
+    the poster and the single sprite tile come from the background they were built
+    with; only the vtt depends on the duration of this render
+    """
+    paths = preview_paths(media_path)
+    publish_file(poster, str(paths["poster"]))
+    publish_file(tile, str(paths["sprite"]))
+    write_sprite_vtt(PreviewLayout(duration, resolution, static=True), media_path)
+
+
+def discard(media_path: str):
+    """drop partial previews of a failed encode so they never reach the cache"""
+    for path in preview_paths(media_path).values():
+        path.unlink(missing_ok=True)
+
+
+def publish_previews(media_path: str, target_dir: str, move: bool = False) -> Dict[str, str]:
+    """publish the previews of a render into target_dir; returns name -> published path"""
+    published = {}
+    for name, path in preview_paths(media_path).items():
+        if not path.exists():
+            continue
+        target = Path(target_dir) / PUBLISHED_NAMES[name]
+        publish_file(str(path), str(target), move=move)
+        published[name] = str(target)
+    # a sprite without its index (or the reverse) is useless to a player
+    if ("sprite" in published) != ("sprite_vtt" in published):
+        for name in ("sprite", "sprite_vtt"):
+            if name in published:
+                Path(published.pop(name)).unlink(missing_ok=True)
+    return published
+
+
+def _timestamp(seconds: float) -> str:
+    millis = int(round(seconds * 1000))
+    hours, millis = divmod(millis, 3600000)
+    minutes, millis = divmod(millis, 60000)
+    secs, millis = divmod(millis, 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}.{millis:03d}"
@@ -0,0 +1,142 @@
+import asyncio
+import os
+import socket
+import uuid
+from typing import Awaitable, Callable, Dict, Optional, Set
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.services.job_queue import JobQueue, job_queue
+from app.services.render_cancellation import RenderCancelled, render_cancellation
+
+
+class RenderWorker:
+    """polls the render queue, holds leases while jobs run and reports the outcome"""
+
+    def __init__(
+        self,
+        handler: Callable[[int], Awaitable[None]],
+        queue: JobQueue = job_queue,
+        concurrency: Optional[int] = None,
+        poll_interval: Optional[float] = None
+    ):
+        self.handler = handler
+        self.queue = queue
+        self.concurrency = max(1, concurrency or settings.RENDER_WORKERS)
+        self.poll_interval = poll_interval or settings.RENDER_QUEUE_POLL_SECONDS
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self._running: Dict[int, asyncio.Task] = {}
+        self._videos: Dict[int, int] = {}  # video id of each running job
+        self._revoked: Set[int] = set()
+        self._loop_task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    def start(self):
+        """run the polling loop on the current event loop"""
+        if self._loop_task is None:
+            self._stopping = False
+            self._loop_task = asyncio.create_task(self.run())
+            print(f"render worker {self.worker_id} started")
+
+    async def stop(self):
+        """stop leasing new jobs; running jobs keep their leases until they expire"""
+        self._stopping = True
+        if self._loop_task is not None:
+            self._loop_task.cancel()
+            try:
+                await self._loop_task
+            except asyncio.CancelledError:
+                pass
+            self._loop_task = None
+
+    async def run(self):
+        """lease jobs until stopped, never holding more than `concurrency` at once"""
+        sweep_every = max(1.0, self.queue.lease_seconds / 2)
+        last_sweep = 0.0
+        loop = asyncio.get_running_loop()
+
+        while not self._stopping:
+            try:
+                if loop.time() - last_sweep >= sweep_every:
+                    self._with_session(self.queue.requeue_expired)
+                    last_sweep = loop.time()
+
+                if self._running:
+                    # cancelled or deleted elsewhere: stop the render instead of finishing it
+                    for job_id in self._with_session(self.queue.revoked, list(self._running), self.worker_id):
+                        self._revoke(job_id)
+
+                leased_any = False
+                while len(self._running) < self.concurrency:
+                    job = self._with_session(self.queue.lease, self.worker_id)
+                    if job is None:
+                        break
+                    leased_any = True
+                    self._videos[job.id] = job.video_id
+                    self._running[job.id] = asyncio.create_task(self._process(job.id, job.video_id))
+
+                if not leased_any:
+                    await asyncio.sleep(self.poll_interval)
+                else:
+                    await asyncio.sleep(0)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"render worker {self.worker_id} poll error: {str(e)}")
+                await asyncio.sleep(self.poll_interval)
+
+    async def _process(self, job_id: int, video_id: int):
+        heartbeat = asyncio.create_task(self._heartbeat(job_id))
+        try:
+            await self.handler(video_id)
+        except RenderCancelled as e:
+            print(f"render job {job_id} for video {video_id} was cancelled")
+            if job_id not in self._revoked:
+                # stopped along with an older render of the same video; run it again
+                self._with_session(self.queue.fail, job_id, self.worker_id, str(e))
+        except Exception as e:
+            print(f"render job {job_id} for video {video_id} failed: {str(e)}")
+            retrying = self._with_session(self.queue.fail, job_id, self.worker_id, str(e))
+            if retrying:
+                print(f"render job {job_id} will be retried")
+        else:
+            self._with_session(self.queue.complete, job_id, self.worker_id)
+        finally:
+            heartbeat.cancel()
+            self._running.pop(job_id, None)
+            self._videos.pop(job_id, None)
+            self._revoked.discard(job_id)
+
+    def _revoke(self, job_id: int):
+        if job_id in self._revoked or job_id not in self._videos:
+            return
+        self._revoked.add(job_id)
+        if render_cancellation.cancel(self._videos[job_id]):
+            print(f"render worker {self.worker_id} cancelled job {job_id}")
+
+    async def _heartbeat(self, job_id: int):
+        interval = max(1.0, self.queue.lease_seconds / 3)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                if not self._with_session(self.queue.heartbeat, job_id, self.worker_id):
+                    print(f"render worker {self.worker_id} lost the lease on job {job_id}")
+                    self._revoke(job_id)
+                    return
+            except Exception as e:
+                print(f"heartbeat failed for render job {job_id}: {str(e)}")
+
+    def _with_session(self, fn, *args):
+        db = SessionLocal()
+        try:
+            return fn(db, *args)
+        finally:
+            db.close()
+
+    def stats(self) -> Dict:
+        """jobs currently leased by this worker"""
+        return {
+            "worker_id": self.worker_id,
+            "concurrency": self.concurrency,
+            "running_jobs": sorted(self._running.keys())
+        }
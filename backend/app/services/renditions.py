@@ -0,0 +1,103 @@
+import re
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+
+# name -> (width, height); widths are even so every rendition encodes as yuv420p
+RENDITION_SIZES = {
+    "360p": (640, 360),
+    "480p": (848, 480),
+    "720p": (1280, 720),
+    "1080p": (1920, 1080),
+    "1440p": (2560, 1440),
+    "2160p": (3840, 2160)
+}
+LIMIT_ALIASES = {"4k": "2160p", "uhd": "2160p", "fhd": "1080p", "hd": "720p", "sd": "480p"}
+
+
+class Rendition:
+    """one output size of a render"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.width, self.height = RENDITION_SIZES[name]
+
+    @property
+    def resolution(self) -> str:
+        return f"{self.width}x{self.height}"
+
+    def __repr__(self):
+        return f"<Rendition({self.name}, {self.resolution})>"
+
+
+def parse_limit(limit: Optional[str]) -> Optional[int]:
+    """max height of a resolution limit such as "1080p" or "4K"; None if unreadable"""
+    if not limit:
+        return None
+    name = LIMIT_ALIASES.get(limit.strip().lower(), limit.strip().lower())
+    if name in RENDITION_SIZES:
+        return RENDITION_SIZES[name][1]
+    match = re.fullmatch(r"(\d+)p?", name)
+    return int(match.group(1)) if match else None
+
+
+def ladder_for(limit: Optional[str]) -> List[Rendition]:
+    """configured ladder entries allowed by a resolution limit, smallest first
+
+    the first entry is always kept, so a render never ends up with no video at all
+    """
+    ladder = sorted(
+        (Rendition(name) for name in settings.RENDITION_LADDER if name in RENDITION_SIZES),
+        key=lambda rendition: rendition.height
+    )
+    if not ladder:
+        ladder = [Rendition("360p")]
+    max_height = parse_limit(limit)
+    if max_height is None:
+        return ladder
+    return [rendition for rendition in ladder if rendition.height <= max_height] or ladder[:1]
+
+
+def resolution_limit_for(db: Session, user) -> str:
+    """the user's resolution cap: an active subscription's limit, else their tier's default"""
+    from app.models.subscription import Subscription
+
+    limits = settings.TIER_RESOLUTION_LIMITS
+    if user is None:
+        return limits.get("free", "360p")
+    now = datetime.utcnow()
+    subscription = db.query(Subscription).filter(
+        Subscription.user_id == user.id,
+        Subscription.status == "active",
+        or_(Subscription.end_date.is_(None), Subscription.end_date > now)
+    ).order_by(Subscription.start_date.desc()).first()
+    if subscription and subscription.resolution_limit:
+        return subscription.resolution_limit
+
+    return limits.get(user.subscription_tier or "free", limits.get("free", "360p"))
+
+
+def rendition_path(media_path: str, name: str) -> Path:
+    """sidecar file of an extra rendition, <video stem>.<name>.mp4"""
+    media = Path(media_path)
+    return media.with_name(f"{media.stem}.{name}.mp4")
+
+
+def discard(media_path: str, names: List[str]):
+    """drop partial renditions of a failed encode so they never reach the cache"""
+    for name in names:
+        rendition_path(media_path, name).unlink(missing_ok=True)
+
+
+def describe(renditions: List[Rendition], urls: Dict[str, str]) -> List[Dict]:
+    """what gets stored on the video row: one entry per published rendition, largest first"""
+    return [
+        {"name": rendition.name, "resolution": rendition.resolution, "url": urls[rendition.name]}
+        for rendition in sorted(renditions, key=lambda rendition: rendition.height, reverse=True)
+        if rendition.name in urls
+    ]
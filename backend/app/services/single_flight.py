@@ -0,0 +1,115 @@
+import asyncio
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from app.services.render_cancellation import CancelToken, RenderCancelled
+from app.services.render_metrics import render_metrics
+
+
+class _Abandoned(Exception):
+    """the leading call gave up for reasons of its own, so a waiting caller runs it instead"""
+
+
+class SingleFlight:
+    """at most one call per key in flight; identical calls arriving meanwhile share its result
+
+    works across threads and event loops alike: the shared result is a concurrent
+    future, which coroutines await through asyncio.wrap_future. when the leading call
+    is cancelled (RenderCancelled, or its task cancelled), a caller that was waiting
+    takes over instead of inheriting the cancellation, and likewise when the result
+    is one only its own caller may use. every caller that attached to another's call
+    counts towards the <name>_coalesced metric
+    """
+
+    ABANDONING = (RenderCancelled, asyncio.CancelledError)
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls: Dict[str, Future] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    def do(
+        self,
+        key: str,
+        fn: Callable[[], Any],
+        cancel: Optional[CancelToken] = None,
+        shareable: Optional[Callable[[Any], bool]] = None
+    ) -> Any:
+        """fn(), or the result of the identical call already running; cancel stops a wait
+
+        a result for which shareable(result) is false goes to its own caller only
+        """
+        while True:
+            future, leader = self._join(key)
+            if leader:
+                try:
+                    result = fn()
+                except BaseException as e:
+                    self._settle(key, future, error=e)
+                    raise
+                if shareable is not None and not shareable(result):
+                    self._settle(key, future, error=_Abandoned())
+                else:
+                    self._settle(key, future, result)
+                return result
+            try:
+                return self._wait(future, cancel)
+            except _Abandoned:
+                continue
+
+    async def do_async(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """await fn(), or the result of the identical call already running"""
+        while True:
+            future, leader = self._join(key)
+            if leader:
+                try:
+                    result = await fn()
+                except BaseException as e:
+                    self._settle(key, future, error=e)
+                    raise
+                self._settle(key, future, result)
+                return result
+            try:
+                # shielded: a waiter being cancelled must not cancel the shared call
+                return await asyncio.shield(asyncio.wrap_future(future))
+            except _Abandoned:
+                continue
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"in_flight": len(self._calls), "leaders": self.leaders, "coalesced": self.coalesced}
+
+    def _join(self, key: str) -> Tuple[Future, bool]:
+        with self._lock:
+            future = self._calls.get(key)
+            if future is None:
+                future = self._calls[key] = Future()
+                self.leaders += 1
+                return future, True
+            self.coalesced += 1
+        render_metrics.increment(f"{self.name}_coalesced")
+        return future, False
+
+    def _settle(self, key: str, future: Future, result: Any = None, error: Optional[BaseException] = None):
+        # out of the table first, so a caller retrying after an abandoned call starts a new one
+        with self._lock:
+            self._calls.pop(key, None)
+        if error is None:
+            future.set_result(result)
+        elif isinstance(error, self.ABANDONING + (_Abandoned,)):
+            future.set_exception(_Abandoned())
+        else:
+            future.set_exception(error)
+
+    @staticmethod
+    def _wait(future: Future, cancel: Optional[CancelToken]) -> Any:
+        if cancel is None:
+            return future.result()
+        while True:
+            try:
+                return future.result(timeout=0.1)
+            except FutureTimeout:
+                cancel.raise_if_cancelled()
@@ -0,0 +1,263 @@
+import os
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import func, or_
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.services.render_cache import render_cache
+from app.services.render_metrics import render_metrics
+from app.services.tts_segments import segment_store
+
+# files in the output directory that only exist on the way to a published video
+INTERMEDIATE_PATTERNS = ("audio_*", ".*.part")
+
+
+def _lower_priority():
+    """run the calling thread at the lowest cpu priority the os allows"""
+    try:
+        # linux applies nice values per thread
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)
+    except (AttributeError, OSError):
+        pass  # windows, or not permitted
+
+
+def _file_size(path: Path) -> int:
+    try:
+        return path.stat().st_size
+    except OSError:
+        return 0
+
+
+def _tree_size(root: Path, seen: Optional[Set[Tuple[int, int]]] = None) -> int:
+    """bytes of the files under root; with seen, a file hardlinked elsewhere in the walk counts once"""
+    total = 0
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            try:
+                stat = (Path(dirpath) / name).stat()
+            except OSError:
+                continue
+            if seen is not None:
+                if (stat.st_dev, stat.st_ino) in seen:
+                    continue
+                seen.add((stat.st_dev, stat.st_ino))
+            total += stat.st_size
+    return total
+
+
+def _unlink(path: Path) -> int:
+    size = _file_size(path)
+    try:
+        path.unlink()
+        return size
+    except OSError:
+        return 0
+
+
+class StorageManager:
+    """keeps a node's disk use bounded
+
+    published videos belong to their owners and count against the owner's quota;
+    tts audio and scratch renders expire after a ttl; render cache entries and tts
+    segments are evicted least recently used first whenever the output and cache
+    directories together go over the node budget. a low-priority thread sweeps
+    every STORAGE_SWEEP_INTERVAL_SECONDS
+    """
+
+    def __init__(
+        self,
+        interval: Optional[int] = None,
+        intermediate_ttl_hours: Optional[int] = None,
+        node_budget_bytes: Optional[int] = None
+    ):
+        self.output_dir = Path(settings.VIDEO_OUTPUT_DIR)
+        self.interval = interval or settings.STORAGE_SWEEP_INTERVAL_SECONDS
+        self.intermediate_ttl = (intermediate_ttl_hours or settings.STORAGE_INTERMEDIATE_TTL_HOURS) * 3600
+        self.node_budget_bytes = node_budget_bytes or settings.STORAGE_NODE_BUDGET_BYTES
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.sweeps = 0
+        self.node_bytes = 0
+        self.last_sweep_at: Optional[datetime] = None
+        self.last_sweep_seconds = 0.0
+
+    def start(self):
+        """start the background sweeper; the first sweep runs right away"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="storage-sweeper", daemon=True)
+        self._thread.start()
+
+    def shutdown(self):
+        """stop the sweeper after the sweep in progress, if any"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        self._stop.set()
+        if thread is not None:
+            thread.join(timeout=5)
+
+    def _run(self):
+        _lower_priority()
+        while not self._stop.is_set():
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"storage sweep failed: {str(e)}")
+            self._stop.wait(self.interval)
+
+    def sweep(self) -> Dict:
+        """expire intermediates, then evict cold cache entries until the node is within budget"""
+        started = time.monotonic()
+        expired = self.expire_intermediates()
+        evicted = self.enforce_budget()
+        with self._lock:
+            self.sweeps += 1
+            self.last_sweep_at = datetime.utcnow()
+            self.last_sweep_seconds = round(time.monotonic() - started, 3)
+        if expired or evicted:
+            print(f"storage sweep reclaimed {expired} bytes of intermediates and {evicted} bytes of cache")
+        return {"expired_bytes": expired, "evicted_bytes": evicted, "node_bytes": self.node_bytes}
+
+    def expire_intermediates(self) -> int:
+        """remove tts audio, scratch renders and half-published files older than the ttl"""
+        cutoff = time.time() - self.intermediate_ttl
+        candidates: List[Path] = []
+        for pattern in INTERMEDIATE_PATTERNS:
+            candidates += self.output_dir.glob(pattern)
+        candidates += render_cache.root.glob(".tmp_*")
+
+        freed = 0
+        for path in candidates:
+            try:
+                if not path.is_file() or path.stat().st_mtime >= cutoff:
+                    continue
+            except OSError:
+                continue
+            freed += _unlink(path)
+        freed += segment_store.expire()
+        render_metrics.increment("storage_reclaimed_bytes_ttl", freed)
+        return freed
+
+    def enforce_budget(self) -> int:
+        """evict render cache entries and tts segments, least recently used first, until within budget"""
+        self.node_bytes = self.node_usage()
+        excess = self.node_bytes - self.node_budget_bytes
+        if excess <= 0:
+            return 0
+
+        freed = 0
+        for _, kind, item in self._cold_artifacts():
+            if freed >= excess:
+                break
+            if kind == "render":
+                # an entry still linked to a published video frees nothing, so it stays
+                unshared = render_cache.unshared_bytes(item)
+                if unshared:
+                    render_cache.remove(item)
+                    freed += unshared
+            else:
+                freed += segment_store.remove(item)
+        if freed:
+            before = self.node_bytes
+            self.node_bytes = self.node_usage()
+            freed = max(0, before - self.node_bytes)
+        render_metrics.increment("storage_reclaimed_bytes_lru", freed)
+        if self.node_bytes > self.node_budget_bytes:
+            print(f"storage is {self.node_bytes - self.node_budget_bytes} bytes over budget with nothing left to evict")
+        return freed
+
+    def _cold_artifacts(self) -> List[Tuple[float, str, object]]:
+        """every evictable artifact with its last use, oldest first
+
+        the newest render cache entry is kept, as the cache itself does
+        """
+        artifacts = []
+        for key, _ in render_cache.lru_entries()[:-1]:
+            try:
+                artifacts.append((render_cache.path_for(key).stat().st_mtime, "render", key))
+            except OSError:
+                continue
+        for key, path in segment_store.lru_entries():
+            try:
+                artifacts.append((path.stat().st_mtime, "segment", key))
+            except OSError:
+                continue
+        artifacts.sort(key=lambda artifact: artifact[0])
+        return artifacts
+
+    def node_usage(self) -> int:
+        """bytes under the output and cache directories, each file counted once"""
+        # published videos are hardlinks to cache entries where the filesystem allows
+        seen: Set[Tuple[int, int]] = set()
+        return sum(_tree_size(root, seen) for root in self._roots())
+
+    def _roots(self) -> Iterable[Path]:
+        # the segment store and background library default to folders inside the cache
+        roots = []
+        for root in sorted({self.output_dir.resolve(), render_cache.root.resolve(), segment_store.root.resolve()}):
+            if not any(parent in roots for parent in root.parents):
+                roots.append(root)
+        return roots
+
+    def video_bytes(self, video_id: int) -> int:
+        """disk held by a published video: the main file plus its renditions, stream and previews"""
+        return _file_size(self.output_dir / f"{video_id}.mp4") + _tree_size(self.output_dir / str(video_id))
+
+    def user_usage(self, db: Session, user_id: int) -> int:
+        """bytes of published videos a user owns"""
+        from app.models.video import Video
+
+        used = db.query(func.sum(func.coalesce(Video.storage_bytes, Video.file_size, 0))).filter(
+            Video.user_id == user_id
+        ).scalar()
+        return int(used or 0)
+
+    def storage_limit_for(self, db: Session, user) -> Optional[int]:
+        """the user's quota in bytes: an active subscription's limit, else their tier's; None is unlimited"""
+        from app.models.subscription import Subscription
+
+        limits = settings.TIER_STORAGE_LIMITS_MB
+        now = datetime.utcnow()
+        subscription = db.query(Subscription).filter(
+            Subscription.user_id == user.id,
+            Subscription.status == "active",
+            or_(Subscription.end_date.is_(None), Subscription.end_date > now)
+        ).order_by(Subscription.start_date.desc()).first()
+        if subscription and subscription.storage_limit is not None:
+            limit_mb = subscription.storage_limit
+        else:
+            limit_mb = limits.get(user.subscription_tier or "free", limits.get("free", -1))
+        if limit_mb is None or limit_mb < 0:
+            return None
+        return limit_mb * 1024 * 1024
+
+    def quota(self, db: Session, user) -> Dict:
+        used = self.user_usage(db, user.id)
+        limit = self.storage_limit_for(db, user)
+        return {
+            "used_bytes": used,
+            "limit_bytes": limit,
+            "over_quota": limit is not None and used >= limit
+        }
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "node_bytes": self.node_bytes,
+                "node_budget_bytes": self.node_budget_bytes,
+                "sweeps": self.sweeps,
+                "last_sweep_at": self.last_sweep_at.isoformat() if self.last_sweep_at else None,
+                "last_sweep_seconds": self.last_sweep_seconds,
+                "running": self._thread is not None
+            }
+
+# create global instance
+storage_manager = StorageManager()
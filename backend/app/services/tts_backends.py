@@ -0,0 +1,305 @@
+import asyncio
+import os
+import re
+import wave
+import weakref
+import zlib
+from abc import ABC, abstractmethod
+from typing import Dict, FrozenSet, List, Optional
+
+from app.core.config import settings
+from app.services.provider_http import provider_clients
+from app.services.tts_segments import PROVIDER_MAX_CHARS, segment_store
+
+ELEVENLABS_MODEL = "eleven_monolingual_v1"
+OPENAI_TTS_MODEL = "tts-1"
+OPENAI_VOICES = {"alloy", "echo", "fable", "onyx", "nova", "shimmer"}
+
+VOWEL_GROUPS = re.compile(r"[aeiouyàâäáãåæèéêëìíîïòóôöõøœùúûüý]+", re.IGNORECASE)
+CJK = re.compile(r"[\u3040-\u30ff\u3400-\u9fff\uac00-\ud7af]")
+PAUSES = {",": 0.2, ";": 0.25, ":": 0.25, "—": 0.2, "，": 0.2, ".": 0.45, "!": 0.45, "?": 0.45, "。": 0.45}
+
+
+def openai_voice(voice_id: Optional[str]) -> str:
+    """the voice to ask openai for; other providers' voice ids fall back to the default"""
+    return voice_id if voice_id in OPENAI_VOICES else settings.OPENAI_DEFAULT_VOICE
+
+
+class TTSBackend(ABC):
+    """one engine that turns a chunk of text into an audio file, and what it can do
+
+    capabilities: streaming (audio is written to disk as it arrives rather than
+    buffered whole), max_chars per request, languages (None for any), offline (no
+    network needed) and blocking (a BlockingTTSBackend, whose synthesize_file can run
+    on a render thread; other backends only have the coroutine). max_concurrency()
+    caps the requests in flight per process, through slots() for coroutines and a
+    pool of that size for threads
+    """
+
+    name = ""
+    model: Optional[str] = None
+    suffix = ".mp3"
+    streaming = False
+    languages: Optional[FrozenSet[str]] = None
+    offline = False
+    blocking = False
+
+    def __init__(self):
+        self._slots: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = (
+            weakref.WeakKeyDictionary()
+        )
+
+    @property
+    def max_chars(self) -> int:
+        return PROVIDER_MAX_CHARS.get(self.name, 5000)
+
+    def max_concurrency(self) -> int:
+        return 4
+
+    def available(self) -> bool:
+        """configured well enough to be used, e.g. has an api key"""
+        return True
+
+    def supports(self, language: str) -> bool:
+        return self.languages is None or language.split("-")[0].lower() in self.languages
+
+    def cache_key(self, text: str, voice_id: Optional[str], language: str, speed: float) -> str:
+        """segment store key of the chunk; covers everything this backend's audio depends on"""
+        return segment_store.key(self.name, language, voice_id, text, speed, self.model)
+
+    def slots(self) -> asyncio.Semaphore:
+        """semaphore limiting concurrent requests from coroutines on the running event loop"""
+        loop = asyncio.get_running_loop()
+        if loop not in self._slots:
+            self._slots[loop] = asyncio.Semaphore(max(1, self.max_concurrency()))
+        return self._slots[loop]
+
+    def capabilities(self) -> Dict:
+        return {
+            "available": self.available(),
+            "streaming": self.streaming,
+            "max_chars": self.max_chars,
+            "languages": sorted(self.languages) if self.languages is not None else None,
+            "offline": self.offline,
+            "blocking": self.blocking,
+            "max_concurrency": self.max_concurrency(),
+            "format": self.suffix.lstrip(".")
+        }
+
+    @abstractmethod
+    async def synthesize(
+        self,
+        text: str,
+        voice_id: Optional[str],
+        language: str,
+        speed: float,
+        output_path: str
+    ):
+        """write the speech for text to output_path"""
+
+
+class BlockingTTSBackend(TTSBackend):
+    """a backend that synthesizes on the calling thread, so renders can use it too"""
+
+    blocking = True
+
+    @abstractmethod
+    def synthesize_file(self, text: str, voice_id: Optional[str], language: str, speed: float, output_path: str):
+        """write the speech for text to output_path, blocking"""
+
+    async def synthesize(self, text, voice_id, language, speed, output_path):
+        await asyncio.get_running_loop().run_in_executor(
+            None, self.synthesize_file, text, voice_id, language, speed, output_path
+        )
+
+
+class GTTSBackend(BlockingTTSBackend):
+    """google translate's tts (free, no key, no voices or speed)"""
+
+    name = "gtts"
+
+    @property
+    def languages(self) -> Optional[FrozenSet[str]]:
+        if not hasattr(self, "_languages"):
+            try:
+                from gtts.lang import tts_langs
+                self._languages = frozenset(tts_langs())
+            except Exception:
+                self._languages = None
+        return self._languages
+
+    def max_concurrency(self) -> int:
+        return settings.TTS_MAX_CONCURRENCY_GTTS
+
+    def cache_key(self, text: str, voice_id: Optional[str], language: str, speed: float) -> str:
+        return segment_store.key(self.name, language, None, text)
+
+    def synthesize_file(self, text: str, voice_id: Optional[str], language: str, speed: float, output_path: str):
+        from gtts import gTTS
+
+        gTTS(text=text, lang=language, slow=False).save(str(output_path))
+
+
+class HTTPBackend(TTSBackend):
+    """a provider api reached through the pooled client, its audio streamed to disk"""
+
+    streaming = True
+    label = ""
+
+    async def _download(
+        self,
+        url: str,
+        data: Dict,
+        headers: Dict,
+        output_path: str
+    ):
+        """stream the response to output_path block by block; raises on a failed request"""
+        async with provider_clients.get(self.name).stream("POST", url, json=data, headers=headers) as response:
+            if response.status_code != 200:
+                await response.aread()
+                raise Exception(f"{self.label} API error: {response.status_code} - {response.text}")
+            try:
+                with open(output_path, "wb") as f:
+                    async for block in response.aiter_bytes(settings.TTS_STREAM_BLOCK_BYTES):
+                        f.write(block)
+            except BaseException:
+                # a cut-off download is never left looking like finished audio
+                try:
+                    os.remove(output_path)
+                except OSError:
+                    pass
+                raise
+
+
+class ElevenLabsBackend(HTTPBackend):
+    name = "elevenlabs"
+    label = "ElevenLabs"
+    model = ELEVENLABS_MODEL
+    languages = frozenset({"en"})  # the monolingual model
+
+    def max_concurrency(self) -> int:
+        return settings.TTS_MAX_CONCURRENCY_ELEVENLABS
+
+    def available(self) -> bool:
+        return bool(settings.ELEVENLABS_API_KEY)
+
+    async def synthesize(self, text, voice_id, language, speed, output_path):
+        await self._download(
+            f"/v1/text-to-speech/{voice_id}",
+            {
+                "text": text,
+                "model_id": ELEVENLABS_MODEL,
+                "voice_settings": {"stability": 0.5, "similarity_boost": 0.5, "speed": speed}
+            },
+            {"Accept": "audio/mpeg", "Content-Type": "application/json", "xi-api-key": settings.ELEVENLABS_API_KEY},
+            output_path
+        )
+
+
+class OpenAIBackend(HTTPBackend):
+    name = "openai"
+    label = "OpenAI"
+    model = OPENAI_TTS_MODEL
+
+    def max_concurrency(self) -> int:
+        return settings.TTS_MAX_CONCURRENCY_OPENAI
+
+    def available(self) -> bool:
+        return bool(settings.OPENAI_API_KEY)
+
+    def cache_key(self, text: str, voice_id: Optional[str], language: str, speed: float) -> str:
+        # the speech endpoint isn't sent a speed
+        return segment_store.key(self.name, language, openai_voice(voice_id), text, 1.0, self.model)
+
+    async def synthesize(self, text, voice_id, language, speed, output_path):
+        await self._download(
+            "/v1/audio/speech",
+            {"model": OPENAI_TTS_MODEL, "input": text, "voice": openai_voice(voice_id), "response_format": "mp3"},
+            {"Authorization": f"Bearer {settings.OPENAI_API_KEY}", "Content-Type": "application/json"},
+            output_path
+        )
+
+
+class SyntheticBackend(BlockingTTSBackend):
+    """offline stand-in for speech, generated with numpy: no network, no model
+
+    the audio lasts as long as the text would take to say: syllables at
+    SYNTHETIC_TTS_SYLLABLES_PER_SECOND scaled by speed, short gaps between words and
+    pauses at punctuation. every syllable is a voiced burst whose pitch follows the
+    voice, so loudness-driven lip sync moves like it would for real speech. the same
+    text, voice and speed always give the same samples, so chunks cache as usual
+    """
+
+    name = "synthetic"
+    model = "synthetic-1"
+    suffix = ".wav"
+    offline = True
+    sample_rate = 22050
+
+    def max_concurrency(self) -> int:
+        return settings.TTS_MAX_CONCURRENCY_SYNTHETIC
+
+    def synthesize_file(self, text: str, voice_id: Optional[str], language: str, speed: float, output_path: str):
+        samples = self.render(text, voice_id, speed)
+        with wave.open(str(output_path), "wb") as f:
+            f.setnchannels(1)
+            f.setsampwidth(2)
+            f.setframerate(self.sample_rate)
+            f.writeframes(samples.tobytes())
+
+    def render(self, text: str, voice_id: Optional[str], speed: float = 1.0):
+        """16-bit mono samples for text"""
+        import numpy as np
+
+        speed = max(0.25, float(speed or 1.0))
+        syllable = 1.0 / (settings.SYNTHETIC_TTS_SYLLABLES_PER_SECOND * speed)
+        base_pitch = 100 + zlib.crc32((voice_id or "default").encode("utf-8")) % 120
+        pieces: List = []
+        for token in re.findall(r"[^\s]+", text):
+            word = token.rstrip("".join(PAUSES))
+            for index in range(self.syllables(word) if word else 0):
+                pitch = base_pitch * (1 + 0.08 * ((zlib.crc32(f"{word}{index}".encode("utf-8")) % 5) - 2) / 2)
+                t = np.arange(int(self.sample_rate * syllable)) / self.sample_rate
+                voiced = (np.sin(2 * np.pi * pitch * t) + 0.5 * np.sin(4 * np.pi * pitch * t)
+                          + 0.25 * np.sin(6 * np.pi * pitch * t))
+                pieces.append(voiced * np.hanning(len(t)) * 0.25)
+            pause = max((PAUSES.get(mark, 0.0) for mark in token[len(word):]), default=0.0)
+            pieces.append(np.zeros(int(self.sample_rate * (0.06 + pause) / speed)))
+        audio = np.concatenate(pieces) if pieces else np.zeros(int(self.sample_rate * 0.25))
+        return (np.clip(audio, -1.0, 1.0) * 32767).astype("<i2")
+
+    @staticmethod
+    def syllables(word: str) -> int:
+        """rough syllable count: vowel groups, or one per cjk character"""
+        cjk = len(CJK.findall(word))
+        if cjk:
+            return cjk
+        groups = len(VOWEL_GROUPS.findall(word))
+        return max(1, groups if groups else round(len(word) / 3))
+
+
+class TTSBackends:
+    """the tts engines by name"""
+
+    def __init__(self):
+        self._backends: Dict[str, TTSBackend] = {}
+
+    def register(self, backend: TTSBackend):
+        self._backends[backend.name] = backend
+
+    def get(self, name: str) -> TTSBackend:
+        backend = self._backends.get(name)
+        if backend is None:
+            raise ValueError(f"unknown tts backend: {name}")
+        return backend
+
+    def names(self) -> List[str]:
+        return list(self._backends)
+
+    def capabilities(self) -> Dict:
+        return {name: backend.capabilities() for name, backend in self._backends.items()}
+
+# create global instance
+tts_backends = TTSBackends()
+for _backend in (GTTSBackend(), ElevenLabsBackend(), OpenAIBackend(), SyntheticBackend()):
+    tts_backends.register(_backend)
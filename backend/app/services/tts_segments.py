@@ -0,0 +1,519 @@
+import os
+import re
+import json
+import uuid
+import wave
+import threading
+import time
+import subprocess
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+from typing import (
+    AbstractSet, Awaitable, BinaryIO, Callable, Dict, FrozenSet, Iterable, List, Optional, Sequence, Set, Tuple
+)
+
+from app.core.config import settings
+from app.services.render_cache import render_cache, stable_digest
+from app.services.render_metrics import render_metrics
+from app.services.single_flight import SingleFlight
+
+# longest text each provider accepts in a single request
+PROVIDER_MAX_CHARS = {
+    "gtts": 100,  # gtts splits anything longer into serial 100-char requests itself
+    "elevenlabs": 5000,
+    "openai": 4096,
+    "synthetic": 5000
+}
+
+SENTENCE_BREAK = re.compile(r"(?<=[.!?。！？])\s+|\n+")
+CLAUSE_BREAK = re.compile(r"(?<=[,;:—，；：])\s+")
+COPY_BLOCK_BYTES = 256 * 1024  # audio is copied in blocks this size, never whole files
+
+# mp3 frame header tables, indexed by [mpeg version][layer]
+_MP3_BITRATES = {
+    (1, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (1, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (1, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (2, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (2, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (2, 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160]
+}
+_MP3_SAMPLE_RATES = {1: [44100, 48000, 32000], 2: [22050, 24000, 16000], 2.5: [11025, 12000, 8000]}
+
+
+def chunk_limit(provider: str) -> int:
+    """chunk size for a provider: the configured target, capped by what the provider accepts"""
+    return min(settings.TTS_CHUNK_TARGET_CHARS, PROVIDER_MAX_CHARS.get(provider, 5000))
+
+
+def split_sentences(text: str) -> List[str]:
+    """the sentences of a script, whitespace-normalized"""
+    sentences = (" ".join(sentence.split()) for sentence in SENTENCE_BREAK.split(text))
+    return [sentence for sentence in sentences if sentence]
+
+
+def split_script(text: str, max_chars: int, shared: Optional[AbstractSet[str]] = None) -> List[str]:
+    """split text at sentence, then clause, then word boundaries into chunks of at most max_chars
+
+    short neighbouring sentences are packed together so tiny fragments don't each
+    cost a provider round trip. sentences in shared (e.g. the template text of a
+    batch) are never packed with ones that are not, so their chunks come out
+    identical in every script and can be synthesized once
+    """
+    chunks: List[str] = []
+    run: List[str] = []
+    run_shared = None
+    for sentence in split_sentences(text):
+        is_shared = bool(shared) and sentence in shared
+        if run and is_shared != run_shared:
+            chunks.extend(_pack(run, max_chars))
+            run = []
+        run_shared = is_shared
+        run.extend(_fit(sentence, max_chars, (CLAUSE_BREAK, None)))
+    chunks.extend(_pack(run, max_chars))
+    return chunks
+
+
+def shared_sentences(scripts: Iterable[str]) -> FrozenSet[str]:
+    """sentences that occur in more than one of the scripts"""
+    counts: Dict[str, int] = {}
+    for script in scripts:
+        for sentence in set(split_sentences(script)):
+            counts[sentence] = counts.get(sentence, 0) + 1
+    return frozenset(sentence for sentence, count in counts.items() if count > 1)
+
+
+def _fit(text: str, max_chars: int, splitters) -> List[str]:
+    if len(text) <= max_chars:
+        return [text]
+    splitter, rest = splitters[0], splitters[1:]
+    if splitter is None:
+        # no clause boundary left: break between words, or hard-split a single huge word
+        words = text.split(" ")
+        if len(words) == 1:
+            return [text[i:i + max_chars] for i in range(0, len(text), max_chars)]
+        return _pack([part for word in words for part in _fit(word, max_chars, (None,))], max_chars)
+    parts = [part for part in splitter.split(text) if part]
+    if len(parts) == 1:
+        return _fit(text, max_chars, rest)
+    return _pack([piece for part in parts for piece in _fit(part, max_chars, rest)], max_chars)
+
+
+def _pack(pieces: Sequence[str], max_chars: int) -> List[str]:
+    chunks: List[str] = []
+    for piece in pieces:
+        if chunks and len(chunks[-1]) + 1 + len(piece) <= max_chars:
+            chunks[-1] = f"{chunks[-1]} {piece}"
+        else:
+            chunks.append(piece)
+    return chunks
+
+
+def timing_manifest_path(media_path: str) -> Path:
+    """sidecar file holding the per-chunk timing of a media file"""
+    media = Path(media_path)
+    return media.with_name(f"{media.stem}.timing.json")
+
+
+def write_timing_manifest(media_path: str, provider: str, chunks: Sequence[str], chunk_files: Sequence[str]) -> Dict:
+    """record where each chunk starts and ends in the stitched audio"""
+    segments = []
+    position = 0.0
+    for index, (chunk, chunk_file) in enumerate(zip(chunks, chunk_files)):
+        duration = audio_duration(chunk_file) or 0.0
+        segments.append({
+            "index": index,
+            "text": chunk,
+            "start": round(position, 3),
+            "end": round(position + duration, 3),
+            "duration": round(duration, 3)
+        })
+        position += duration
+    manifest = {"provider": provider, "duration": round(position, 3), "segments": segments}
+
+    manifest_path = timing_manifest_path(media_path)
+    tmp_path = manifest_path.with_name(f".{manifest_path.name}.{uuid.uuid4().hex}")
+    tmp_path.write_text(json.dumps(manifest), encoding="utf-8")
+    os.replace(tmp_path, manifest_path)
+    return manifest
+
+
+def read_timing_manifest(media_path: str) -> Optional[Dict]:
+    """load the timing sidecar of a media file, if it has one"""
+    try:
+        return json.loads(timing_manifest_path(media_path).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+
+def concat_audio(chunk_files: Sequence[str], output_path: str) -> str:
+    """stitch chunk audio together in order without re-encoding"""
+    output = Path(output_path)
+    tmp_path = output.with_name(f".{output.name}.{uuid.uuid4().hex}.part")
+    suffixes = {Path(path).suffix.lower() for path in chunk_files}
+
+    if suffixes == {".mp3"}:
+        # mpeg audio is a plain sequence of frames, so the streams can be joined directly
+        with open(tmp_path, "wb") as out:
+            for path in chunk_files:
+                _copy_mp3_frames(path, out)
+    elif suffixes == {".wav"}:
+        with wave.open(str(tmp_path), "wb") as out:
+            for index, path in enumerate(chunk_files):
+                with wave.open(str(path), "rb") as src:
+                    if index == 0:
+                        out.setparams(src.getparams())
+                    out.writeframes(src.readframes(src.getnframes()))
+    else:
+        _concat_with_ffmpeg(chunk_files, tmp_path)
+
+    os.replace(tmp_path, output)
+    return str(output)
+
+
+def _concat_with_ffmpeg(chunk_files: Sequence[str], tmp_path: Path):
+    from app.services.ffmpeg_capabilities import ffmpeg_capabilities
+
+    profile = ffmpeg_capabilities.profile()
+    if not profile.available:
+        raise Exception("ffmpeg is required to join audio in this format")
+    list_path = tmp_path.with_suffix(".txt")
+    list_path.write_text(
+        "".join(f"file '{Path(path).resolve().as_posix()}'\n" for path in chunk_files),
+        encoding="utf-8"
+    )
+    try:
+        result = subprocess.run(
+            [profile.ffmpeg_path, "-y", "-f", "concat", "-safe", "0", "-i", str(list_path),
+             "-c", "copy", "-f", Path(chunk_files[0]).suffix.lstrip(".") or "mp3", str(tmp_path)],
+            capture_output=True, text=True, timeout=60
+        )
+        if result.returncode != 0:
+            raise Exception(f"audio concat failed: {result.stderr[-500:]}")
+    finally:
+        list_path.unlink(missing_ok=True)
+
+
+def _copy_mp3_frames(path: str, out: BinaryIO):
+    """append an mp3's frames to out block by block, leaving out its id3 tags"""
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        header = f.read(10)
+        start = 0
+        if header[:3] == b"ID3" and len(header) == 10:
+            start = 10 + ((header[6] << 21) | (header[7] << 14) | (header[8] << 7) | header[9])
+            start += 10 if header[5] & 0x10 else 0
+        end = size
+        if size - start >= 128:
+            f.seek(size - 128)
+            if f.read(3) == b"TAG":
+                end = size - 128
+        f.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            block = f.read(min(COPY_BLOCK_BYTES, remaining))
+            if not block:
+                break
+            out.write(block)
+            remaining -= len(block)
+
+
+def audio_duration(path: str) -> Optional[float]:
+    """duration in seconds of an mp3 or wav file, read from headers without decoding"""
+    suffix = Path(path).suffix.lower()
+    try:
+        if suffix == ".wav":
+            with wave.open(str(path), "rb") as f:
+                return f.getnframes() / float(f.getframerate())
+        if suffix == ".mp3":
+            with open(path, "rb") as f:
+                return mp3_duration(f)
+    except (OSError, wave.Error, EOFError):
+        return None
+    return None
+
+
+def mp3_duration(f: BinaryIO) -> float:
+    """sum the sample counts of every mpeg audio frame, from the current position of f
+
+    the file is read in blocks of COPY_BLOCK_BYTES, so memory use doesn't grow with
+    the length of the audio; id3 tags at either end are skipped
+    """
+    start = f.tell()
+    end = f.seek(0, os.SEEK_END)
+    if end - start >= 128:
+        f.seek(end - 128)
+        if f.read(3) == b"TAG":
+            end -= 128
+    f.seek(start)
+    tag = f.read(10)
+    position = start
+    if tag[:3] == b"ID3" and len(tag) == 10:
+        size = (tag[6] << 21) | (tag[7] << 14) | (tag[8] << 7) | tag[9]
+        footer = 10 if tag[5] & 0x10 else 0
+        position += 10 + size + footer
+
+    seconds = 0.0
+    block, block_start = b"", position
+    while position + 4 <= end:
+        offset = position - block_start
+        if offset + 4 > len(block):
+            f.seek(position)
+            block, block_start, offset = f.read(min(COPY_BLOCK_BYTES, end - position)), position, 0
+            if len(block) < 4:
+                break
+        if block[offset] != 0xFF or (block[offset + 1] & 0xE0) != 0xE0:
+            position += 1
+            continue
+        header = block[offset + 1:offset + 4]
+        version = {3: 1, 2: 2, 0: 2.5}.get((header[0] >> 3) & 0x03)
+        layer = {3: 1, 2: 2, 1: 3}.get((header[0] >> 1) & 0x03)
+        bitrate_index = header[1] >> 4
+        rate_index = (header[1] >> 2) & 0x03
+        if version is None or layer is None or bitrate_index in (0, 15) or rate_index == 3:
+            position += 1
+            continue
+        bitrate = _MP3_BITRATES[(1 if version == 1 else 2, layer)][bitrate_index] * 1000
+        sample_rate = _MP3_SAMPLE_RATES[version][rate_index]
+        padding = (header[1] >> 1) & 0x01
+        if layer == 1:
+            samples = 384
+            frame_length = (12 * bitrate // sample_rate + padding) * 4
+        else:
+            samples = 1152 if (layer == 2 or version == 1) else 576
+            frame_length = (samples // 8) * bitrate // sample_rate + padding
+        if frame_length <= 4:
+            position += 1
+            continue
+        seconds += samples / float(sample_rate)
+        position += frame_length
+    return seconds
+
+
+def normalize_text(text: str) -> str:
+    """the form of a chunk's text that goes into its cache key: nfc, whitespace collapsed"""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+class SegmentStore:
+    """persistent cache of synthesized tts chunks, shared by every provider and render on the node
+
+    entries are keyed on the normalized text and everything else that changes the
+    audio: provider, voice, language, speed and model. an in-memory index, loaded
+    from the directory once, answers lookups and keeps the lru order, so a hit costs
+    no filesystem access; last use is written back to the files' mtimes on each
+    sweep. entries are written under temp names and renamed into place, and the
+    least recently used are evicted once the store goes over TTS_CACHE_MAX_BYTES.
+
+    a chunk that several scripts have in common (templated batches) is synthesized
+    by the first request that needs it; concurrent requests for it in this process,
+    from render threads or coroutines, attach to that synthesis instead of repeating
+    it (counted as tts_coalesced)
+    """
+
+    def __init__(self, root: Optional[str] = None, max_bytes: Optional[int] = None):
+        self.root = Path(root or settings.TTS_SEGMENT_DIR or render_cache.root / "tts_segments")
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes or settings.TTS_CACHE_MAX_BYTES
+        self._lock = threading.Lock()
+        self._flight = SingleFlight("tts")
+        self._index: "OrderedDict[str, Tuple[Path, int]]" = OrderedDict()  # key -> (path, size), least recent first
+        self._used: Set[Path] = set()  # hits whose mtime hasn't been refreshed yet
+        self._total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bytes_saved = 0
+        self.expire()
+
+    @staticmethod
+    def key(
+        provider: str,
+        language: str,
+        voice_id: Optional[str],
+        text: str,
+        speed: float = 1.0,
+        model: Optional[str] = None
+    ) -> str:
+        return stable_digest({
+            "provider": provider,
+            "language": language,
+            "voice_id": voice_id,
+            "text": normalize_text(text),
+            "speed": round(float(speed), 3),
+            "model": model
+        })
+
+    def lookup(self, key: str) -> Optional[Path]:
+        """path of a stored segment, from the index alone; None on a miss"""
+        with self._lock:
+            entry = self._index.get(key)
+            if entry is None:
+                return None
+            self._index.move_to_end(key)
+            self._used.add(entry[0])
+            self.hits += 1
+            self.bytes_saved += entry[1]
+        render_metrics.increment("tts_cache_hits")
+        render_metrics.increment("tts_cache_bytes_saved", entry[1])
+        return entry[0]
+
+    def fetch_or_create(self, key: str, suffix: str, synthesize: Callable[[Path], None]) -> Path:
+        """path of the stored segment, calling synthesize(tmp_path) first if it is missing"""
+        path = self.lookup(key)
+        if path is not None:
+            return path
+        return self._flight.do(key, lambda: self._create(key, suffix, synthesize))
+
+    def _create(self, key: str, suffix: str, synthesize: Callable[[Path], None]) -> Path:
+        path = self.lookup(key)  # finished since our first look
+        if path is not None:
+            return path
+        tmp_path = self.scratch_path(suffix)
+        try:
+            synthesize(tmp_path)
+            return self.commit(key, tmp_path, suffix)
+        finally:
+            tmp_path.unlink(missing_ok=True)
+
+    async def fetch_or_create_async(
+        self,
+        key: str,
+        suffix: str,
+        synthesize: Callable[[Path], Awaitable[None]]
+    ) -> Path:
+        """fetch_or_create for coroutines: await synthesize(tmp_path) on a miss"""
+        path = self.lookup(key)
+        if path is not None:
+            return path
+        return await self._flight.do_async(key, lambda: self._create_async(key, suffix, synthesize))
+
+    async def _create_async(self, key: str, suffix: str, synthesize: Callable[[Path], Awaitable[None]]) -> Path:
+        path = self.lookup(key)
+        if path is not None:
+            return path
+        tmp_path = self.scratch_path(suffix)
+        try:
+            await synthesize(tmp_path)
+            return self.commit(key, tmp_path, suffix)
+        finally:
+            tmp_path.unlink(missing_ok=True)
+
+    def scratch_path(self, suffix: str) -> Path:
+        return self.root / f".tmp_{uuid.uuid4().hex}{suffix}"
+
+    def commit(self, key: str, tmp_path: Path, suffix: str) -> Path:
+        """rename a finished synthesis into place and evict the coldest entries if over the cap"""
+        path = self.root / f"{key}{suffix}"
+        os.replace(tmp_path, path)
+        size = path.stat().st_size
+        with self._lock:
+            if key in self._index:
+                self._total_bytes -= self._index.pop(key)[1]
+            self._index[key] = (path, size)
+            self._total_bytes += size
+            self.misses += 1
+            victims = self._over_budget()
+        render_metrics.increment("tts_cache_misses")
+        for victim in victims:
+            victim.unlink(missing_ok=True)
+        return path
+
+    def _over_budget(self) -> List[Path]:
+        # caller holds the lock; the newest entry always stays
+        victims = []
+        while self._total_bytes > self.max_bytes and len(self._index) > 1:
+            _, (path, size) = self._index.popitem(last=False)
+            self._total_bytes -= size
+            self._used.discard(path)
+            self.evictions += 1
+            victims.append(path)
+        return victims
+
+    def lru_entries(self) -> List[Tuple[str, Path]]:
+        """(key, path) of every entry, least recently used first"""
+        with self._lock:
+            return [(key, path) for key, (path, _) in self._index.items()]
+
+    def remove(self, key: str) -> int:
+        """evict one entry; returns the bytes freed"""
+        with self._lock:
+            entry = self._index.pop(key, None)
+            if entry is None:
+                return 0
+            self._total_bytes -= entry[1]
+            self._used.discard(entry[0])
+            self.evictions += 1
+        entry[0].unlink(missing_ok=True)
+        return entry[1]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._index),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "bytes_saved": self.bytes_saved,
+                "evictions": self.evictions,
+                "coalesced": self._flight.coalesced
+            }
+
+    def expire(self) -> int:
+        """remove segments nobody reused within the ttl and scratch files of dead syntheses,
+        then resync the index with the directory (other processes add and evict too)
+
+        returns the bytes freed
+        """
+        with self._lock:
+            used, self._used = self._used, set()
+        for path in used:
+            _touch(path)
+
+        cutoff = time.time() - settings.TTS_SEGMENT_TTL_HOURS * 3600
+        freed = 0
+        found: Dict[str, Tuple[Path, int, float]] = {}
+        for path in self.root.glob("*"):
+            try:
+                stat = path.stat()
+                if stat.st_mtime < cutoff:
+                    path.unlink()
+                    freed += stat.st_size
+                elif not path.name.startswith(".tmp_"):
+                    found[path.stem] = (path, stat.st_size, stat.st_mtime)
+            except OSError:
+                pass
+
+        with self._lock:
+            # keep this process's lru order; entries new to it go in by mtime
+            index: "OrderedDict[str, Tuple[Path, int]]" = OrderedDict()
+            for key, (path, size, _) in sorted(found.items(), key=lambda item: item[1][2]):
+                if key not in self._index:
+                    index[key] = (path, size)
+            for key in self._index:
+                if key in found:
+                    index[key] = found[key][:2]
+            self._index = index
+            self._total_bytes = sum(size for _, size in index.values())
+            victims = self._over_budget()
+        for victim in victims:
+            try:
+                freed += victim.stat().st_size
+                victim.unlink()
+            except OSError:
+                pass
+        return freed
+
+
+def _touch(path: Path):
+    try:
+        os.utime(path, None)
+    except OSError:
+        pass
+
+# create global instance
+segment_store = SegmentStore()
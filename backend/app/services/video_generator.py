@@ -2,10 +2,36 @@ import os
 import tempfile
 import subprocess
 import json
-from typing import Optional
-from gtts import gTTS
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime
+from typing import AbstractSet, Callable, Dict, List, Optional
 from pathlib import Path
 
+from app.core.config import settings
+from app.services.render_cache import render_cache, stable_digest
+from app.services.ffmpeg_capabilities import ffmpeg_capabilities
+from app.services import render_previews
+from app.services.background_library import BackgroundLoop, background_library
+from app.services.single_flight import SingleFlight
+from app.services.ffmpeg_progress import FFmpegProgress, run_ffmpeg
+from app.services.render_cancellation import CancelToken, RenderCancelled
+from app.services import avatar_animator
+from app.services.avatar_animator import AvatarAnimation
+from app.services.avatar_assets import avatar_assets, resolve_file
+from app.services import renditions as rendition_ladder
+from app.services.renditions import Rendition
+from app.services.tts_backends import BlockingTTSBackend, tts_backends
+from app.services.voice_service import VoiceService, speech_loop
+from app.services.tts_segments import (
+    split_script, chunk_limit, concat_audio, audio_duration,
+    timing_manifest_path, write_timing_manifest, segment_store
+)
+
+# 1x1 black png, looped and scaled when lavfi is unavailable
+BLACK_PIXEL_PNG = 'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNkYPhfDwAChwGA60e6kgAAAABJRU5ErkJggg=='
+
 class VideoGenerator:
     """ultra-light video generation service"""
     
@@ -16,96 +42,633 @@ class VideoGenerator:
         output_root = Path(os.getenv("VIDEO_OUTPUT_DIR", default_out))
         output_root.mkdir(parents=True, exist_ok=True)
         self.temp_dir = output_root
+        
+        # renditions for callers that don't ask for any, e.g. the smallest tier
+        self.default_renditions = [rendition.name for rendition in
+                                   rendition_ladder.ladder_for(settings.TIER_RESOLUTION_LIMITS.get("free"))]
+        
+        # one pool per tts backend, shared by all jobs, so each caps its requests per process
+        self._tts_pools: Dict[str, ThreadPoolExecutor] = {}
+        self._tts_pools_lock = threading.Lock()
+        
+        # identical renders in flight at once run one ffmpeg job between them
+        self._render_flight = SingleFlight("render")
     
-    def text_to_speech(self, text: str, language: str = "en", output_path: str = None) -> str:
-        """convert text to speech using gtts (free)"""
+    def text_to_speech(
+        self,
+        text: str,
+        language: str = "en",
+        output_path: str = None,
+        shared_sentences: Optional[AbstractSet[str]] = None,
+        cancel: Optional[CancelToken] = None,
+        voice_id: Optional[str] = None
+    ) -> str:
+        """convert text to speech with the configured providers, else the TTS_RENDER_BACKEND engine
+        
+        with a provider of TTS_PROVIDER_ORDER configured, the speech comes from
+        VoiceService.generate_speech in voice_id, with its failover, hedging and circuit
+        breakers. otherwise the TTS_RENDER_BACKEND engine (gtts, free, by default)
+        speaks and voice_id is ignored.
+        
+        the text is split at sentence boundaries, the chunks are synthesized in
+        parallel and joined in order; a timing manifest is written next to the audio.
+        chunks come from the segment store, so text another script already spoke
+        (e.g. the template of a batch, chunked apart via shared_sentences) is reused.
+        a cancelled render stops waiting at once and drops the chunks not yet started
+        """
+        voice = VoiceService()
+        if voice.configured_providers(language):
+            return self._provider_speech(voice, text, language, output_path, shared_sentences, cancel, voice_id)
+        
+        backend = tts_backends.get(settings.TTS_RENDER_BACKEND)
         if output_path is None:
-            output_path = self.temp_dir / f"audio_{hash(text)}.mp3"
+            output_path = self.temp_dir / f"audio_{stable_digest(text, language)[:32]}{backend.suffix}"
         
+        chunks = split_script(text, chunk_limit(backend.name), shared_sentences) or [text]
         try:
-            tts = gTTS(text=text, lang=language, slow=False)
-            tts.save(str(output_path))
+            if not backend.blocking:
+                raise Exception(f"tts backend {backend.name} can't run on a render thread")
+            chunk_files = self._stored_chunks(backend, chunks, language, cancel)
+            try:
+                concat_audio(chunk_files, output_path)
+            except FileNotFoundError:
+                # another process evicted a segment this one still had indexed
+                segment_store.expire()
+                chunk_files = self._stored_chunks(backend, chunks, language, cancel)
+                concat_audio(chunk_files, output_path)
+            write_timing_manifest(output_path, backend.name, chunks, chunk_files)
             return str(output_path)
+        except RenderCancelled:
+            raise
         except Exception as e:
             raise Exception(f"text-to-speech failed: {str(e)}")
     
-    def create_simple_video(self, script: str, language: str = "en") -> str:
-        """create a simple video with just audio (no video processing)"""
+    def _provider_speech(
+        self,
+        voice: VoiceService,
+        text: str,
+        language: str,
+        output_path: Optional[str],
+        shared_sentences: Optional[AbstractSet[str]],
+        cancel: Optional[CancelToken],
+        voice_id: Optional[str]
+    ) -> str:
+        voice_id = voice_id or "default"
+        if output_path is None:
+            suffix = tts_backends.get(voice.select_provider(language)).suffix
+            output_path = self.temp_dir / f"audio_{stable_digest(text, language, voice_id)[:32]}{suffix}"
+        voice.output_dir = str(Path(output_path).parent)
+        try:
+            return speech_loop.run(
+                voice.generate_speech(
+                    text, voice_id, language, output_filename=Path(output_path).name,
+                    shared_sentences=shared_sentences
+                ),
+                cancel
+            )
+        except RenderCancelled:
+            raise
+        except Exception as e:
+            raise Exception(f"text-to-speech failed: {str(e)}")
+    
+    def _stored_chunks(
+        self, backend: BlockingTTSBackend, chunks: List[str], language: str, cancel: Optional[CancelToken]
+    ) -> List[Path]:
+        pool = self._tts_pool(backend)
+        futures = [
+            pool.submit(self._stored_chunk, backend, chunk, language)
+            for chunk in chunks
+        ]
+        self._wait_for_chunks(futures, cancel)
+        return [future.result() for future in futures]
+    
+    @staticmethod
+    def _wait_for_chunks(futures, cancel: Optional[CancelToken]):
+        if cancel is None:
+            wait(futures)
+            return
+        while wait(futures, timeout=0.1).not_done:
+            if cancel.cancelled:
+                # requests already sent finish on the tts pool and still fill the store
+                for future in futures:
+                    future.cancel()
+                cancel.raise_if_cancelled()
+    
+    def _tts_pool(self, backend: BlockingTTSBackend) -> ThreadPoolExecutor:
+        with self._tts_pools_lock:
+            pool = self._tts_pools.get(backend.name)
+            if pool is None:
+                pool = self._tts_pools[backend.name] = ThreadPoolExecutor(
+                    max_workers=max(1, backend.max_concurrency()),
+                    thread_name_prefix=f"tts-{backend.name}"
+                )
+            return pool
+    
+    def _stored_chunk(self, backend: BlockingTTSBackend, text: str, language: str) -> Path:
+        # store entries are only ever replaced whole, so concurrent jobs never
+        # read each other's half-written audio
+        key = backend.cache_key(text, None, language, 1.0)
+        return segment_store.fetch_or_create(
+            key, backend.suffix, lambda tmp_path: backend.synthesize_file(text, None, language, 1.0, str(tmp_path))
+        )
+    
+    @property
+    def encoder_profile(self) -> str:
+        """identifier of the detected encode settings; part of the render cache key"""
+        profile = ffmpeg_capabilities.profile()
+        picture = f"loop{settings.BACKGROUND_FPS}" if background_library.enabled(profile) else "ultrafast"
+        return f"{profile.name}:{picture}:{render_previews.signature(profile)}"
+    
+    def create_simple_video(
+        self,
+        script: str,
+        language: str = "en",
+        voice_id: Optional[str] = None,
+        avatar_id: Optional[int] = None,
+        stream_dir: Optional[str] = None,
+        on_first_segment: Optional[Callable[[], None]] = None,
+        renditions: Optional[List[str]] = None,
+        shared_sentences: Optional[AbstractSet[str]] = None,
+        on_progress: Optional[Callable[[float, Optional[float]], None]] = None,
+        cancel: Optional[CancelToken] = None,
+        avatar_image: Optional[str] = None,
+        avatar_updated_at: Optional[datetime] = None,
+        avatar_video: Optional[str] = None,
+        on_encoder_profile: Optional[Callable[[str], None]] = None
+    ) -> str:
+        """create a simple video with just audio (no video processing)
+        
+        identical requests resolve to the cached render without running tts or ffmpeg.
+        with stream_dir set, hls segments and an index.m3u8 playlist are written there
+        while ffmpeg runs and on_first_segment fires once the first one is playable.
+        
+        every rendition comes out of the same ffmpeg run: the largest is the returned
+        video, the others are written next to it as <video stem>.<name>.mp4
+        
+        shared_sentences marks text other scripts contain too (see text_to_speech).
+        on_progress(fraction, speed) reports the encode as ffmpeg runs, a few times a
+        second at most; speed is ffmpeg's encode speed factor (media seconds per second).
+        
+        when cancel fires, tts stops waiting and ffmpeg is killed; the partial outputs are
+        removed and RenderCancelled is raised instead of falling back to another strategy.
+        
+        with avatar_image (Avatar.image_path) the picture is the avatar, its mouth
+        driven by the speech (see avatar_animator) instead of a black background;
+        avatar_updated_at picks the version of its cached, pre-scaled frames.
+        with avatar_video (Avatar.video_path) the avatar's idle clip, pre-encoded as a
+        seamless loop per rendition (see background_library), is looped and trimmed
+        under the audio by stream copy instead, so only the audio is encoded
+        
+        on_encoder_profile(profile) receives the full encoder profile of this render
+        (the encoder, plus the avatar, idle loop and tts engine it was made with)
+        """
+        ladder = sorted((Rendition(name) for name in set(renditions or self.default_renditions)),
+                        key=lambda rendition: rendition.height)
+        idle_loops = self._idle_loops(avatar_video, ladder) if avatar_id and avatar_video else None
+        avatar_file = None
+        if idle_loops is None and avatar_id and avatar_animator.available():
+            avatar_file = resolve_file(avatar_image)
+        encoder_profile = self.encoder_profile
+        if idle_loops is not None:
+            # the loop key covers the clip's content and everything it was encoded with
+            encoder_profile = f"{encoder_profile}:idle:{idle_loops[-1].key[:16]}"
+        elif avatar_file is not None:
+            avatar_version = avatar_assets.version(avatar_file, avatar_updated_at)
+            encoder_profile = f"{encoder_profile}:{avatar_animator.ANIMATION_VERSION}:{avatar_version}"
+        providers = VoiceService().configured_providers(language)
+        if providers:
+            # the providers speak in the requested voice
+            encoder_profile = f"{encoder_profile}:tts:{'+'.join(providers)}"
+        else:
+            # the render engine has no voices, so the voice doesn't change the render
+            voice_id = None
+            if settings.TTS_RENDER_BACKEND != "gtts":
+                # another engine's speech is another render
+                encoder_profile = f"{encoder_profile}:tts:{settings.TTS_RENDER_BACKEND}"
+        if on_encoder_profile:
+            on_encoder_profile(encoder_profile)
+        cache_key = render_cache.make_key(
+            script, language, voice_id, avatar_id, ",".join(r.name for r in ladder), encoder_profile
+        )
+        cached_path = render_cache.get(cache_key)
+        if cached_path:
+            print(f"render cache hit: {cache_key[:12]}")
+            return cached_path
+        
+        # an identical render already running (a campaign's template script sent by many
+        # users at once) is joined instead of repeated: the joining request gets the same
+        # cached artifact, without a stream or progress of its own. uncached fallbacks
+        # are moved by whoever publishes them, so those are never shared
+        return self._render_flight.do(
+            cache_key,
+            lambda: self._render(
+                script, language, cache_key, ladder, stream_dir, on_first_segment, shared_sentences,
+                on_progress, cancel, avatar_id, avatar_file, avatar_updated_at, idle_loops, voice_id
+            ),
+            cancel,
+            shareable=lambda path: not render_cache.is_scratch(path)
+        )
+    
+    def _render(
+        self,
+        script: str,
+        language: str,
+        cache_key: str,
+        ladder: List[Rendition],
+        stream_dir: Optional[str],
+        on_first_segment: Optional[Callable[[], None]],
+        shared_sentences: Optional[AbstractSet[str]],
+        on_progress: Optional[Callable[[float, Optional[float]], None]],
+        cancel: Optional[CancelToken],
+        avatar_id: Optional[int],
+        avatar_file: Optional[Path],
+        avatar_updated_at: Optional[datetime],
+        idle_loops: Optional[List[BackgroundLoop]],
+        voice_id: Optional[str] = None
+    ) -> str:
+        """tts and ffmpeg for a render that isn't cached yet; returns the cached render or a fallback"""
+        output_path = None
         try:
+            if cancel is not None:
+                # cancelled while waiting for a render slot
+                cancel.raise_if_cancelled()
+            
             # step 1: convert text to speech
-            audio_path = self.text_to_speech(script, language)
+            audio_path = self.text_to_speech(
+                script, language, shared_sentences=shared_sentences, cancel=cancel, voice_id=voice_id
+            )
             
             # step 2: create a simple video file by copying audio to mp4 container
-            output_path = self.temp_dir / f"simple_video_{hash(script)}.mp4"
+            # render into a unique scratch file on the cache filesystem; only real
+            # ffmpeg output is published to the cache
+            output_path = render_cache.scratch_path(".mp4")
+            self._copy_sidecars(audio_path, output_path)
             
-            # check if ffmpeg is available
-            try:
-                # try multiple possible ffmpeg paths
-                ffmpeg_paths = ['ffmpeg', 'C:/Program Files/ffmpeg/bin/ffmpeg.exe', 'C:/ffmpeg/bin/ffmpeg.exe']
-                use_ffmpeg = False
-                
-                for path in ffmpeg_paths:
-                    try:
-                        result = subprocess.run([path, '-version'], capture_output=True, timeout=5)
-                        if result.returncode == 0:
-                            use_ffmpeg = True
-                            ffmpeg_cmd = path
-                            print(f"ffmpeg found at: {path}")
-                            break
-                    except (subprocess.TimeoutExpired, FileNotFoundError):
-                        continue
-                
-                if not use_ffmpeg:
-                    print("ffmpeg not found in any standard location, using fallback method")
-                    
-            except Exception as e:
-                print(f"error checking ffmpeg: {str(e)}")
-                use_ffmpeg = False
+            # the strategy comes from the ffmpeg profile probed once per process
+            profile = ffmpeg_capabilities.profile()
+            strategy = profile.render_strategy
+            animation = None
+            if avatar_file is not None and strategy != "audio_only":
+                animation = self._avatar_animation(avatar_id, avatar_file, avatar_updated_at, audio_path, ladder[-1])
             
-            if use_ffmpeg:
+            if stream_dir and strategy != "audio_only" and "hls" in profile.muxers:
+                try:
+                    return self._render_streaming(
+                        audio_path, output_path, cache_key, ladder, stream_dir, on_first_segment, on_progress, cancel,
+                        animation, idle_loops
+                    )
+                except RenderCancelled:
+                    raise
+                except Exception as e:
+                    print(f"streaming render failed, rendering in one pass: {str(e)}")
+                    self._discard_outputs(output_path, ladder)
+            
+            if strategy == "lavfi_background":
                 # use ffmpeg to create a simple video from audio only
                 # this is the lightest possible approach
+                source_inputs, video_args, extra_outputs = self._video_args(
+                    profile, audio_path, output_path, strategy, ladder, animation=animation, loops=idle_loops
+                )
                 cmd = [
-                    ffmpeg_cmd, '-y',  # overwrite output
+                    profile.ffmpeg_path, '-y',  # overwrite output
                     '-i', str(audio_path),  # audio input
-                    '-f', 'lavfi', '-i', 'color=black:size=320x240:duration=5',  # simple black background
-                    '-c:v', 'libx264', '-c:a', 'aac',  # codecs
+                    *source_inputs,  # simple black background
+                    *video_args,
+                    '-map', '0:a', '-c:a', profile.audio_encoder,
                     '-shortest',  # match audio duration
-                    '-preset', 'ultrafast',  # fastest encoding
-                    str(output_path)
+                    '-movflags', '+faststart',  # moov first, so playback starts before the download ends
+                    str(output_path),
+                    *extra_outputs  # smaller renditions, poster and sprite from the same decode
                 ]
                 
-                # run ffmpeg with timeout
+                # run ffmpeg with timeout, reporting progress while it encodes
                 try:
-                    result = subprocess.run(
-                        cmd,
-                        capture_output=True,
-                        text=True,
-                        timeout=15  # 15 second timeout
+                    result = run_ffmpeg(
+                        cmd, FFmpegProgress(audio_duration(audio_path), on_progress), cancel=cancel,
+                        stdin_writer=animation.write_frames if animation else None
                     )
                     
                     if result.returncode == 0:
-                        return str(output_path)
+                        return render_cache.put(cache_key, str(output_path))
                     else:
                         print(f"ffmpeg failed: {result.stderr}")
-                        # fallback: just return the audio file as mp4
-                        return self._create_audio_only_video(audio_path, output_path)
+                        self._discard_outputs(output_path, ladder)
+                        # fallback: a looped still frame instead of the generated background
+                        return self._create_audio_only_video(audio_path, output_path, cache_key, ladder, on_progress, cancel, animation, idle_loops)
                         
                 except subprocess.TimeoutExpired:
                     print("ffmpeg timed out, using fallback")
-                    return self._create_audio_only_video(audio_path, output_path)
+                    self._discard_outputs(output_path, ladder)
+                    return self._create_audio_only_video(audio_path, output_path, cache_key, ladder, on_progress, cancel, animation, idle_loops)
                 except FileNotFoundError:
                     print("ffmpeg not found, using fallback")
-                    return self._create_audio_only_video(audio_path, output_path)
+                    return self._create_simple_video_without_ffmpeg(audio_path, output_path)
+            elif strategy == "still_image":
+                return self._create_audio_only_video(audio_path, output_path, cache_key, ladder, on_progress, cancel, animation, idle_loops)
             else:
                 # create a simple video without ffmpeg
                 return self._create_simple_video_without_ffmpeg(audio_path, output_path)
             
+        except RenderCancelled:
+            if output_path is not None:
+                self._discard_outputs(output_path, ladder)
+                output_path.unlink(missing_ok=True)
+                timing_manifest_path(output_path).unlink(missing_ok=True)
+            raise
         except Exception as e:
             print(f"video generation error: {str(e)}")
             # create a minimal placeholder
             return self._create_placeholder_video()
     
+    def _render_streaming(
+        self,
+        audio_path: str,
+        output_path: Path,
+        cache_key: str,
+        ladder: List[Rendition],
+        stream_dir: str,
+        on_first_segment: Optional[Callable[[], None]] = None,
+        on_progress: Optional[Callable[[float, Optional[float]], None]] = None,
+        cancel: Optional[CancelToken] = None,
+        animation: Optional[AvatarAnimation] = None,
+        idle_loops: Optional[List[BackgroundLoop]] = None
+    ) -> str:
+        """encode once into hls segments under stream_dir, then remux them into a faststart mp4
+        
+        the largest rendition is streamed; smaller ones are written as mp4s by the same run
+        """
+        profile = ffmpeg_capabilities.profile()
+        stream_dir = Path(stream_dir)
+        shutil.rmtree(stream_dir, ignore_errors=True)  # leftovers of an earlier attempt
+        stream_dir.mkdir(parents=True, exist_ok=True)
+        playlist_path = stream_dir / "index.m3u8"
+        segment_seconds = settings.HLS_SEGMENT_SECONDS
+        
+        source_inputs, video_args, extra_outputs = self._video_args(
+            profile, audio_path, output_path, profile.render_strategy, ladder,
+            keyframe_seconds=segment_seconds, animation=animation, loops=idle_loops
+        )
+        cmd = [
+            profile.ffmpeg_path, '-y', '-hide_banner', '-loglevel', 'error',
+            '-i', str(audio_path),
+            *source_inputs,
+            *video_args,
+            '-map', '0:a', '-c:a', profile.audio_encoder,
+            '-shortest',
+            '-f', 'hls',
+            '-hls_time', str(segment_seconds),
+            '-hls_list_size', '0',
+            '-hls_playlist_type', 'event',
+            '-hls_segment_type', 'fmp4',
+            '-hls_fmp4_init_filename', 'init.mp4',
+            '-hls_flags', 'temp_file',  # segments appear only once fully written
+            '-hls_segment_filename', str(stream_dir / 'segment_%04d.m4s'),
+            str(playlist_path),
+            *extra_outputs
+        ]
+        
+        first_segment_seen = False
+        
+        def watch_playlist():
+            nonlocal first_segment_seen
+            if not first_segment_seen and self._playlist_has_segment(playlist_path):
+                first_segment_seen = True
+                self._notify(on_first_segment)
+        
+        try:
+            result = run_ffmpeg(
+                cmd, FFmpegProgress(audio_duration(audio_path), on_progress), on_poll=watch_playlist, cancel=cancel,
+                stdin_writer=animation.write_frames if animation else None
+            )
+        except subprocess.TimeoutExpired:
+            raise Exception("ffmpeg timed out while streaming")
+        
+        if result.returncode != 0:
+            raise Exception(f"ffmpeg failed: {result.stderr}")
+        if not first_segment_seen:
+            # short renders can finish between two polls
+            self._notify(on_first_segment)
+        
+        if cancel is not None:
+            cancel.raise_if_cancelled()
+        
+        # init segment + fragments form a fragmented mp4 that already holds the
+        # encoded streams; copying it into an mp4 with the moov atom up front is cheap
+        fragmented_path = render_cache.scratch_path(".mp4")
+        try:
+            with open(fragmented_path, "wb") as joined:
+                for part in ["init.mp4"] + self._playlist_segments(playlist_path):
+                    with open(stream_dir / part, "rb") as f:
+                        shutil.copyfileobj(f, joined)
+            result = subprocess.run(
+                [profile.ffmpeg_path, '-y', '-hide_banner', '-loglevel', 'error',
+                 '-i', str(fragmented_path), '-c', 'copy', '-movflags', '+faststart', str(output_path)],
+                capture_output=True,
+                text=True,
+                timeout=settings.FFMPEG_TIMEOUT_SECONDS
+            )
+        finally:
+            fragmented_path.unlink(missing_ok=True)
+        if result.returncode != 0:
+            raise Exception(f"remux of hls segments failed: {result.stderr}")
+        return render_cache.put(cache_key, str(output_path))
+    
+    def _video_source_args(self, strategy: str, resolution: str):
+        """ffmpeg input and filters for the picture under the audio"""
+        if strategy == "lavfi_background":
+            return ['-f', 'lavfi', '-i', f'color=black:size={resolution}'], []
+        width, height = resolution.split("x")
+        # h264 needs even dimensions, so the 1x1 frame is scaled up
+        return ['-loop', '1', '-i', BLACK_PIXEL_PNG], [f'scale={width}:{height}']
+    
+    def _video_args(
+        self,
+        profile,
+        audio_path: str,
+        output_path: Path,
+        strategy: str,
+        ladder: List[Rendition],
+        keyframe_seconds: Optional[int] = None,
+        animation: Optional[AvatarAnimation] = None,
+        loops: Optional[List[BackgroundLoop]] = None
+    ):
+        """picture inputs, main video stream arguments and the extra outputs of one render
+        
+        the largest rendition is the main output; the extra outputs are the smaller
+        renditions (with their own audio encode of the once-decoded audio) and the
+        preview images. with the background library each rendition's pre-encoded loop
+        (loops, when given: an avatar's idle loops) is repeated under the audio and
+        stream-copied, so a render only encodes audio (and, for a moving idle loop,
+        decodes the main loop for its previews). otherwise (and always for an
+        animated avatar, whose frames come from stdin) the picture is generated once
+        and split into every output
+        """
+        main, smaller = ladder[-1], ladder[:-1]
+        # -shortest does not stop a stream-copied endless loop, so the loop path needs
+        # the audio duration up front
+        duration = audio_duration(audio_path)
+        if duration and animation is None and background_library.enabled(profile):
+            static = loops is None
+            loops = loops or [self._background_loop(profile, strategy, rendition) for rendition in ladder]
+            if all(loops):
+                preview_args, preview_outputs = [], []
+                if static and loops[-1].has_previews():
+                    # the picture is static: the loop's poster and tile serve every render
+                    render_previews.link_static_previews(
+                        str(loops[-1].poster_path), str(loops[-1].tile_path), duration, main.resolution, str(output_path)
+                    )
+                elif not static and render_previews.supported(profile):
+                    # an idle loop moves: decode the main loop once more for the real sprite
+                    layout = render_previews.PreviewLayout(duration, main.resolution)
+                    render_previews.write_sprite_vtt(layout, output_path)
+                    split = f"[{len(ladder)}:v]split=2" + "".join(f"[{branch}]" for branch in render_previews.BRANCHES)
+                    preview_args = ['-filter_complex', ';'.join([split, *render_previews.filter_chains(layout)])]
+                    preview_outputs = render_previews.output_args(layout, output_path)
+                inputs = []
+                for loop in loops:
+                    inputs += ['-stream_loop', '-1', '-i', str(loop.path)]
+                # the loops' keyframes already sit on hls segment boundaries
+                copy_args = ['-c:v', 'copy', '-t', f'{duration:.3f}']
+                extra_outputs = []
+                for index, rendition in enumerate(smaller):
+                    extra_outputs += self._rendition_output(
+                        profile, ['-map', f'{index + 1}:v', *copy_args], output_path, rendition
+                    )
+                return inputs, [*preview_args, '-map', f'{len(ladder)}:v', *copy_args], extra_outputs + preview_outputs
+        
+        source_inputs, picture_args, rendition_maps, preview_outputs = self._picture_args(
+            profile, audio_path, output_path, strategy, ladder, animation
+        )
+        encode_args = ['-c:v', profile.video_encoder, '-pix_fmt', 'yuv420p', '-preset', 'ultrafast']
+        # cut points for the hls segments
+        keyframe_args = ['-force_key_frames', f'expr:gte(t,n_forced*{keyframe_seconds})'] if keyframe_seconds else []
+        extra_outputs = []
+        for rendition in smaller:
+            extra_outputs += self._rendition_output(
+                profile, ['-map', rendition_maps[rendition.name], *encode_args], output_path, rendition
+            )
+        return source_inputs, [*picture_args, *encode_args, *keyframe_args], extra_outputs + preview_outputs
+    
+    def _background_loop(self, profile, strategy: str, rendition: Rendition):
+        if strategy == "lavfi_background":
+            return background_library.get(profile, rendition.resolution, color="black")
+        return background_library.get(profile, rendition.resolution, image=BLACK_PIXEL_PNG)
+    
+    def _idle_loops(self, avatar_video: str, ladder: List[Rendition]) -> Optional[List[BackgroundLoop]]:
+        """the avatar's idle clip looped at every rendition size, or None to render without it"""
+        profile = ffmpeg_capabilities.profile()
+        video = resolve_file(avatar_video)
+        if video is None or not background_library.enabled(profile):
+            return None
+        # normally built when the avatar was saved; a missing size is encoded here once
+        loops = [background_library.get(profile, rendition.resolution, video=str(video)) for rendition in ladder]
+        if not all(loops):
+            print("avatar idle loop unavailable, rendering without it")
+            return None
+        return loops
+    
+    def _avatar_animation(
+        self,
+        avatar_id: int,
+        image: Path,
+        updated_at: Optional[datetime],
+        audio_path: str,
+        rendition: Rendition
+    ) -> Optional[AvatarAnimation]:
+        """the avatar animated at the largest rendition's size, or None to render without it"""
+        try:
+            asset = avatar_assets.get(avatar_id, image, updated_at, rendition.resolution)
+            return AvatarAnimation(asset, audio_path)
+        except Exception as e:
+            print(f"avatar animation unavailable, rendering the plain background: {str(e)}")
+            return None
+    
+    def _rendition_output(self, profile, video_args: List[str], output_path: Path, rendition: Rendition) -> List[str]:
+        return [
+            *video_args,
+            '-map', '0:a', '-c:a', profile.audio_encoder,
+            '-shortest',
+            '-movflags', '+faststart',
+            str(rendition_ladder.rendition_path(output_path, rendition.name))
+        ]
+    
+    def _picture_args(
+        self,
+        profile,
+        audio_path: str,
+        output_path: Path,
+        strategy: str,
+        ladder: List[Rendition],
+        animation: Optional[AvatarAnimation] = None
+    ):
+        """picture inputs, main stream mapping, smaller rendition labels and preview outputs
+        
+        the audio is input 0 and the picture input 1. the picture is generated once at
+        the largest size and split: one branch per rendition (scaled down) and, when the
+        build supports it, two for the poster frame and the scrub sprite, so nothing
+        is decoded a second time
+        """
+        main, smaller = ladder[-1], ladder[:-1]
+        if animation is not None:
+            source_inputs, source_filters = animation.ffmpeg_input_args(), []
+        else:
+            source_inputs, source_filters = self._video_source_args(strategy, main.resolution)
+        duration = audio_duration(audio_path)
+        with_previews = bool(duration) and render_previews.supported(profile)
+        if not with_previews and not smaller:
+            filter_args = ['-vf', ','.join(source_filters)] if source_filters else []
+            return source_inputs, ['-map', '1:v', *filter_args], {}, []
+        
+        branches = ["main"] + [f"r{rendition.name}_in" for rendition in smaller]
+        if with_previews:
+            branches += render_previews.BRANCHES
+        split = f"split={len(branches)}" + "".join(f"[{branch}]" for branch in branches)
+        chains = [f"[1:v]{','.join(source_filters + [split])}"]
+        chains += [
+            f"[r{rendition.name}_in]scale={rendition.width}:{rendition.height}[r{rendition.name}]"
+            for rendition in smaller
+        ]
+        preview_outputs = []
+        if with_previews:
+            layout = render_previews.PreviewLayout(duration, main.resolution)
+            render_previews.write_sprite_vtt(layout, output_path)
+            chains += render_previews.filter_chains(layout)
+            preview_outputs = render_previews.output_args(layout, output_path)
+        rendition_maps = {rendition.name: f"[r{rendition.name}]" for rendition in smaller}
+        return source_inputs, ['-filter_complex', ';'.join(chains), '-map', '[main]'], rendition_maps, preview_outputs
+    
+    def _discard_outputs(self, output_path: Path, ladder: List[Rendition]):
+        """drop the partial side outputs of a failed run before the next attempt"""
+        render_previews.discard(output_path)
+        rendition_ladder.discard(output_path, [rendition.name for rendition in ladder])
+    
+    @staticmethod
+    def _playlist_segments(playlist_path: Path):
+        lines = playlist_path.read_text(encoding="utf-8").splitlines()
+        return [line.strip() for line in lines if line.strip() and not line.startswith("#")]
+    
+    @staticmethod
+    def _playlist_has_segment(playlist_path: Path) -> bool:
+        try:
+            return "#EXTINF" in playlist_path.read_text(encoding="utf-8")
+        except OSError:
+            return False
+    
+    @staticmethod
+    def _notify(callback: Optional[Callable[[], None]]):
+        if callback is None:
+            return
+        try:
+            callback()
+        except Exception as e:
+            print(f"render callback failed: {str(e)}")
+    
+    def _copy_sidecars(self, audio_path: str, output_path: Path):
+        """carry the audio timing manifest over to the video, so it is cached with it"""
+        manifest_path = timing_manifest_path(audio_path)
+        if manifest_path.exists():
+            shutil.copyfile(manifest_path, timing_manifest_path(output_path))
+    
     def _create_simple_video_without_ffmpeg(self, audio_path: str, output_path: str) -> str:
         """create a simple video without ffmpeg using python libraries"""
         try:
@@ -119,27 +682,53 @@ class VideoGenerator:
             print(f"fallback video creation failed: {str(e)}")
             return self._create_placeholder_video()
     
-    def _create_audio_only_video(self, audio_path: str, output_path: str) -> str:
-        """create a video file that's just the audio with a static image"""
+    def _create_audio_only_video(
+        self,
+        audio_path: str,
+        output_path: str,
+        cache_key: str,
+        ladder: List[Rendition],
+        on_progress: Optional[Callable[[float, Optional[float]], None]] = None,
+        cancel: Optional[CancelToken] = None,
+        animation: Optional[AvatarAnimation] = None,
+        idle_loops: Optional[List[BackgroundLoop]] = None
+    ) -> str:
+        """create a video file that's just the audio with a static image (or the avatar)"""
+        profile = ffmpeg_capabilities.profile()
+        if not profile.available:
+            return self._create_simple_video_without_ffmpeg(audio_path, output_path)
+        
         try:
-            # create a simple 1-second video with just the audio
+            source_inputs, video_args, extra_outputs = self._video_args(
+                profile, audio_path, output_path, "still_image", ladder, animation=animation, loops=idle_loops
+            )
             cmd = [
-                ffmpeg_cmd, '-y',
-                '-loop', '1', '-i', 'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNkYPhfDwAChwGA60e6kgAAAABJRU5ErkJggg==',  # 1x1 black pixel
+                profile.ffmpeg_path, '-y',
                 '-i', str(audio_path),
-                '-c:v', 'libx264', '-c:a', 'aac',
+                *source_inputs,
+                *video_args,
+                '-map', '0:a', '-c:a', profile.audio_encoder,
                 '-shortest',
-                '-preset', 'ultrafast',
-                str(output_path)
+                '-movflags', '+faststart',
+                str(output_path),
+                *extra_outputs
             ]
             
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=10)
+            result = run_ffmpeg(
+                cmd, FFmpegProgress(audio_duration(audio_path), on_progress), cancel=cancel,
+                stdin_writer=animation.write_frames if animation else None
+            )
             if result.returncode == 0:
-                return str(output_path)
+                return render_cache.put(cache_key, str(output_path))
             else:
+                print(f"still image render failed: {result.stderr}")
+                self._discard_outputs(output_path, ladder)
                 return self._create_placeholder_video()
                 
+        except RenderCancelled:
+            raise
         except Exception:
+            self._discard_outputs(output_path, ladder)
             return self._create_placeholder_video()
     
     def _create_placeholder_video(self) -> str:
@@ -161,11 +750,17 @@ class VideoGenerator:
             return str(self.temp_dir / "placeholder.mp4")
     
     def cleanup_temp_files(self):
-        """clean up temporary files"""
+        """clean up intermediate files
+        
+        temp_dir is also where videos are published, so only the tts audio and
+        half-published files are removed; the storage sweeper does this on a ttl
+        """
+        from app.services.storage_manager import INTERMEDIATE_PATTERNS
         try:
-            for file in self.temp_dir.glob("*"):
-                if file.is_file():
-                    file.unlink()
+            for pattern in INTERMEDIATE_PATTERNS:
+                for file in self.temp_dir.glob(pattern):
+                    if file.is_file():
+                        file.unlink()
         except Exception as e:
             print(f"cleanup failed: {str(e)}")
 
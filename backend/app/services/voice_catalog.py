@@ -0,0 +1,151 @@
+import asyncio
+import json
+import os
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from app.core.config import settings
+from app.services.render_cache import render_cache, stable_digest
+
+
+class VoiceIndex:
+    """one immutable version of the catalog, indexed by id, language and category"""
+
+    def __init__(self, voices: List[Dict], source: str, fetched_at: float):
+        self.voices = voices
+        self.source = source
+        self.fetched_at = fetched_at
+        self.by_id: Dict[str, Dict] = {voice["id"]: voice for voice in voices}
+        self.by_language: Dict[str, List[Dict]] = {}
+        self.by_category: Dict[str, List[Dict]] = {}
+        for voice in voices:
+            self.by_language.setdefault(voice.get("language") or "en", []).append(voice)
+            self.by_category.setdefault(voice.get("category") or "general", []).append(voice)
+
+
+class VoiceCatalog:
+    """the tts provider's voice list, cached in memory and snapshotted to disk
+
+    once a catalog is loaded, lookups never wait on the network: past the ttl the
+    stale catalog keeps being served while a single background refresh fetches a new
+    one (stale-while-revalidate), and a failed refresh is retried after
+    VOICE_CATALOG_RETRY_SECONDS. every refresh is written to a snapshot, so a restarted
+    process starts from it instead of the provider. a catalog belongs to the
+    configured provider and api key; changing either invalidates it
+    """
+
+    def __init__(self, snapshot_path: Optional[str] = None, ttl: Optional[int] = None):
+        self.snapshot_path = Path(
+            snapshot_path or settings.VOICE_CATALOG_SNAPSHOT or render_cache.root / "voice_catalog.json"
+        )
+        self.ttl = ttl or settings.VOICE_CATALOG_TTL_SECONDS
+        self._index: Optional[VoiceIndex] = None
+        self._refresh: Optional[asyncio.Task] = None
+        self._retry_at = 0.0
+        self.refreshes = 0
+        self.failures = 0
+        self._load_snapshot()
+
+    @staticmethod
+    def source() -> str:
+        """identifies where the catalog comes from, without the key itself"""
+        source = "default"
+        if settings.ELEVENLABS_API_KEY:
+            source = f"elevenlabs:{stable_digest(settings.ELEVENLABS_API_KEY)[:12]}"
+        if settings.OPENAI_API_KEY:
+            # openai's fixed voices are listed too, so videos can ask for them by id
+            source += "+openai"
+        return source
+
+    async def index(self) -> VoiceIndex:
+        """the current catalog, fetched first only when there is none for this source"""
+        source = self.source()
+        index = self._index
+        if index is None or index.source != source:
+            return await self._refreshed(source)
+        if time.time() - index.fetched_at > self.ttl and time.time() >= self._retry_at:
+            self._start_refresh(source)  # served stale meanwhile
+        return index
+
+    async def voices(self) -> List[Dict]:
+        return (await self.index()).voices
+
+    async def get(self, voice_id: str) -> Optional[Dict]:
+        return (await self.index()).by_id.get(voice_id)
+
+    async def by_language(self, language: str) -> List[Dict]:
+        return (await self.index()).by_language.get(language, [])
+
+    async def by_category(self, category: str) -> List[Dict]:
+        return (await self.index()).by_category.get(category, [])
+
+    def stats(self) -> Dict:
+        index = self._index
+        return {
+            "voices": len(index.voices) if index else 0,
+            "source": index.source if index else None,
+            "age_seconds": round(time.time() - index.fetched_at, 1) if index else None,
+            "refreshing": self._refresh is not None and not self._refresh.done(),
+            "refreshes": self.refreshes,
+            "failures": self.failures
+        }
+
+    async def _refreshed(self, source: str) -> VoiceIndex:
+        # concurrent cold lookups share one fetch
+        task = self._start_refresh(source)
+        await asyncio.shield(task)
+        return self._index
+
+    def _start_refresh(self, source: str) -> asyncio.Task:
+        if self._refresh is None or self._refresh.done():
+            self._refresh = asyncio.get_running_loop().create_task(self._fetch(source))
+        return self._refresh
+
+    async def _fetch(self, source: str):
+        from app.services.voice_service import VoiceService
+
+        try:
+            if source.startswith("default"):
+                voices = VoiceService().get_default_voices()
+            else:
+                voices = await VoiceService().fetch_voices()
+            if source.endswith("+openai"):
+                voices += VoiceService().get_openai_voices()
+        except Exception as e:
+            self.failures += 1
+            self._retry_at = time.time() + settings.VOICE_CATALOG_RETRY_SECONDS
+            print(f"voice catalog refresh failed: {str(e)}")
+            if self._index is None or self._index.source != source:
+                # nothing to serve stale: the built-in voices until a retry succeeds
+                voices = VoiceService().get_default_voices()
+                if source.endswith("+openai"):
+                    voices += VoiceService().get_openai_voices()
+                self._index = VoiceIndex(voices, source, 0.0)
+            return
+        self._index = VoiceIndex(voices, source, time.time())
+        self.refreshes += 1
+        self._save_snapshot(self._index)
+
+    def _load_snapshot(self):
+        try:
+            snapshot = json.loads(self.snapshot_path.read_text(encoding="utf-8"))
+            self._index = VoiceIndex(snapshot["voices"], snapshot["source"], snapshot["fetched_at"])
+        except (OSError, ValueError, KeyError, TypeError):
+            self._index = None
+
+    def _save_snapshot(self, index: VoiceIndex):
+        tmp_path = self.snapshot_path.with_name(f".tmp_{uuid.uuid4().hex}.json")
+        try:
+            tmp_path.write_text(json.dumps({
+                "source": index.source, "fetched_at": index.fetched_at, "voices": index.voices
+            }), encoding="utf-8")
+            os.replace(tmp_path, self.snapshot_path)
+        except OSError as e:
+            print(f"could not write voice catalog snapshot: {str(e)}")
+        finally:
+            tmp_path.unlink(missing_ok=True)
+
+# create global instance
+voice_catalog = VoiceCatalog()
@@ -1,8 +1,19 @@
 import os
-import requests
-import json
-from typing import Optional, Dict, List
+import time
+import asyncio
+import threading
+from typing import AbstractSet, Awaitable, Optional, Dict, List, Tuple
 from app.core.config import settings
+from app.services.provider_http import provider_clients
+from app.services.provider_health import provider_health
+from app.services.render_cancellation import CancelToken
+from app.services.render_metrics import render_metrics
+from app.services.voice_catalog import voice_catalog
+from app.services.render_cache import stable_digest
+from app.services.tts_backends import OPENAI_VOICES, tts_backends
+from app.services.tts_segments import (
+    split_script, chunk_limit, concat_audio, write_timing_manifest, segment_store
+)
 
 class VoiceService:
     """Service for text-to-speech functionality"""
@@ -23,21 +34,221 @@ class VoiceService:
         voice_id: str = "default",
         language: str = "en",
         speed: float = 1.0,
-        output_filename: Optional[str] = None
+        output_filename: Optional[str] = None,
+        shared_sentences: Optional[AbstractSet[str]] = None
     ) -> str:
-        """Generate speech from text"""
+        """Generate speech from text
+        
+        Long text is split at sentence boundaries within the providers' limits, the
+        chunks are synthesized concurrently (capped per provider) and joined in order;
+        shared_sentences are chunked apart (see split_script).
+        A timing manifest is written next to the returned file. Chunks come from the
+        segment store shared with gTTS renders, so text synthesized before with the
+        same voice, language, speed and model costs no provider request.
+        
+        Each chunk goes to the first backend in TTS_PROVIDER_ORDER whose circuit
+        breaker is closed and fails over to the next one on an error or after
+        TTS_PROVIDER_TIMEOUT_SECONDS (see _synthesize_with_failover). Without any
+        configured provider the offline synthetic engine speaks instead.
+        
+        Provider audio is streamed to disk as it arrives, so memory use doesn't grow
+        with the length of the script.
+        """
         try:
-            if self.elevenlabs_api_key:
-                return await self.generate_with_elevenlabs(text, voice_id, speed, output_filename)
-            elif self.openai_api_key:
-                return await self.generate_with_openai(text, voice_id, language, output_filename)
-            else:
-                # Fallback to basic TTS or placeholder
-                return await self.generate_placeholder_audio(text, output_filename)
+            providers = self.provider_order(language)
+            chunks = split_script(
+                text, min(chunk_limit(provider) for provider in providers), shared_sentences
+            ) or [text]
+            if not output_filename:
+                output_filename = (f"{providers[0]}_{stable_digest(text, voice_id, language, speed)[:32]}"
+                                   f"{tts_backends.get(providers[0]).suffix}")
+            output_path = os.path.join(self.output_dir, output_filename)
+            
+            results = await asyncio.gather(
+                *[
+                    self._generate_chunk(providers, chunk, voice_id, language, speed, settings.TTS_HEDGE_REQUESTS)
+                    for chunk in chunks
+                ],
+                return_exceptions=True
+            )
+            errors = [result for result in results if isinstance(result, Exception)]
+            if errors:
+                raise errors[0]
+            
+            chunk_files = [path for path, _ in results]
+            used = sorted({provider for _, provider in results})
+            try:
+                concat_audio(chunk_files, output_path)
+            except FileNotFoundError:
+                # another process evicted a segment this one still had indexed;
+                # the resynced store makes the next attempt synthesize it again
+                segment_store.expire()
+                raise
+            write_timing_manifest(output_path, ",".join(used), chunks, chunk_files)
+            return output_path
                 
         except Exception as e:
             raise Exception(f"Speech generation failed: {str(e)}")
     
+    def provider_order(self, language: str = "en") -> List[str]:
+        """The usable backends of TTS_PROVIDER_ORDER, in failover order
+        
+        Backends that don't speak the language are left out, unless none of them
+        does, and so are those whose audio format differs from the first one's (the
+        chunks are joined without re-encoding).
+        """
+        # Fallback to offline speech
+        return self.configured_providers(language) or ["synthetic"]
+    
+    def configured_providers(self, language: str = "en") -> List[str]:
+        """provider_order without the offline fallback: empty when no provider is usable"""
+        backends = [
+            tts_backends.get(name) for name in settings.TTS_PROVIDER_ORDER
+            if name in tts_backends.names() and tts_backends.get(name).available()
+        ]
+        backends = [backend for backend in backends if backend.supports(language)] or backends
+        if not backends:
+            return []
+        return [backend.name for backend in backends if backend.suffix == backends[0].suffix]
+    
+    def select_provider(self, language: str = "en") -> str:
+        """The backend tried first"""
+        return self.provider_order(language)[0]
+    
+    async def _generate_chunk(
+        self,
+        providers: List[str],
+        text: str,
+        voice_id: str,
+        language: str,
+        speed: float,
+        hedge: bool = False
+    ) -> Tuple[str, str]:
+        """Synthesize one chunk, from the segment store or the providers; returns its path and provider"""
+        keys = {
+            provider: tts_backends.get(provider).cache_key(text, voice_id, language, speed)
+            for provider in providers
+        }
+        for provider in providers:
+            # stored by any provider in the order, the chunk costs no request
+            path = segment_store.lookup(keys[provider])
+            if path is not None:
+                return str(path), provider
+        
+        return await self._synthesize_with_failover(providers, keys, text, voice_id, language, speed, hedge)
+    
+    async def _synthesize_with_failover(
+        self,
+        providers: List[str],
+        keys: Dict[str, str],
+        text: str,
+        voice_id: str,
+        language: str,
+        speed: float,
+        hedge: bool
+    ) -> Tuple[str, str]:
+        """Try the providers in order, skipping those whose circuit breaker is open
+        
+        With hedge, a request still running after the provider's p95 latency is
+        raced against the next provider in the order; the first answer wins and the
+        other request is cancelled.
+        """
+        candidates = list(providers)
+        errors = []
+        
+        def next_allowed() -> Optional[str]:
+            while candidates:
+                provider = candidates.pop(0)
+                if provider_health.get(provider).allow():
+                    return provider
+                errors.append(f"{provider} circuit breaker open")
+            return None
+        
+        provider = next_allowed()
+        while provider is not None:
+            attempts = {
+                asyncio.create_task(
+                    self._attempt(provider, keys[provider], text, voice_id, language, speed)
+                ): provider
+            }
+            try:
+                delay = provider_health.get(provider).hedge_delay() if hedge else None
+                if delay is not None:
+                    done, _ = await asyncio.wait(attempts, timeout=delay)
+                    backup = None if done else next_allowed()
+                    if backup is not None:
+                        render_metrics.increment("tts_hedged")
+                        attempts[asyncio.create_task(
+                            self._attempt(backup, keys[backup], text, voice_id, language, speed)
+                        )] = backup
+                return await self._first_success(attempts)
+            except Exception as e:
+                errors.append(str(e))
+            finally:
+                for task in attempts:
+                    task.cancel()
+            provider = next_allowed()
+            if provider is not None:
+                render_metrics.increment("tts_failovers")
+                print(f"tts failing over to {provider}: {errors[-1]}")
+        raise Exception("; ".join(errors) or "no tts provider available")
+    
+    @staticmethod
+    async def _first_success(attempts: Dict[asyncio.Task, str]) -> Tuple[str, str]:
+        """The path and provider of the first attempt to succeed; the last error if none does"""
+        pending = set(attempts)
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result(), attempts[task]
+                error = task.exception()
+        raise error
+    
+    async def _attempt(
+        self,
+        provider: str,
+        key: str,
+        text: str,
+        voice_id: str,
+        language: str,
+        speed: float
+    ) -> str:
+        """One backend request for a chunk, bounded in time and recorded in the backend's health"""
+        backend = tts_backends.get(provider)
+        health = provider_health.get(provider)
+        requested = False
+        
+        async def synthesize(tmp_path):
+            nonlocal requested
+            requested = True
+            async with backend.slots():
+                started = time.monotonic()
+                try:
+                    await asyncio.wait_for(
+                        backend.synthesize(text, voice_id, language, speed, str(tmp_path)),
+                        settings.TTS_PROVIDER_TIMEOUT_SECONDS
+                    )
+                except asyncio.TimeoutError:
+                    health.record_failure(timed_out=True)
+                    raise Exception(f"{provider} took longer than {settings.TTS_PROVIDER_TIMEOUT_SECONDS}s")
+                except asyncio.CancelledError:
+                    health.abandoned()
+                    raise
+                except Exception:
+                    health.record_failure()
+                    raise
+                health.record_success(time.monotonic() - started)
+        
+        try:
+            return str(await segment_store.fetch_or_create_async(key, backend.suffix, synthesize))
+        finally:
+            if not requested:
+                # shared another caller's request, or cancelled before sending one
+                # (e.g. a hedge that lost): there's no outcome to record
+                health.abandoned()
+    
     async def generate_with_elevenlabs(
         self, 
         text: str, 
@@ -45,39 +256,13 @@ class VoiceService:
         speed: float,
         output_filename: Optional[str] = None
     ) -> str:
-        """Generate speech using ElevenLabs API"""
-        url = f"https://api.elevenlabs.io/v1/text-to-speech/{voice_id}"
-        
-        headers = {
-            "Accept": "audio/mpeg",
-            "Content-Type": "application/json",
-            "xi-api-key": self.elevenlabs_api_key
-        }
-        
-        data = {
-            "text": text,
-            "model_id": "eleven_monolingual_v1",
-            "voice_settings": {
-                "stability": 0.5,
-                "similarity_boost": 0.5,
-                "speed": speed
-            }
-        }
-        
-        response = requests.post(url, json=data, headers=headers)
+        """Generate speech using ElevenLabs API, streamed to disk"""
+        if not output_filename:
+            output_filename = f"elevenlabs_{stable_digest(text, voice_id, speed)[:32]}.mp3"
+        output_path = os.path.join(self.output_dir, output_filename)
         
-        if response.status_code == 200:
-            if not output_filename:
-                output_filename = f"elevenlabs_{hash(text)}.mp3"
-            
-            output_path = os.path.join(self.output_dir, output_filename)
-            
-            with open(output_path, "wb") as f:
-                f.write(response.content)
-            
-            return output_path
-        else:
-            raise Exception(f"ElevenLabs API error: {response.status_code} - {response.text}")
+        await tts_backends.get("elevenlabs").synthesize(text, voice_id, "en", speed, output_path)
+        return output_path
     
     async def generate_with_openai(
         self, 
@@ -86,89 +271,52 @@ class VoiceService:
         language: str,
         output_filename: Optional[str] = None
     ) -> str:
-        """Generate speech using OpenAI TTS API"""
-        url = "https://api.openai.com/v1/audio/speech"
-        
-        headers = {
-            "Authorization": f"Bearer {self.openai_api_key}",
-            "Content-Type": "application/json"
-        }
-        
-        data = {
-            "model": "tts-1",
-            "input": text,
-            "voice": voice,  # alloy, echo, fable, onyx, nova, shimmer
-            "response_format": "mp3"
-        }
-        
-        response = requests.post(url, json=data, headers=headers)
+        """Generate speech using OpenAI TTS API, streamed to disk"""
+        if not output_filename:
+            output_filename = f"openai_{stable_digest(text, voice, language)[:32]}.mp3"
+        output_path = os.path.join(self.output_dir, output_filename)
         
-        if response.status_code == 200:
-            if not output_filename:
-                output_filename = f"openai_{hash(text)}.mp3"
-            
-            output_path = os.path.join(self.output_dir, output_filename)
-            
-            with open(output_path, "wb") as f:
-                f.write(response.content)
-            
-            return output_path
-        else:
-            raise Exception(f"OpenAI API error: {response.status_code} - {response.text}")
+        # alloy, echo, fable, onyx, nova, shimmer
+        await tts_backends.get("openai").synthesize(text, voice, language, 1.0, output_path)
+        return output_path
     
     async def generate_placeholder_audio(
         self, 
         text: str, 
         output_filename: Optional[str] = None
     ) -> str:
-        """Generate placeholder audio (for development/testing)"""
+        """Generate placeholder audio (for development/testing) with the offline synthetic engine"""
         if not output_filename:
-            output_filename = f"placeholder_{hash(text)}.wav"
+            output_filename = f"placeholder_{stable_digest(text)[:32]}.wav"
         
         output_path = os.path.join(self.output_dir, output_filename)
-        
-        # Create a simple sine wave as placeholder
-        import numpy as np
-        import soundfile as sf
-        
-        # Generate a simple tone
-        sample_rate = 22050
-        duration = len(text.split()) * 0.5  # Rough estimate
-        t = np.linspace(0, duration, int(sample_rate * duration))
-        audio = np.sin(2 * np.pi * 440 * t) * 0.3  # 440 Hz tone
-        
-        sf.write(output_path, audio, sample_rate)
-        
+        await tts_backends.get("synthetic").synthesize(text, "default", "en", 1.0, output_path)
         return output_path
     
     async def get_available_voices(self) -> List[Dict]:
-        """Get available voices from ElevenLabs"""
-        if not self.elevenlabs_api_key:
-            return self.get_default_voices()
+        """Get available voices, from the cached catalog (see voice_catalog)"""
+        return await voice_catalog.voices()
+    
+    async def fetch_voices(self) -> List[Dict]:
+        """Fetch the voice list from ElevenLabs; raises when the request fails"""
+        url = "/v1/voices"
+        headers = {"xi-api-key": self.elevenlabs_api_key}
         
-        try:
-            url = "https://api.elevenlabs.io/v1/voices"
-            headers = {"xi-api-key": self.elevenlabs_api_key}
-            
-            response = requests.get(url, headers=headers)
-            
-            if response.status_code == 200:
-                voices_data = response.json()
-                return [
-                    {
-                        "id": voice["voice_id"],
-                        "name": voice["name"],
-                        "category": voice.get("category", "general"),
-                        "description": voice.get("description", ""),
-                        "language": voice.get("labels", {}).get("language", "en")
-                    }
-                    for voice in voices_data["voices"]
-                ]
-            else:
-                return self.get_default_voices()
-                
-        except Exception:
-            return self.get_default_voices()
+        response = await provider_clients.get("elevenlabs").get(url, headers=headers)
+        if response.status_code != 200:
+            raise Exception(f"ElevenLabs API error: {response.status_code} - {response.text}")
+        
+        voices_data = response.json()
+        return [
+            {
+                "id": voice["voice_id"],
+                "name": voice["name"],
+                "category": voice.get("category", "general"),
+                "description": voice.get("description", ""),
+                "language": voice.get("labels", {}).get("language", "en")
+            }
+            for voice in voices_data["voices"]
+        ]
     
     def get_default_voices(self) -> List[Dict]:
         """Get default voice options"""
@@ -203,7 +351,62 @@ class VoiceService:
             }
         ]
     
+    def get_openai_voices(self) -> List[Dict]:
+        """Get the fixed OpenAI voices, listed when an OpenAI key is configured"""
+        return [
+            {
+                "id": voice,
+                "name": voice.capitalize(),
+                "category": "openai",
+                "description": "OpenAI text-to-speech voice",
+                "language": "en"
+            }
+            for voice in sorted(OPENAI_VOICES)
+        ]
+    
     async def get_voice_by_id(self, voice_id: str) -> Optional[Dict]:
         """Get specific voice details"""
-        voices = await self.get_available_voices()
-        return next((voice for voice in voices if voice["id"] == voice_id), None) 
\ No newline at end of file
+        return await voice_catalog.get(voice_id) 
+
+
+class SpeechLoop:
+    """an event loop on its own thread, for render threads to run provider speech on
+
+    every render shares the loop, and with it the pooled provider clients and the
+    backends' request slots
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+    
+    def run(self, coroutine: Awaitable, cancel: Optional[CancelToken] = None):
+        """run coroutine on the loop and wait for it; a cancelled render cancels it too"""
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name="speech-loop", daemon=True).start()
+            loop = self._loop
+        future = asyncio.run_coroutine_threadsafe(coroutine, loop)
+        while True:
+            try:
+                return future.result(timeout=0.1)
+            except TimeoutError:
+                if cancel is not None and cancel.cancelled:
+                    future.cancel()
+                    cancel.raise_if_cancelled()
+    
+    def shutdown(self):
+        """close the loop's provider connections and stop it"""
+        with self._lock:
+            loop, self._loop = self._loop, None
+        if loop is None:
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(provider_clients.aclose(), loop).result(timeout=5)
+        except Exception as e:
+            print(f"error closing speech loop clients: {str(e)}")
+        loop.call_soon_threadsafe(loop.stop)
+
+# create global instance
+speech_loop = SpeechLoop()
@@ -0,0 +1,102 @@
+"""avatar animation throughput in frames/sec per core, with and without the encode
+
+usage (from backend/): python -m benchmarks.bench_avatar_animation [avatar.png] [--seconds 30] [--resolutions 640x360,1280x720,1920x1080]
+without an image a synthetic portrait is drawn first
+"""
+import os
+import sys
+import time
+import argparse
+import resource
+import subprocess
+import tempfile
+from pathlib import Path
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+load_dotenv()
+
+from app.services.ffmpeg_capabilities import ffmpeg_capabilities
+from app.services.avatar_animator import AvatarAnimation
+from app.services.avatar_assets import AvatarAssetCache
+
+
+class NullSink:
+    """stands in for ffmpeg's stdin, so only frame synthesis is measured"""
+
+    def write(self, data):
+        return len(data)
+
+    def close(self):
+        pass
+
+
+def portrait(path):
+    from PIL import Image, ImageDraw
+
+    image = Image.new("RGB", (512, 640), (90, 110, 140))
+    draw = ImageDraw.Draw(image)
+    draw.ellipse((106, 80, 406, 520), fill=(224, 180, 150))
+    draw.ellipse((236, 420, 276, 470), fill=(150, 60, 60))
+    image.save(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("image", nargs="?")
+    parser.add_argument("--seconds", type=float, default=30.0)
+    parser.add_argument("--resolutions", default="640x360,1280x720,1920x1080")
+    args = parser.parse_args()
+
+    profile = ffmpeg_capabilities.profile()
+    if not profile.video_encoder:
+        sys.exit("this benchmark needs an ffmpeg build with a video encoder")
+
+    with tempfile.TemporaryDirectory() as directory:
+        image = args.image or os.path.join(directory, "avatar.png")
+        if not args.image:
+            portrait(image)
+        # a tone that swells and fades, so the mouth actually moves
+        audio = os.path.join(directory, "audio.mp3")
+        subprocess.run([profile.ffmpeg_path, '-y', '-v', 'error', '-f', 'lavfi',
+                        '-i', f'sine=frequency=220:duration={args.seconds}',
+                        '-af', 'volume=0.5+0.5*sin(2*PI*t*3):eval=frame', audio], check=True)
+
+        assets = AvatarAssetCache(root=os.path.join(directory, "avatars"))
+        print(f"{args.seconds:.0f}s of audio, encoder {profile.video_encoder}, {os.cpu_count()} cpus")
+        for resolution in args.resolutions.split(","):
+            start = time.perf_counter()
+            asset = assets.get(0, Path(image), None, resolution)
+            build = time.perf_counter() - start
+            start = time.perf_counter()
+            asset = AvatarAssetCache(root=assets.root).get(0, Path(image), None, resolution)
+            load = time.perf_counter() - start
+            start = time.perf_counter()
+            animation = AvatarAnimation(asset, audio)
+            setup = time.perf_counter() - start
+
+            animation.write_frames(NullSink())
+            synth_fps = animation.fps_per_core
+
+            before = resource.getrusage(resource.RUSAGE_CHILDREN)
+            start = time.perf_counter()
+            process = subprocess.Popen(
+                [profile.ffmpeg_path, '-y', '-v', 'error', *animation.ffmpeg_input_args(),
+                 '-c:v', profile.video_encoder, '-pix_fmt', 'yuv420p', '-preset', 'ultrafast', '-f', 'null', '-'],
+                stdin=subprocess.PIPE
+            )
+            animation.write_frames(process.stdin)
+            process.wait()
+            wall = time.perf_counter() - start
+            after = resource.getrusage(resource.RUSAGE_CHILDREN)
+            encode_cpu = (after.ru_utime - before.ru_utime) + (after.ru_stime - before.ru_stime)
+            frames = animation.frames_written
+            total_cpu = encode_cpu + frames / animation.fps_per_core
+
+            print(f"{resolution:>10}  {frames} frames   synthesis {synth_fps:8.1f} fps/core   "
+                  f"with encode {frames / total_cpu:6.1f} fps/core, {frames / wall:6.1f} fps wall   "
+                  f"(asset build {build:.3f}s, cached load {load:.4f}s, envelope+poses {setup:.2f}s)")
+
+
+if __name__ == "__main__":
+    main()
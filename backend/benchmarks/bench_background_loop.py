@@ -0,0 +1,69 @@
+"""per-video render cost: encoding the background vs stream-copying a pre-encoded loop
+
+usage (from backend/): python -m benchmarks.bench_background_loop [--seconds 60] [--resolutions 320x240,1280x720,1920x1080]
+"""
+import os
+import sys
+import time
+import argparse
+import resource
+import subprocess
+import tempfile
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+load_dotenv()
+
+from app.services.ffmpeg_capabilities import ffmpeg_capabilities
+from app.services.background_library import BackgroundLibrary
+
+
+def run(cmd):
+    """wall seconds and child cpu seconds of one ffmpeg run"""
+    before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    start = time.perf_counter()
+    subprocess.run(cmd, check=True, capture_output=True)
+    wall = time.perf_counter() - start
+    after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return wall, (after.ru_utime - before.ru_utime) + (after.ru_stime - before.ru_stime)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=60.0)
+    parser.add_argument("--resolutions", default="320x240,1280x720,1920x1080")
+    args = parser.parse_args()
+
+    profile = ffmpeg_capabilities.profile()
+    if profile.render_strategy != "lavfi_background":
+        sys.exit("this benchmark needs an ffmpeg build with lavfi and a video encoder")
+
+    with tempfile.TemporaryDirectory() as directory:
+        library = BackgroundLibrary(root=directory)
+        audio = os.path.join(directory, "audio.mp3")
+        subprocess.run([profile.ffmpeg_path, '-y', '-v', 'error', '-f', 'lavfi',
+                        '-i', f'sine=frequency=220:duration={args.seconds}', audio], check=True)
+        out = os.path.join(directory, "out.mp4")
+        base = [profile.ffmpeg_path, '-y', '-v', 'error', '-i', audio]
+        tail = ['-map', '0:a', '-c:a', profile.audio_encoder, '-shortest', '-movflags', '+faststart', out]
+
+        print(f"{args.seconds:.0f}s of audio, encoder {profile.video_encoder}+{profile.audio_encoder}")
+        for resolution in args.resolutions.split(","):
+            encode_wall, encode_cpu = run(base + [
+                '-f', 'lavfi', '-i', f'color=black:size={resolution}', '-map', '1:v',
+                '-c:v', profile.video_encoder, '-pix_fmt', 'yuv420p', '-preset', 'ultrafast'
+            ] + tail)
+
+            start = time.perf_counter()
+            loop = library.get(profile, resolution, color="black")
+            build = time.perf_counter() - start
+            copy_wall, copy_cpu = run(base + [
+                '-stream_loop', '-1', '-i', str(loop.path), '-map', '1:v', '-c:v', 'copy', '-t', str(args.seconds)
+            ] + tail)
+
+            print(f"{resolution:>10}  encode {encode_wall:6.2f}s wall {encode_cpu:6.2f}s cpu   "
+                  f"loop copy {copy_wall:6.2f}s wall {copy_cpu:6.2f}s cpu   (one-time build {build:.2f}s)")
+
+
+if __name__ == "__main__":
+    main()
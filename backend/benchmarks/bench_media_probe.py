@@ -0,0 +1,84 @@
+"""compare ways of reading video metadata
+
+usage (from backend/): python -m benchmarks.bench_media_probe [video.mp4] [--runs 20]
+without a path a short test video is rendered with ffmpeg first
+"""
+import os
+import sys
+import time
+import argparse
+import subprocess
+import tempfile
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+load_dotenv()
+
+from app.services.ffmpeg_capabilities import ffmpeg_capabilities
+from app.services.media_probe import probe_mp4, probe_ffprobe
+
+
+def moviepy_probe(path):
+    # what the render handler used to do per video, including the import
+    from moviepy.editor import VideoFileClip
+    clip = VideoFileClip(path)
+    try:
+        return {"duration": clip.duration, "resolution": "%dx%d" % tuple(clip.size)}
+    finally:
+        clip.close()
+
+
+def make_sample(directory):
+    profile = ffmpeg_capabilities.profile()
+    if profile.render_strategy != "lavfi_background":
+        sys.exit("pass a video path: this ffmpeg build cannot generate a test video")
+    path = os.path.join(directory, "sample.mp4")
+    subprocess.run(
+        [profile.ffmpeg_path, "-y", "-v", "error",
+         "-f", "lavfi", "-i", "color=c=black:s=640x360:r=25",
+         "-f", "lavfi", "-i", "sine=frequency=440:sample_rate=44100",
+         "-t", "30", "-c:v", profile.video_encoder, "-c:a", profile.audio_encoder,
+         "-movflags", "+faststart", path],
+        check=True
+    )
+    return path
+
+
+def bench(name, fn, path, runs):
+    try:
+        start = time.perf_counter()
+        result = fn(path)
+        first = time.perf_counter() - start
+        samples = []
+        for _ in range(runs - 1):
+            start = time.perf_counter()
+            fn(path)
+            samples.append(time.perf_counter() - start)
+    except ImportError as e:
+        print(f"{name:<10} skipped ({e})")
+        return
+    if result is None:
+        print(f"{name:<10} skipped (not available on this node)")
+        return
+    samples.sort()
+    median = samples[len(samples) // 2] if samples else first
+    print(f"{name:<10} first {first * 1000:9.2f} ms   median {median * 1000:9.2f} ms   "
+          f"duration={result.get('duration')} resolution={result.get('resolution')}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path", nargs="?")
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = args.path or make_sample(directory)
+        print(f"{path}: {os.path.getsize(path)} bytes, {args.runs} runs each")
+        bench("mp4 boxes", probe_mp4, path, args.runs)
+        bench("ffprobe", probe_ffprobe, path, args.runs)
+        bench("moviepy", moviepy_probe, path, args.runs)
+
+
+if __name__ == "__main__":
+    main()
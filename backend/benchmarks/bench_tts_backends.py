@@ -0,0 +1,112 @@
+"""offline tts: the synthetic engine on its own, through VoiceService, and under full renders
+
+usage (from backend/): python -m benchmarks.bench_tts_backends [--scripts 16] [--words 120] [--concurrency 4] [--no-render]
+needs no network: speech comes from the synthetic backend, caches and output go to a temp dir.
+the render stage runs only where ffmpeg is installed
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# renders, caches and synthesized chunks go to a throwaway directory
+_scratch = tempfile.TemporaryDirectory()
+os.environ["VIDEO_OUTPUT_DIR"] = os.path.join(_scratch.name, "videos")
+os.environ["RENDER_CACHE_DIR"] = os.path.join(_scratch.name, "cache")
+os.environ["TTS_RENDER_BACKEND"] = "synthetic"
+os.environ["TTS_PROVIDER_ORDER"] = '["synthetic"]'
+load_dotenv()
+
+from app.services.ffmpeg_capabilities import ffmpeg_capabilities
+from app.services.tts_backends import tts_backends
+from app.services.tts_segments import audio_duration, segment_store
+from app.services.voice_service import VoiceService
+
+WORDS = ("the quick brown fox jumps over a lazy dog while seven bright engineers render "
+         "thousands of personalised videos for every campaign in the pipeline today").split()
+
+
+def script(seed, words):
+    rng = random.Random(seed)
+    sentences, count = [], 0
+    while count < words:
+        length = rng.randint(6, 16)
+        sentences.append(" ".join(rng.choice(WORDS) for _ in range(length)).capitalize() + rng.choice(".,.!?"))
+        count += length
+    return f"Script {seed}. " + " ".join(sentences)
+
+
+def engine(scripts):
+    backend = tts_backends.get("synthetic")
+    path = os.path.join(_scratch.name, "engine.wav")
+    started = time.perf_counter()
+    audio = words = 0
+    for text in scripts:
+        backend.synthesize_file(text, "default", "en", 1.0, path)
+        audio += audio_duration(path)
+        words += len(text.split())
+    wall = time.perf_counter() - started
+    print(f"{'synthetic engine':>24}  {wall:6.2f}s  {audio / wall:8.0f}x realtime   "
+          f"{words / (audio / 60):5.0f} words/min of audio (speech is about 150)")
+
+
+async def voice_service(scripts, concurrency):
+    voice = VoiceService()
+    voice.output_dir = os.path.join(_scratch.name, "audio")
+    os.makedirs(voice.output_dir, exist_ok=True)
+    slots = asyncio.Semaphore(concurrency)
+
+    async def one(text):
+        async with slots:
+            return await voice.generate_speech(text, "default", "en")
+
+    for label in ("voice service (cold)", "voice service (cached)"):
+        started = time.perf_counter()
+        paths = await asyncio.gather(*[one(text) for text in scripts])
+        wall = time.perf_counter() - started
+        audio = sum(audio_duration(path) or 0 for path in paths)
+        print(f"{label:>24}  {wall:6.2f}s  {len(scripts) / wall:6.1f} scripts/s   {audio / wall:8.0f}x realtime")
+
+
+def renders(scripts, concurrency):
+    from app.services.video_generator import video_generator
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        paths = list(pool.map(lambda text: video_generator.create_simple_video(text, "en"), scripts))
+    wall = time.perf_counter() - started
+    ok = sum(1 for path in paths if path and os.path.getsize(path) > 1024)
+    print(f"{'full render':>24}  {wall:6.2f}s  {len(scripts) / wall:6.1f} videos/s   {ok}/{len(scripts)} rendered")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scripts", type=int, default=16)
+    parser.add_argument("--words", type=int, default=120)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--no-render", action="store_true")
+    args = parser.parse_args()
+    scripts = [script(seed, args.words) for seed in range(args.scripts)]
+    print(f"{args.scripts} scripts of about {args.words} words, {args.concurrency} at a time")
+    try:
+        engine(scripts)
+        asyncio.run(voice_service(scripts, args.concurrency))
+        if args.no_render:
+            pass
+        elif not ffmpeg_capabilities.profile().available:
+            print("ffmpeg not found, skipping the render stage")
+        else:
+            renders(scripts, args.concurrency)
+        print(f"segment store: {segment_store.stats()}")
+    finally:
+        _scratch.cleanup()
+
+
+if __name__ == "__main__":
+    main()
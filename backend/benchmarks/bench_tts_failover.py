@@ -0,0 +1,116 @@
+"""tts provider failover: circuit breakers and hedged requests against misbehaving stand-ins
+
+usage (from backend/): python -m benchmarks.bench_tts_failover [--requests 60] [--latency-ms 80]
+runs local stand-ins for elevenlabs (primary) and openai (backup) that inject errors,
+tail latency and timeouts, so nothing leaves the machine
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+import threading
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# synthesized chunks go to a throwaway store, not the real cache
+_segments = tempfile.TemporaryDirectory()
+os.environ["TTS_SEGMENT_DIR"] = _segments.name
+load_dotenv()
+
+from app.core.config import settings
+from app.services.provider_http import provider_clients
+from app.services.provider_health import provider_health
+from app.services.render_metrics import render_metrics
+from app.services.voice_service import VoiceService
+from benchmarks.bench_tts_http import StandInServer
+
+SCENARIOS = [
+    # name, primary server options, hedged
+    ("healthy primary", {}, False),
+    ("primary failing 70%", {"error_rate": 0.7}, False),
+    ("primary hanging", {"slow_rate": 1.0, "slow_latency": 3.0}, False),
+    ("primary slow tail, no hedge", {"slow_rate": 0.1, "slow_latency": 0.8}, False),
+    ("primary slow tail, hedged", {"slow_rate": 0.1, "slow_latency": 0.8}, True),
+]
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+async def scenario(name, options, hedged, args, directory, run):
+    latency = args.latency_ms / 1000
+    primary = StandInServer(latency, args.audio_kb * 1024, **options)
+    backup = StandInServer(latency * 1.5, args.audio_kb * 1024)
+    for server in (primary, backup):
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    settings.ELEVENLABS_API_URL = primary.url
+    settings.OPENAI_API_URL = backup.url
+    settings.TTS_HEDGE_REQUESTS = hedged
+    provider_health.reset()
+    counters = dict(render_metrics.snapshot().get("counters", {}))
+
+    voice = VoiceService()
+    voice.output_dir = directory
+    timings, failures = [], 0
+
+    async def one(index):
+        nonlocal failures
+        started = time.perf_counter()
+        try:
+            # unique text, so every call is a provider request rather than a cache hit
+            await voice.generate_speech(f"scenario {run} sentence {index}.", "voice0", "en", 1.0, f"out_{run}_{index}.mp3")
+        except Exception:
+            failures += 1
+        timings.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    # sequential waves, so the breaker and the latency window see earlier outcomes
+    for wave in range(0, args.requests, args.concurrency):
+        await asyncio.gather(*[one(index) for index in range(wave, min(wave + args.concurrency, args.requests))])
+    wall = time.perf_counter() - started
+    after = render_metrics.snapshot().get("counters", {})
+    delta = {key: after.get(key, 0) - counters.get(key, 0) for key in ("tts_failovers", "tts_hedged", "tts_breaker_trips")}
+    state = provider_health.stats().get("elevenlabs", {}).get("state")
+    print(f"{name:>28}  {wall:6.2f}s  p50 {percentile(timings, 0.5) * 1000:6.0f}ms  "
+          f"p95 {percentile(timings, 0.95) * 1000:6.0f}ms  failed {failures:3d}  "
+          f"primary {primary.requests:3d} ({primary.errors} errors)  backup {backup.requests:3d}  "
+          f"failovers {delta['tts_failovers']:3d}  hedged {delta['tts_hedged']:3d}  "
+          f"trips {delta['tts_breaker_trips']}  breaker {state}")
+    await provider_clients.aclose()
+    for server in (primary, backup):
+        server.shutdown()
+
+
+async def run(args):
+    with tempfile.TemporaryDirectory() as directory:
+        print(f"{args.requests} requests, {args.concurrency} at a time, {args.latency_ms}ms primary latency, "
+              f"{settings.TTS_PROVIDER_TIMEOUT_SECONDS}s request timeout")
+        for index, (name, options, hedged) in enumerate(SCENARIOS):
+            await scenario(name, options, hedged, args, directory, index)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=60)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--latency-ms", type=int, default=80)
+    parser.add_argument("--audio-kb", type=int, default=16)
+    parser.add_argument("--timeout", type=float, default=1.0)
+    args = parser.parse_args()
+    settings.ELEVENLABS_API_KEY = "stand-in"
+    settings.OPENAI_API_KEY = "stand-in"
+    settings.TTS_PROVIDER_ORDER = ["elevenlabs", "openai"]
+    settings.TTS_PROVIDER_TIMEOUT_SECONDS = args.timeout
+    settings.TTS_HEDGE_MIN_SAMPLES = 10
+    try:
+        asyncio.run(run(args))
+    finally:
+        _segments.cleanup()
+
+
+if __name__ == "__main__":
+    main()
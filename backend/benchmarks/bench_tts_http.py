@@ -0,0 +1,174 @@
+"""tts provider requests: blocking one-connection-per-call vs the pooled async client
+
+usage (from backend/): python -m benchmarks.bench_tts_http [--requests 32] [--latency-ms 150] [--audio-kb 64]
+runs a local stand-in for the elevenlabs and openai endpoints, so nothing leaves the machine
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import threading
+import tracemalloc
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+load_dotenv()
+
+from app.core.config import settings
+from app.services.provider_http import http2_available, provider_clients
+from app.services.voice_service import VoiceService
+
+
+class StandInServer(ThreadingHTTPServer):
+    """answers tts requests after a fixed latency and counts the connections it accepts
+
+    error_rate of the requests fail with a 503, slow_rate of them take slow_latency instead
+    """
+
+    daemon_threads = True
+
+    def __init__(self, latency: float, audio_bytes: int, error_rate: float = 0.0,
+                 slow_rate: float = 0.0, slow_latency: float = 0.0):
+        super().__init__(("127.0.0.1", 0), StandInHandler)
+        self.latency = latency
+        self.audio = b"\xff\xfb" * (audio_bytes // 2)
+        self.error_rate = error_rate
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.connections = 0
+        self.requests = 0
+        self.errors = 0
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        server = self.server
+        slow = random.random() < server.slow_rate
+        failed = random.random() < server.error_rate
+        with server.lock:
+            server.requests += 1
+            server.errors += failed
+        time.sleep(server.slow_latency if slow else server.latency)
+        if failed:
+            self._send(b'{"error": "stand-in failure"}', "application/json", 503)
+        else:
+            self._send(server.audio, "audio/mpeg")
+
+    def do_GET(self):
+        time.sleep(self.server.latency)
+        body = json.dumps({"voices": [
+            {"voice_id": f"voice{index}", "name": f"Voice {index}", "labels": {"language": "en"}}
+            for index in range(20)
+        ]}).encode("utf-8")
+        self._send(body, "application/json")
+
+    def _send(self, body, content_type, status=200):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+async def blocking_request(server, text, path):
+    # what generate_with_elevenlabs used to do: a new connection per call, on the event loop
+    request = urllib.request.Request(
+        f"{server.url}/v1/text-to-speech/voice0", data=json.dumps({"text": text}).encode("utf-8"),
+        headers={"Content-Type": "application/json"}
+    )
+    with urllib.request.urlopen(request) as response:
+        with open(path, "wb") as f:
+            f.write(response.read())  # the whole body in memory, as response.content was
+
+
+async def measure(label, server, requests, make_call):
+    """wall time of the concurrent calls, the longest the event loop was stuck meanwhile and
+    the peak python heap (downloads buffered in memory show up here, streamed ones don't)"""
+    server.connections = 0
+    stalls = []
+    done = asyncio.Event()
+
+    async def ticker():
+        while not done.is_set():
+            started = time.perf_counter()
+            await asyncio.sleep(0.005)
+            stalls.append(time.perf_counter() - started - 0.005)
+
+    watcher = asyncio.create_task(ticker())
+    tracemalloc.start()
+    started = time.perf_counter()
+    await asyncio.gather(*[make_call(index) for index in range(requests)])
+    wall = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    done.set()
+    await watcher
+    print(f"{label:>28}  {wall:7.3f}s   {requests / wall:7.1f} req/s   "
+          f"max loop stall {max(stalls or [0]) * 1000:7.1f}ms   {server.connections} connections   "
+          f"peak heap {peak / 1024 / 1024:6.1f}MB")
+    return wall
+
+
+async def run(args):
+    server = StandInServer(args.latency_ms / 1000, args.audio_kb * 1024)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    settings.ELEVENLABS_API_URL = server.url
+    settings.OPENAI_API_URL = server.url
+
+    with tempfile.TemporaryDirectory() as directory:
+        voice = VoiceService()
+        voice.output_dir = directory
+        print(f"{args.requests} concurrent requests, {args.latency_ms}ms provider latency, {args.audio_kb}KB audio, "
+              f"http2 {'available' if http2_available() else 'unavailable (install httpx[http2])'}")
+
+        before = await measure(
+            "blocking, new connection", server, args.requests,
+            lambda index: blocking_request(server, f"sentence {index}", os.path.join(directory, f"old_{index}.mp3"))
+        )
+        # first round opens the pool, the second reuses its connections
+        for label in ("pooled async (cold pool)", "pooled async (warm pool)"):
+            after = await measure(
+                label, server, args.requests,
+                lambda index: voice.generate_with_elevenlabs(f"sentence {index}", "voice0", 1.0, f"new_{index}.mp3")
+            )
+        await measure("voice list, pooled", server, args.requests, lambda index: voice.fetch_voices())
+        print(f"speedup {before / after:.1f}x (connections capped at "
+              f"{provider_clients.connection_limit('elevenlabs')} for elevenlabs)")
+        await provider_clients.aclose()
+    server.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=32)
+    parser.add_argument("--latency-ms", type=int, default=150)
+    parser.add_argument("--audio-kb", type=int, default=64)
+    args = parser.parse_args()
+    settings.ELEVENLABS_API_KEY = settings.ELEVENLABS_API_KEY or "stand-in"
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -8,8 +8,23 @@ from dotenv import load_dotenv
 
 from app.routers import auth, video, avatar, user
 from app.core.config import settings
-from app.core.database import engine
+from app.core.database import engine, SessionLocal, sync_schema
 from app.models import Base
+from app.services.render_pool import render_pool
+from app.services.render_cache import render_cache
+from app.services.storage_manager import storage_manager
+from app.services.background_library import background_library
+from app.services.avatar_assets import avatar_assets
+from app.services.provider_http import provider_clients
+from app.services.provider_health import provider_health
+from app.services.tts_backends import tts_backends
+from app.services.tts_segments import segment_store
+from app.services.voice_catalog import voice_catalog
+from app.services.voice_service import speech_loop
+from app.services.ffmpeg_capabilities import ffmpeg_capabilities
+from app.services.render_metrics import render_metrics
+from app.services.job_queue import job_queue
+from app.services.render_worker import RenderWorker
 from app.middleware.security_middleware import SecurityMiddlewareClass, RequestValidationMiddleware
 
 # load environment variables
@@ -17,6 +32,7 @@ load_dotenv()
 
 # create database tables
 Base.metadata.create_all(bind=engine)
+sync_schema()
 
 # initialize fastapi app
 app = FastAPI(
@@ -60,6 +76,32 @@ app.include_router(video.router, prefix="/api/video", tags=["video generation"])
 app.include_router(avatar.router, prefix="/api/avatar", tags=["avatar management"])
 app.include_router(user.router, prefix="/api/user", tags=["user management"])
 
+# render worker running inside the api process (see worker.py for standalone workers)
+render_worker = RenderWorker(handler=video.generate_video_background)
+
+@app.on_event("startup")
+async def start_render_pool():
+    """spin up the render workers, recover interrupted jobs and start polling the queue"""
+    ffmpeg_capabilities.profile()  # probe ffmpeg once, before the first render
+    render_pool.start()
+    db = SessionLocal()
+    try:
+        job_queue.sweep_on_startup(db)
+    finally:
+        db.close()
+    if settings.RENDER_QUEUE_EMBEDDED_WORKER:
+        render_worker.start()
+    storage_manager.start()
+
+@app.on_event("shutdown")
+async def stop_render_pool():
+    """stop polling and release the render workers"""
+    await render_worker.stop()
+    render_pool.shutdown()
+    storage_manager.shutdown()
+    speech_loop.shutdown()
+    await provider_clients.aclose()
+
 @app.get("/")
 async def root():
     """root endpoint"""
@@ -83,9 +125,28 @@ async def status_check():
         "service": "vidface api",
         "memory_usage": psutil.virtual_memory().percent,
         "cpu_usage": psutil.cpu_percent(),
-        "uptime": "running"
+        "uptime": "running",
+        "render_pool": render_pool.stats(),
+        "render_queue": _render_queue_stats(),
+        "render_cache": render_cache.stats(),
+        "background_library": background_library.stats(),
+        "avatar_assets": avatar_assets.stats(),
+        "tts_cache": segment_store.stats(),
+        "voice_catalog": voice_catalog.stats(),
+        "tts_providers": provider_health.stats(),
+        "tts_backends": {name: {**capabilities, "languages": len(capabilities["languages"] or []) or "any"}
+                         for name, capabilities in tts_backends.capabilities().items()},
+        "storage": storage_manager.stats(),
+        "render_metrics": render_metrics.snapshot()
     }
 
+def _render_queue_stats():
+    db = SessionLocal()
+    try:
+        return job_queue.stats(db)
+    finally:
+        db.close()
+
 @app.exception_handler(404)
 async def not_found_handler(request, exc):
     """custom 404 handler"""
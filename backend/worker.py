@@ -0,0 +1,51 @@
+import asyncio
+import signal
+from dotenv import load_dotenv
+
+# load environment variables
+load_dotenv()
+
+from app.core.database import engine, SessionLocal, sync_schema
+from app.models import Base
+from app.routers.video import generate_video_background
+from app.services.ffmpeg_capabilities import ffmpeg_capabilities
+from app.services.job_queue import job_queue
+from app.services.render_pool import render_pool
+from app.services.render_worker import RenderWorker
+from app.services.storage_manager import storage_manager
+from app.services.voice_service import speech_loop
+
+async def main():
+    """standalone render worker: leases jobs from the shared database queue"""
+    Base.metadata.create_all(bind=engine)
+    sync_schema()
+    ffmpeg_capabilities.profile()
+    render_pool.start()
+    
+    db = SessionLocal()
+    try:
+        job_queue.sweep_on_startup(db)
+    finally:
+        db.close()
+    
+    worker = RenderWorker(handler=generate_video_background)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            pass  # windows: rely on KeyboardInterrupt
+    
+    worker.start()
+    storage_manager.start()
+    try:
+        await stop.wait()
+    finally:
+        await worker.stop()
+        render_pool.shutdown()
+        storage_manager.shutdown()
+        speech_loop.shutdown()
+
+if __name__ == "__main__":
+    asyncio.run(main())
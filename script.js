@@ -503,6 +503,8 @@ function showPreviewSection(videoData) {
         sourceEl.src = '';
     }
     previewVideo.removeAttribute('src');
+    previewVideo.removeAttribute('poster');
+    previewVideo.querySelectorAll('track').forEach(track => track.remove());
     previewVideo.load();
 
     // If we have a video id, poll until it's ready then load
@@ -519,9 +521,10 @@ function showPreviewSection(videoData) {
     }
 }
 
-function setVideoSource(url) {
+function setVideoSource(url, type = 'video/mp4') {
     const sourceEl = previewVideo.querySelector('source');
     if (sourceEl) {
+        sourceEl.type = type;
         sourceEl.src = url;
         previewVideo.load();
     } else {
@@ -529,10 +532,41 @@ function setVideoSource(url) {
     }
 }
 
+// HLS playlists play natively in Safari/iOS, or through hls.js when the page loads it
+function canPlayStream() {
+    return previewVideo.canPlayType('application/vnd.apple.mpegurl') !== '' ||
+        (window.Hls && window.Hls.isSupported());
+}
+
+function setStreamSource(url) {
+    if (previewVideo.canPlayType('application/vnd.apple.mpegurl') !== '') {
+        setVideoSource(url, 'application/vnd.apple.mpegurl');
+        return;
+    }
+    const hls = new window.Hls();
+    hls.loadSource(url);
+    hls.attachMedia(previewVideo);
+}
+
+// poster frame and seek-preview thumbnails, published next to the video
+function setPreviewImages(videoData) {
+    if (videoData.thumbnail_url) {
+        previewVideo.poster = `http://127.0.0.1:8000${videoData.thumbnail_url}`;
+    }
+    if (videoData.sprite_url && !previewVideo.querySelector('track[label="thumbnails"]')) {
+        const track = document.createElement('track');
+        track.kind = 'metadata';
+        track.label = 'thumbnails';
+        track.src = `http://127.0.0.1:8000${videoData.sprite_url}`;
+        previewVideo.appendChild(track);
+    }
+}
+
 // Poll for video completion
 async function pollForVideoCompletion(videoId) {
     let attempts = 0;
     const maxAttempts = 120; // up to 2 minutes
+    let streaming = false; // playing the live playlist while the render finishes
     
     const poll = async () => {
         try {
@@ -557,6 +591,12 @@ async function pollForVideoCompletion(videoId) {
             
             if (response.status === 'completed') {
                 console.log('Video completed!');
+                setPreviewImages(response);
+                if (streaming) {
+                    // the live playlist ends on its own once the render is done
+                    showNotification('Video ready!', 'success');
+                    return;
+                }
                 const videoUrl = `http://127.0.0.1:8000/generated/${videoId}.mp4`;
                 console.log('Trying to load video from:', videoUrl);
                 
@@ -584,6 +624,12 @@ async function pollForVideoCompletion(videoId) {
                 return;
             } else {
                 console.log('Video still processing, status:', response.status, 'progress:', response.progress);
+                if (!streaming && response.stream_url && canPlayStream()) {
+                    // the first segments are ready, start playing before the render completes
+                    streaming = true;
+                    setStreamSource(`http://127.0.0.1:8000${response.stream_url}`);
+                    showNotification('Preview is playing while your video finishes rendering.', 'info');
+                }
             }
             
             attempts++;